@@ -1,136 +1,463 @@
 import asyncio
-import subprocess
-import sys
+import os
+import time
+
+import telemetry
+from consensus import (
+    STATUS_INSTRUCTION,
+    VERDICT_OPTIONS,
+    QuorumPolicy,
+    ask_verdict,
+    claims_solved,
+    verify_concurrently,
+    verify_sequentially,
+)
+from fast_solver import solve_prompt
+from llm_backend import LLMBackendError, ModelSession, get_backend, parse_duration
+from response_cache import ResponseCache, get_response_cache
+from retrieval import get_retriever
+from tokens import estimate_tokens
+from transcript import Transcript
+from workflow import Halt, Node, Workflow
+
+class AgentSession:
+    """Tracks what the model server already holds of one agent's conversation.
+
+    After each turn the backend's returned context covers everything the agent
+    was sent plus its own reply, so the next turn only submits the transcript
+    entries added since then. The session falls back to a full prompt when it
+    has no context, has been idle longer than the server's keep-alive (the model
+    and its KV cache have been unloaded) or has outgrown the context budget.
+    """
+
+    def __init__(self, keep_alive=None):
+        self.model = ModelSession()
+        self.keep_alive = keep_alive  # Seconds, None for forever
+        self.transcript = None
+        self.seen = 0  # Transcript entries already in the model context
+        self.own_entry = None  # The agent's last reply, already in the model context
+
+    def resumable(self, transcript):
+        if not self.model.context or transcript is not self.transcript:
+            return False
+        if self.keep_alive is not None and time.monotonic() - self.model.last_used > self.keep_alive:
+            return False
+        if self.model.tokens > transcript.context_budget:
+            return False
+        return self.seen <= len(transcript.entries)
+
+    def prompt(self, transcript, instruction):
+        """Return (prompt, resumed) for the next turn."""
+        if self.resumable(transcript):
+            entries = transcript.entries[self.seen:]
+            if entries and entries[0].text == self.own_entry:
+                entries = entries[1:]
+            return "\n".join([entry.text for entry in entries] + [instruction]), True
+        self.reset()
+        return f"{transcript.window()}\n{instruction}", False
+
+    def advance(self, transcript, own_entry):
+        self.transcript = transcript
+        self.seen = len(transcript.entries)
+        self.own_entry = own_entry
+
+    def reset(self):
+        self.model.reset()
+        self.transcript = None
+        self.seen = 0
+        self.own_entry = None
 
 class ProblemSolvingAgent:
-    def __init__(self, name):
+    def __init__(self, name, backend=None, cache=None, reuse_context=True):
         self.name = name
+        # The backend (Ollama HTTP pool or `ollama run` subprocess) is selected by
+        # BackendConfig, read from LLM_BACKEND / OLLAMA_* environment variables.
+        self.backend = backend if backend is not None else get_backend()
+        # Shared response cache (RESPONSE_CACHE_* environment variables); cache=False disables it
+        self.cache = get_response_cache() if cache is None else (cache or None)
+        # Carry the model's context across conversation turns instead of resending the transcript
+        self.session = AgentSession(parse_duration(self.backend.config.keep_alive)) if reuse_context else None
+
+    def _cache_key(self, message, options=None):
+        return ResponseCache.make_key(self.backend.config.model, message, options)
+
+    def _cacheable(self, session):
+        # A prompt sent on top of server-side context means nothing on its own
+        return self.cache is not None and (session is None or not session.context)
+
+    async def process_message(self, message, use_cache=True, session=None, options=None):
+        # use_cache=False forces a fresh sample (the result still refreshes the cache)
+        cacheable = self._cacheable(session)
+        if use_cache and cacheable:
+            cached = await self.cache.aget(self._cache_key(message, options))
+            if cached is not None:
+                return cached
+        start = time.perf_counter()
+        response = (await self.query_ollama(message, session, options)).strip()
+        elapsed = time.perf_counter() - start
+        telemetry.observe("generation", elapsed)
+        telemetry.record_generation(estimate_tokens(response), elapsed)
+        if cacheable:
+            self.cache.put(self._cache_key(message, options), response)
+        return response
+
+    async def query_ollama(self, prompt, session=None, options=None):
+        return await self.backend.agenerate(prompt, options, session=session)
+
+    async def verdict(self, prompt):
+        # A verdict is a few tokens (see consensus.verdict_prompt)
+        return await self.process_message(prompt, options=VERDICT_OPTIONS)
+
+    async def stream_message(self, message, use_cache=True, session=None):
+        # Yield the response token by token as the backend generates it
+        cacheable = self._cacheable(session)
+        if use_cache and cacheable:
+            cached = await self.cache.aget(self._cache_key(message))
+            if cached is not None:
+                yield cached
+                return
+        chunks = []
+        start = time.perf_counter()
+        async for delta in self.backend.astream(message, session=session):
+            if not chunks:
+                telemetry.observe("time_to_first_token", time.perf_counter() - start)
+            chunks.append(delta)
+            yield delta
+        elapsed = time.perf_counter() - start
+        response = "".join(chunks).strip()
+        telemetry.observe("generation", elapsed)
+        telemetry.record_generation(estimate_tokens(response), elapsed)
+        if cacheable:
+            self.cache.put(self._cache_key(message), response)
+
+    async def process_turn(self, transcript, instruction):
+        """Respond to the conversation in `transcript` followed by `instruction`."""
+        if self.session is None:
+            with telemetry.span("prompt_build"):
+                prompt = f"{transcript.window()}\n{instruction}"
+            return await self.process_message(prompt)
+        with telemetry.span("prompt_build"):
+            prompt, resumed = self.session.prompt(transcript, instruction)
+        try:
+            response = await self.process_message(prompt, session=self.session.model)
+        except LLMBackendError:
+            if not resumed:
+                raise
+            # The server no longer accepts the carried-over context; resend the full prompt
+            self.session.reset()
+            prompt, _ = self.session.prompt(transcript, instruction)
+            response = await self.process_message(prompt, session=self.session.model)
+        self.session.advance(transcript, f"{self.name}: {response}")
+        return response
+
+    def adopt_session(self, model_session, transcript, response):
+        """Continue from a speculative turn's model context after it has been accepted."""
+        if self.session is None:
+            return
+        self.session.reset()
+        self.session.model = model_session
+        self.session.advance(transcript, f"{self.name}: {response}")
+
+    async def stream_turn(self, transcript, instruction):
+        """Streaming variant of process_turn."""
+        if self.session is None:
+            with telemetry.span("prompt_build"):
+                prompt = f"{transcript.window()}\n{instruction}"
+            async for delta in self.stream_message(prompt):
+                yield delta
+            return
+        with telemetry.span("prompt_build"):
+            prompt, resumed = self.session.prompt(transcript, instruction)
+        chunks = []
+        try:
+            async for delta in self.stream_message(prompt, session=self.session.model):
+                chunks.append(delta)
+                yield delta
+        except LLMBackendError:
+            if not resumed or chunks:
+                raise
+            self.session.reset()
+            prompt, _ = self.session.prompt(transcript, instruction)
+            async for delta in self.stream_message(prompt, session=self.session.model):
+                chunks.append(delta)
+                yield delta
+        self.session.advance(transcript, f"{self.name}: {''.join(chunks).strip()}")
+
+SPECULATIONS = telemetry.REGISTRY.counter(
+    "agent_speculations_total", "Speculative downstream turns by outcome (accepted, discarded).", ["outcome"]
+)
+
+class SpeculativeTurn:
+    """A downstream agent's turn started on the upstream agent's partial draft.
+
+    It generates with a fresh model session, buffering its output, and is only
+    kept if the upstream agent's final message is exactly `entry`.
+    """
 
-    async def process_message(self, message):
-        response = await self.query_ollama(message)
-        return response.strip()
-
-    async def query_ollama(self, prompt):
-        if sys.platform == "win32":
-            # Windows-specific workaround
-            result = subprocess.run(
-                ["ollama", "run", "llama3"],
-                input=prompt.encode('utf-8'),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            return result.stdout.decode('utf-8')
-        else:
-            # Other platforms
-            process = await asyncio.create_subprocess_exec(
-                "ollama", "run", "llama3",
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, stderr = await process.communicate(input=prompt.encode('utf-8'))
-            return stdout.decode('utf-8')
+    def __init__(self, agent, entry, prompt):
+        self.agent = agent
+        self.entry = entry
+        self.session = ModelSession()
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._run(prompt))
+
+    async def _run(self, prompt):
+        try:
+            with telemetry.labels(role=self.agent.name):
+                async for delta in self.agent.stream_message(prompt, session=self.session):
+                    self.chunks.append(delta)
+                    self._changed.set()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._changed.set()
+
+    def cancel(self):
+        self._task.cancel()
+
+    async def follow(self):
+        """Yield the buffered deltas, then the rest as they are generated."""
+        index = 0
+        while True:
+            self._changed.clear()
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                break
+            await self._changed.wait()
+        if self.error is not None:
+            raise self.error
+
+class AgentTurn:
+    """A single agent response, optionally streamed as delta events."""
+
+    def __init__(self, agent, turn_id, stream=False, iteration=None, speculation=None):
+        self.agent = agent
+        self.turn_id = turn_id
+        self.stream = stream
+        self.iteration = iteration
+        self.speculation = speculation  # An accepted SpeculativeTurn to continue from
+        self.chunks = []
+
+    @property
+    def response(self):
+        return "".join(self.chunks).strip()
+
+    async def run(self, transcript, instruction):
+        # Spans recorded during the turn are tagged with the agent's role and the iteration
+        with telemetry.labels(role=self.agent.name, iteration=self.iteration or ""):
+            if self.speculation is not None:
+                async for delta in self.speculation.follow():
+                    self.chunks.append(delta)
+                    if self.stream:
+                        yield {"type": "delta", "agent": self.agent.name, "turn": self.turn_id, "delta": delta}
+                self.agent.adopt_session(self.speculation.session, transcript, self.response)
+                return
+            if not self.stream:
+                self.chunks.append(await self.agent.process_turn(transcript, instruction))
+                return
+            async for delta in self.agent.stream_turn(transcript, instruction):
+                self.chunks.append(delta)
+                yield {"type": "delta", "agent": self.agent.name, "turn": self.turn_id, "delta": delta}
 
 class Environment:
-    def __init__(self):
+    def __init__(self, stream=False, verification="concurrent", quorum=None, context_budget=1536, max_iterations=3,
+                 pipeline=False, speculate_tokens=32, retriever=None, retrieval_k=5, retrieval_budget=512,
+                 node_events=False):
         self.agents = []
-        self.conversation = []
+        self.max_iterations = max_iterations  # Prevent infinite loops
+        # Prompts are built from a token-budgeted window over the conversation
+        self.conversation = Transcript(context_budget=context_budget)
         self.solved = False
+        # Verifiers are asked concurrently by default; the quorum policy ("all",
+        # "majority" or "first-k") decides when consensus is reached.
+        self.verification = verification
+        self.quorum = quorum or QuorumPolicy("all")
+        # When streaming, run_conversation also yields {"type": "delta", ...} dicts
+        # for each generated chunk, tagged with the agent name and turn id.
+        self.stream = stream
+        self.turn_count = 0
+        # Pipelined mode starts the next agent's turn speculatively whenever the current
+        # agent's draft reaches a sentence boundary past `speculate_tokens` tokens; it is
+        # kept if the final draft matches and restarted otherwise. The restarted prompts
+        # share their prefix, which the model server keeps in its KV cache.
+        self.pipeline = pipeline
+        self.speculate_tokens = speculate_tokens
+        self.speculation = None
+        # With a retriever (see retrieval.py), the code chunks most relevant to the prompt
+        # are pinned after it instead of pasting the whole repository into the prompt.
+        self.retriever = retriever
+        self.retrieval_k = retrieval_k
+        self.retrieval_budget = retrieval_budget
+        # run_conversation also yields a {"type": "node", ...} dict as each workflow step completes
+        self.node_events = node_events
 
     def add_agent(self, agent):
         self.agents.append(agent)
 
     def initiate_conversation(self, prompt):
-        self.conversation.append(f"Initial Prompt: {prompt}")
+        self.conversation.append(f"Initial Prompt: {prompt}", pinned=True)
+        if self.retriever is not None:
+            with telemetry.span("retrieval"):
+                context = self.retriever.context(prompt, k=self.retrieval_k, budget=self.retrieval_budget)
+            if context:
+                self.conversation.append(f"Relevant code:\n{context}", pinned=True)
+
+    def new_turn(self, agent, iteration=None, speculation=None):
+        self.turn_count += 1
+        return AgentTurn(agent, self.turn_count, stream=self.stream, iteration=iteration, speculation=speculation)
+
+    def draft_settled(self, turn):
+        draft = "".join(turn.chunks)
+        if estimate_tokens(draft) < self.speculate_tokens:
+            return False
+        return draft.endswith("\n") or draft.rstrip().endswith((".", "!", "?"))
+
+    async def run_turn(self, turn, instruction, next_agent=None, next_instruction=None):
+        """Run `turn`; when pipelining, also start `next_agent` on each settled draft."""
+        self.cancel_speculation()
+        pipelined = self.pipeline and next_agent is not None
+        if pipelined:
+            turn.stream = True  # Drafts are needed even when deltas are not sent on
+            window = self.conversation.window()
+        async for event in turn.run(self.conversation, instruction):
+            if self.stream:
+                yield event
+            if pipelined and self.draft_settled(turn):
+                entry = f"{turn.agent.name}: {turn.response}"
+                if self.speculation is None or self.speculation.entry != entry:
+                    self.cancel_speculation()
+                    self.speculation = SpeculativeTurn(next_agent, entry, f"{window}\n{entry}\n{next_instruction}")
+
+    def take_speculation(self, entry):
+        """Return the pending speculation if it was started on exactly `entry`."""
+        speculation, self.speculation = self.speculation, None
+        if speculation is None:
+            return None
+        if speculation.entry != entry or speculation.error is not None:
+            speculation.cancel()
+            SPECULATIONS.inc(outcome="discarded")
+            return None
+        SPECULATIONS.inc(outcome="accepted")
+        return speculation
+
+    def cancel_speculation(self):
+        if self.speculation is not None:
+            self.speculation.cancel()
+            SPECULATIONS.inc(outcome="discarded")
+            self.speculation = None
+
+    def workflow(self):
+        """The Solver / Reviewer loop as a graph, unrolled over max_iterations.
+
+        Each iteration is solve -> review -> refine; a turn whose status line
+        claims a solution is verified by the agents and ends the run when they agree.
+        """
+        solve_instruction = f"As the Solver, please provide a solution to the problem. {STATUS_INSTRUCTION}"
+        review_instruction = ("As the Reviewer, please evaluate the Solver's solution and suggest improvements if necessary. "
+                              f"{STATUS_INSTRUCTION}")
+        refine_instruction = f"As the Solver, please refine your solution based on the Reviewer's feedback. {STATUS_INSTRUCTION}"
+        agent1, agent2 = self.agents[0], self.agents[1]
+
+        workflow = Workflow()
+        previous = ()
+        for iteration in range(1, self.max_iterations + 1):
+            steps = [
+                (f"{iteration}.solve", agent1, "response", solve_instruction, agent2, review_instruction, None),
+                (f"{iteration}.review", agent2, "response", review_instruction, agent1, refine_instruction,
+                 (agent1, f"{iteration}.solve")),
+                (f"{iteration}.refine", agent1, "refined response", refine_instruction, None, None,
+                 (agent2, f"{iteration}.review")),
+            ]
+            for name, agent, label, instruction, next_agent, next_instruction, speculated_from in steps:
+                step = self.turn_step(agent, label, iteration, instruction, next_agent, next_instruction, speculated_from)
+                workflow.add(Node(name, step, after=previous))
+                previous = (name,)
+                if name.endswith(".refine"):
+                    continue
+                # Skipped (output None) unless the response claims a solution
+                workflow.add(Node(f"{name}.verify", self.verify_step(name, iteration), after=previous,
+                                  when=lambda inputs, name=name: claims_solved(inputs[name])))
+                previous = (name, f"{name}.verify")
+        workflow.add(Node("unsolved", self.unsolved_step, after=previous))
+        return workflow
+
+    def turn_step(self, agent, label, iteration, instruction, next_agent=None, next_instruction=None, speculated_from=None):
+        async def step(ctx, inputs):
+            if speculated_from is None:
+                print(f"--- Iteration {iteration} ---")
+                speculation = None
+            else:
+                # The previous turn may have started this one speculatively
+                previous_agent, previous_turn = speculated_from
+                speculation = self.take_speculation(f"{previous_agent.name}: {inputs[previous_turn]}")
+            turn = self.new_turn(agent, iteration, speculation)
+            async for event in self.run_turn(turn, instruction, next_agent, next_instruction):
+                ctx.emit(event)
+            response = turn.response
+            print(f"{agent.name} {label}: {response}")
+            self.conversation.append(f"{agent.name}: {response}")
+            ctx.emit(f"{agent.name}: {response}")
+            return response
+        return step
+
+    def verify_step(self, turn, iteration):
+        async def step(ctx, inputs):
+            with telemetry.labels(iteration=iteration):
+                self.solved = await self.verify_solution_with_agents(inputs[turn])
+            if self.solved:
+                ctx.emit("Solution verified, stopping conversation.")
+                return Halt(True)
+            return False
+        return step
+
+    async def unsolved_step(self, ctx, inputs):
+        print("Conversation ended without a verified solution.")
+        ctx.emit("Conversation ended without a verified solution.")
 
     async def run_conversation(self):
-        iteration_count = 0
-        max_iterations = 3  # Prevent infinite loops
-
-        while not self.solved and iteration_count < max_iterations:
-            iteration_count += 1
-            print(f"--- Iteration {iteration_count} ---")
-
-            # Agent 1 (Solver) provides an initial solution
-            agent1 = self.agents[0]
-            conversation_history = "\n".join(self.conversation)
-            solver_prompt = f"{conversation_history}\nAs the Solver, please provide a solution to the problem."
-            response1 = await agent1.process_message(solver_prompt)
-            print(f"{agent1.name} response: {response1}")
-            self.conversation.append(f"{agent1.name}: {response1}")
-            yield f"{agent1.name}: {response1}"
-
-            if self.validate_solution(response1):
-                self.solved = await self.verify_solution_with_agents(response1)
-                if self.solved:
-                    yield "Solution verified, stopping conversation."
-                    return
-
-            # Agent 2 (Reviewer) reviews and improves upon Agent 1's response
-            agent2 = self.agents[1]
-            review_prompt = (
-                f"{conversation_history}\n{agent1.name}: {response1}\n"
-                "As the Reviewer, please evaluate the Solver's solution and suggest improvements if necessary."
-            )
-            response2 = await agent2.process_message(review_prompt)
-            print(f"{agent2.name} response: {response2}")
-            self.conversation.append(f"{agent2.name}: {response2}")
-            yield f"{agent2.name}: {response2}"
-
-            if self.validate_solution(response2):
-                self.solved = await self.verify_solution_with_agents(response2)
-                if self.solved:
-                    yield "Solution verified, stopping conversation."
-                    return
-
-            # Solver refines the solution based on the Reviewer's feedback
-            refine_prompt = (
-                f"{conversation_history}\n{agent2.name}: {response2}\n"
-                "As the Solver, please refine your solution based on the Reviewer's feedback."
-            )
-            response1 = await agent1.process_message(refine_prompt)
-            print(f"{agent1.name} refined response: {response1}")
-            self.conversation.append(f"{agent1.name}: {response1}")
-            yield f"{agent1.name}: {response1}"
-
-            # Update the conversation history
-            self.conversation.append(f"{agent1.name}: {response1}")
-            self.conversation.append(f"{agent2.name}: {response2}")
-
-        if not self.solved:
-            print("Conversation ended without a verified solution.")
-            yield "Conversation ended without a verified solution."
-
-    def validate_solution(self, response):
-        # Check if the response indicates the problem is solved
-        if "yes problem is solved" in response.lower() or "the problem is solved" in response.lower():
-            print("Validation check: Solved")
-            return True
-        print("Validation check: Not Solved")
-        return False
+        try:
+            async for event in self.workflow().run(node_events=self.node_events):
+                yield event
+        finally:
+            self.cancel_speculation()
 
     async def verify_solution_with_agents(self, solution):
-        # Ask all agents if they agree with the solution
-        for agent in self.agents:
-            verification_prompt = (
-                f"The proposed solution is:\n{solution}\n"
-                "Do you agree that this solution solves the problem? "
-                "Please respond with 'Yes, the problem is solved.' or 'No, the problem is not solved.'"
-            )
-            verification_response = await agent.process_message(verification_prompt)
-            print(f"{agent.name} verification response: {verification_response}")
-            if "no" in verification_response.lower():
+        # Ask all agents for a yes/no verdict on the solution
+        async def ask(agent):
+            with telemetry.labels(role=agent.name):
+                return await ask_verdict(agent, solution)
+
+        def approves(agent, verdict):
+            if not verdict:
                 print(f"{agent.name} does not agree with the solution.")
-                return False
-        return True
+            return verdict
+
+        with telemetry.span("verification", role="verifiers"):
+            if self.verification == "sequential":
+                return await verify_sequentially(self.agents, ask, approves, self.quorum)
+            return await verify_concurrently(self.agents, ask, approves, self.quorum)
 
 def initialize_agents():
     agent1 = ProblemSolvingAgent("Solver")
     agent2 = ProblemSolvingAgent("Reviewer")
     return [agent1, agent2]
 
-async def orchestrate_problem_solving(agents, prompt):
-    env = Environment()
+async def orchestrate_problem_solving(agents, prompt, stream=False, pipeline=None, fast_path=True, node_events=False):
+    # Arithmetic and simple algebra are answered without a model call
+    answer = solve_prompt(prompt) if fast_path else None
+    if answer is not None:
+        yield f"FastSolver: {answer}"
+        yield "Solution verified, stopping conversation."
+        return
+    if pipeline is None:
+        pipeline = os.environ.get("AGENT_PIPELINE", "0") == "1"
+    env = Environment(stream=stream, pipeline=pipeline, retriever=get_retriever(), node_events=node_events)
     for agent in agents:
         env.add_agent(agent)
 
@@ -0,0 +1,202 @@
+"""Benchmark the orchestration layer against a deterministic fake model.
+
+Runs orchestrate_problem_solving from agents.py, langAgents.py and
+hierarchical_agent_teams.py with fake_ollama.FakeBackend and writes, per
+scenario: model calls per solve, prompt bytes per turn, wall and CPU time per
+solve and memory growth, to a JSON file that can be compared between commits:
+
+    python bench_orchestration.py --output bench_results.json
+    python bench_orchestration.py --output new.json --compare bench_results.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+import warnings
+
+# The response cache would hide repeated calls from the measurements
+os.environ["RESPONSE_CACHE_SIZE"] = "0"
+warnings.filterwarnings("ignore", message=".*deprecated")  # LangChain LLMChain/arun notices
+
+import agents
+import hierarchical_agent_teams as hierarchical
+import langAgents
+from fake_ollama import FakeBackend, scripted_responder
+
+SOLVED = 'The answer is 2. Yes, the problem is solved.\n{"solved": true}'
+UNSOLVED = "Here is a partial draft; it still needs more work on the details."
+
+
+def solved_first_turn():
+    return scripted_responder([('"verdict"', '{"verdict": "yes"}')], default=SOLVED)
+
+
+def never_solved():
+    return scripted_responder([("Do you agree", "No, the problem is not solved.")], default=UNSOLVED)
+
+
+async def run_agents(backend, prompt, max_iterations=3, pipeline=False, speculate_tokens=32):
+    team = [agents.ProblemSolvingAgent("Solver", backend), agents.ProblemSolvingAgent("Reviewer", backend)]
+    env = agents.Environment(max_iterations=max_iterations, pipeline=pipeline, speculate_tokens=speculate_tokens)
+    for agent in team:
+        env.add_agent(agent)
+    env.initiate_conversation(prompt)
+    async for message in env.run_conversation():
+        yield message
+
+
+async def run_lang_agents(backend, prompt):
+    team = [langAgents.ProblemSolvingAgent("Agent1", backend), langAgents.ProblemSolvingAgent("Agent2", backend)]
+    async for message in langAgents.orchestrate_problem_solving(team, prompt):
+        yield message
+
+
+async def run_hierarchical(backend, prompt):
+    orchestrator = hierarchical.OrchestratorAgent("Orchestrator", backend)
+    team = [hierarchical.ProblemSolvingAgent("Agent1", backend), hierarchical.ProblemSolvingAgent("Agent2", backend)]
+    async for message in hierarchical.orchestrate_problem_solving(orchestrator, team, prompt, fast_path=False):
+        yield message
+
+
+SCENARIOS = {
+    "agents_solved_first_turn": (run_agents, solved_first_turn, {}),
+    "agents_unsolved": (run_agents, never_solved, {}),
+    "agents_unsolved_20_iterations": (run_agents, never_solved, {"max_iterations": 20}),
+    # UNSOLVED is shorter than the default speculate_tokens, so speculate earlier
+    "agents_unsolved_pipelined": (run_agents, never_solved, {"pipeline": True, "speculate_tokens": 8}),
+    "lang_agents_unsolved": (run_lang_agents, never_solved, {}),
+    "hierarchical_unsolved": (run_hierarchical, never_solved, {}),
+}
+
+
+async def solve(runner, backend, kwargs, on_message=None):
+    with contextlib.redirect_stdout(io.StringIO()):
+        async for _ in runner(backend, "Solve 1+1", **kwargs):
+            if on_message is not None:
+                on_message()
+
+
+def speculation_count():
+    return sum(agents.SPECULATIONS.value(outcome=outcome) for outcome in ("accepted", "discarded"))
+
+
+async def measure(runner, responder_factory, kwargs, runs, latency, tokens_per_second):
+    def new_backend():
+        return FakeBackend(responder_factory(), latency=latency, tokens_per_second=tokens_per_second)
+
+    # Warm up (imports, caches) outside the measurements
+    await solve(runner, new_backend(), kwargs)
+
+    calls = 0
+    prompt_sizes = []
+    first_run_turns = []
+    wall = cpu = 0.0
+    speculations = speculation_count()
+    for run in range(runs):
+        backend = new_backend()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        await solve(runner, backend, kwargs)
+        wall += time.perf_counter() - wall_start
+        cpu += time.process_time() - cpu_start
+        calls += backend.calls
+        sizes = [len(prompt.encode("utf-8")) for prompt in backend.prompts]
+        prompt_sizes.extend(sizes)
+        if run == 0:
+            first_run_turns = sizes
+    speculations = speculation_count() - speculations
+
+    # Memory is traced in a separate pass, since tracemalloc skews the timings
+    memory_by_message = []
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    await solve(runner, new_backend(), kwargs,
+                lambda: memory_by_message.append(tracemalloc.get_traced_memory()[0] - baseline))
+    for _ in range(runs - 1):
+        await solve(runner, new_backend(), kwargs)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "runs": runs,
+        "calls_per_solve": calls / runs,
+        "prompt_bytes_mean": sum(prompt_sizes) / max(len(prompt_sizes), 1),
+        "prompt_bytes_max": max(prompt_sizes, default=0),
+        "prompt_bytes_per_turn": first_run_turns,
+        "wall_ms_per_solve": 1000 * wall / runs,
+        "cpu_ms_per_solve": 1000 * cpu / runs,
+        "peak_memory_bytes": peak - baseline,
+        "retained_bytes": retained - baseline,
+        "memory_by_message": memory_by_message,
+        "speculations_per_solve": speculations / runs,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+COMPARED_METRICS = ("calls_per_solve", "prompt_bytes_mean", "prompt_bytes_max", "cpu_ms_per_solve", "peak_memory_bytes")
+
+
+def compare(current, previous):
+    for name, metrics in current["scenarios"].items():
+        old = previous.get("scenarios", {}).get(name)
+        if old is None:
+            continue
+        changes = []
+        for metric in COMPARED_METRICS:
+            before, after = old.get(metric), metrics.get(metric)
+            if before:
+                changes.append(f"{metric} {100 * (after - before) / before:+.1f}%")
+        print(f"{name}: " + ", ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake model latency per call, in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="Fake model generation rate")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Run only these scenarios")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "timestamp": time.time(),
+        "settings": {"runs": args.runs, "latency": args.latency, "tokens_per_second": args.tokens_per_second},
+        "scenarios": {},
+    }
+    for name in args.scenario or SCENARIOS:
+        runner, responder_factory, kwargs = SCENARIOS[name]
+        metrics = asyncio.run(measure(runner, responder_factory, kwargs, args.runs, args.latency, args.tokens_per_second))
+        if kwargs.get("pipeline") and not metrics["speculations_per_solve"]:
+            raise SystemExit(f"{name}: the pipelined conversation never speculated")
+        results["scenarios"][name] = metrics
+        print(f"{name}: {metrics['calls_per_solve']:.1f} calls/solve, "
+              f"{metrics['prompt_bytes_mean']:.0f} prompt bytes/turn (max {metrics['prompt_bytes_max']}), "
+              f"{metrics['cpu_ms_per_solve']:.2f} ms CPU/solve, peak {metrics['peak_memory_bytes'] / 1024:.0f} KiB")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}.")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
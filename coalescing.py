@@ -0,0 +1,108 @@
+import asyncio
+import contextlib
+
+
+def coalesce_key(prompt):
+    """Prompts that differ only in case or whitespace share one run."""
+    return " ".join(prompt.split()).casefold()
+
+
+class SharedRun:
+    """One orchestration whose events are fanned out to any number of subscribers.
+
+    Every event is kept in `events`, so a subscriber that joins late first
+    replays what it missed and then follows the live run. When the last
+    subscriber leaves, the run is cancelled after `idle_timeout` seconds unless
+    someone subscribes again.
+    """
+
+    def __init__(self, key, source, idle_timeout=10.0, trace_id=None, session_id=None):
+        self.key = key
+        self.trace_id = trace_id
+        self.session_id = session_id
+        self.events = []
+        self.done = False
+        self.subscribers = 0
+        self.idle_timeout = idle_timeout
+        self._source = source
+        self._new_event = asyncio.Event()
+        self._idle_handle = None
+        self._task = asyncio.create_task(self._pump())
+
+    async def _pump(self):
+        try:
+            async with contextlib.aclosing(self._source) as source:
+                async for event in source:
+                    self._publish(event)
+        finally:
+            self.done = True
+            self._new_event.set()
+
+    def _publish(self, event):
+        self.events.append(event)
+        # Wake current subscribers, and give later ones a fresh event to wait on
+        self._new_event.set()
+        self._new_event = asyncio.Event()
+
+    async def subscribe(self, start=0):
+        """Yield every event from index `start`, then live events until the run ends."""
+        self.subscribers += 1
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        index = start
+        try:
+            while True:
+                new_event = self._new_event
+                while index < len(self.events):
+                    yield self.events[index]
+                    index += 1
+                if self.done:
+                    return
+                await new_event.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self._idle_handle = asyncio.get_running_loop().call_later(self.idle_timeout, self.cancel)
+
+    def cancel(self):
+        if not self.done:
+            self._task.cancel()
+
+    async def wait(self):
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+class RunRegistry:
+    """In-flight runs by coalescing key; finished runs drop out so the next request starts afresh."""
+
+    def __init__(self, idle_timeout=10.0):
+        self.idle_timeout = idle_timeout
+        self._runs = {}
+
+    def __len__(self):
+        return len(self._runs)
+
+    def get(self, prompt):
+        run = self._runs.get(coalesce_key(prompt))
+        if run is not None and run.done:
+            return None
+        return run
+
+    def find(self, session_id):
+        """Return the in-flight run of a session, if it is still going."""
+        for run in self._runs.values():
+            if run.session_id == session_id and not run.done:
+                return run
+        return None
+
+    def start(self, prompt, source, trace_id=None, session_id=None):
+        key = coalesce_key(prompt)
+        run = SharedRun(key, source, idle_timeout=self.idle_timeout, trace_id=trace_id, session_id=session_id)
+        self._runs[key] = run
+        run._task.add_done_callback(lambda _: self._discard(run))
+        return run
+
+    def _discard(self, run):
+        if self._runs.get(run.key) is run:
+            del self._runs[run.key]
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import re
+
+import telemetry
+
+# Verdicts are a handful of tokens: cap the output, sample greedily and have Ollama
+# constrain it to JSON (backends that cannot constrain their output ignore "format")
+VERDICT_OPTIONS = {"num_predict": 12, "temperature": 0, "format": "json"}
+VERDICT_RETRY = '\nYour reply could not be read. Reply with exactly one word, yes or no, as {"verdict": "yes"} or {"verdict": "no"}.'
+
+# Agent turns end with a status line; only a turn that claims a solution is put to the verifiers
+STATUS_INSTRUCTION = 'End your reply with a last line {"solved": true} if the problem is now solved, otherwise {"solved": false}.'
+
+VERDICTS = telemetry.REGISTRY.counter(
+    "verification_verdicts_total", "Verifier verdicts by outcome (yes, no, retried, unreadable).", ["outcome"]
+)
+
+_JSON_OBJECT = re.compile(r"\{[^{}]*\}")
+_LEADING_WORD = re.compile(r"[\W_]*(yes|no)\b", re.IGNORECASE)
+
+
+class QuorumPolicy:
+    """Decides when a set of verifier verdicts amounts to consensus.
+
+    Modes:
+      - "all": every verifier must approve (any rejection fails immediately).
+      - "majority": more than half of the verifiers must approve.
+      - "first-k": the first `k` approvals are enough.
+    """
+
+    MODES = ("all", "majority", "first-k")
+
+    def __init__(self, mode="all", k=1):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown quorum mode: {mode!r}")
+        self.mode = mode
+        self.k = k
+
+    def required(self, total):
+        if self.mode == "all":
+            return total
+        if self.mode == "majority":
+            return total // 2 + 1
+        return min(self.k, total)
+
+    def decide(self, approvals, rejections, total):
+        """Return True/False once the outcome is settled, None while it is still open."""
+        needed = self.required(total)
+        if approvals >= needed:
+            return True
+        if total - rejections < needed:
+            return False
+        return None
+
+
+async def verify_sequentially(agents, ask, judge, policy=None):
+    """Ask each agent in turn, stopping as soon as the policy reaches a decision.
+
+    `ask(agent)` is a coroutine returning the agent's response and
+    `judge(agent, response)` returns whether the agent approves.
+    """
+    policy = policy or QuorumPolicy()
+    approvals = rejections = 0
+    for agent in agents:
+        if judge(agent, await ask(agent)):
+            approvals += 1
+        else:
+            rejections += 1
+        decision = policy.decide(approvals, rejections, len(agents))
+        if decision is not None:
+            return decision
+    return bool(policy.decide(approvals, rejections, len(agents)))
+
+
+async def verify_concurrently(agents, ask, judge, policy=None):
+    """Ask all agents at once and cancel the in-flight calls once the policy has decided.
+
+    A verifier that raises counts as a rejection.
+    """
+    policy = policy or QuorumPolicy()
+    total = len(agents)
+    tasks = {asyncio.ensure_future(ask(agent)): agent for agent in agents}
+    pending = set(tasks)
+    approvals = rejections = 0
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                agent = tasks[task]
+                try:
+                    approved = judge(agent, task.result())
+                except Exception as e:
+                    print(f"{agent.name} verification failed: {e}")
+                    approved = False
+                if approved:
+                    approvals += 1
+                else:
+                    rejections += 1
+            decision = policy.decide(approvals, rejections, total)
+            if decision is not None:
+                return decision
+        return bool(policy.decide(approvals, rejections, total))
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+def verdict_prompt(solution):
+    return (
+        f"The proposed solution is:\n{solution}\n"
+        "Do you agree that this solution solves the problem? "
+        'Reply with only {"verdict": "yes"} or {"verdict": "no"}.'
+    )
+
+
+def parse_verdict(text):
+    """True or False for a well-formed verdict, None for anything else.
+
+    Accepts a JSON object whose "verdict" is "yes"/"no" or a boolean. As a
+    deliberate fallback for backends that cannot constrain their output to
+    JSON (the subprocess backend, a model that ignores the format), a reply
+    whose first word is yes or no ("No, it is not solved.") is read as that
+    verdict. Words that merely contain "no" ("know", "not") are not verdicts.
+    """
+    match = _JSON_OBJECT.search(text)
+    if match:
+        try:
+            verdict = json.loads(match.group()).get("verdict")
+        except ValueError:
+            verdict = None
+        if isinstance(verdict, bool):
+            return verdict
+        if isinstance(verdict, str) and verdict.strip().lower() in ("yes", "no"):
+            return verdict.strip().lower() == "yes"
+    match = _LEADING_WORD.match(text)
+    if match:
+        return match.group(1).lower() == "yes"
+    return None
+
+
+def claims_solved(response):
+    """Whether `response` ends with the {"solved": true} status line asked for by STATUS_INSTRUCTION.
+
+    Only a JSON object at the very end of the reply counts (trailing code
+    fences and full stops aside); prose such as "the problem is solved" does not.
+    """
+    matches = list(_JSON_OBJECT.finditer(response))
+    if not matches or response[matches[-1].end():].strip(" \t\r\n`."):
+        return False
+    try:
+        status = json.loads(matches[-1].group())
+    except ValueError:
+        return False
+    return status.get("solved") is True
+
+
+async def ask_verdict(agent, solution):
+    """Ask `agent.verdict(prompt)` about `solution`, once more if the reply cannot be parsed.
+
+    A reply that is still unreadable counts as a rejection.
+    """
+    prompt = verdict_prompt(solution)
+    for attempt in range(2):
+        response = await agent.verdict(prompt)
+        print(f"{agent.name} verification response: {response}")
+        verdict = parse_verdict(response)
+        if verdict is not None:
+            VERDICTS.inc(outcome="yes" if verdict else "no")
+            return verdict
+        VERDICTS.inc(outcome="retried" if attempt == 0 else "unreadable")
+        prompt += VERDICT_RETRY
+    return False
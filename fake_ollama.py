@@ -0,0 +1,227 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_backend import BackendConfig, LLMBackend
+
+
+def default_responder(prompt):
+    if '"verdict"' in prompt:
+        return '{"verdict": "yes"}'
+    return 'The answer is 2. Yes, the problem is solved.\n{"solved": true}'
+
+
+def scripted_responder(rules, default="I am still working on it."):
+    """Build a deterministic responder from (substring, response) rules.
+
+    The first rule whose substring occurs in the prompt wins. A response may be
+    a list, which is cycled through on successive matches.
+    """
+    counters = [0] * len(rules)
+
+    def respond(prompt):
+        for i, (needle, response) in enumerate(rules):
+            if needle in prompt:
+                if isinstance(response, list):
+                    response = response[counters[i] % len(response)]
+                    counters[i] += 1
+                return response
+        return default
+
+    return respond
+
+
+def split_tokens(text):
+    return re.findall(r"\s*\S+\s*", text) or [text]
+
+
+class _FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep connections open between requests, like the real server
+
+    def setup(self):
+        super().setup()
+        with self.server.fake.lock:
+            self.server.fake.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        fake = self.server.fake
+        if fake.status != 200:
+            self._send_json(fake.status, {"error": "fake failure"})
+        elif self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": fake.model}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+        with fake.lock:
+            fake.requests.append(payload)
+        if fake.status != 200:
+            self._send_json(fake.status, {"error": "fake failure"})
+            return
+        if fake.reject_context and payload.get("context"):
+            self._send_json(400, {"error": "context no longer valid"})
+            return
+
+        if fake.latency:
+            time.sleep(fake.latency)
+        if "prompt" not in payload:
+            # Like Ollama, a request without a prompt just loads the model
+            self._send_json(200, {"model": payload.get("model", fake.model), "response": "", "done": True, "done_reason": "load"})
+            return
+        prompt = payload.get("prompt", "")
+        text = fake.responder(prompt)
+        final = {
+            "model": payload.get("model", fake.model),
+            "response": text,
+            "done": True,
+            # Stand-in for the token ids of the conversation so far
+            "context": payload.get("context", []) + [len(word) for word in f"{prompt} {text}".split()],
+            "prompt_eval_count": len(prompt.split()),
+            "eval_count": len(text.split()),
+        }
+        if payload.get("stream", True):
+            self._stream_tokens(text, final)
+        else:
+            self._send_json(200, final)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream_tokens(self, text, final):
+        # Newline-delimited JSON over chunked transfer encoding, one chunk per word
+        fake = self.server.fake
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in split_tokens(text):
+            if fake.token_delay:
+                time.sleep(fake.token_delay)
+            self._write_chunk(json.dumps({"model": final["model"], "response": token, "done": False}).encode("utf-8") + b"\n")
+        self._write_chunk(json.dumps(dict(final, response="")).encode("utf-8") + b"\n")
+        self._write_chunk(b"")
+
+
+class FakeOllamaServer:
+    """Local stand-in for the Ollama REST API so backends can be tested offline.
+
+    `responder` maps a prompt to the response text; `latency` is slept before
+    answering and `token_delay` between streamed tokens. Every request payload is
+    recorded in `requests`, and `connections` counts accepted TCP connections.
+    """
+
+    def __init__(self, responder=None, host="127.0.0.1", port=0, latency=0.0, token_delay=0.0, model="llama3"):
+        self.responder = responder or default_responder
+        self.latency = latency
+        self.token_delay = token_delay
+        self.model = model
+        self.status = 200
+        self.reject_context = False  # Simulate a server that has lost the session's context
+        self.requests = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _FakeOllamaHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeBackend(LLMBackend):
+    """In-process scriptable backend for benchmarks and tests, with no HTTP involved.
+
+    Each call sleeps `latency` seconds plus one token interval per word of the
+    response when `tokens_per_second` is set. Every prompt is recorded in `prompts`.
+    """
+
+    def __init__(self, responder=None, latency=0.0, tokens_per_second=None, model="fake"):
+        self.config = BackendConfig(kind="fake", model=model)
+        self.responder = responder or default_responder
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.prompts = []
+
+    @property
+    def calls(self):
+        return len(self.prompts)
+
+    def _respond(self, prompt, session):
+        self.prompts.append(prompt)
+        text = self.responder(prompt)
+        if session is not None:
+            session.update((session.context or []) + [len(word) for word in f"{prompt} {text}".split()])
+        return text
+
+    def _token_delay(self):
+        return 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    async def agenerate(self, prompt, options=None, session=None):
+        text = self._respond(prompt, session)
+        await asyncio.sleep(self.latency + self._token_delay() * len(split_tokens(text)))
+        return text
+
+    async def astream(self, prompt, options=None, session=None):
+        text = self._respond(prompt, session)
+        await asyncio.sleep(self.latency)
+        for token in split_tokens(text):
+            await asyncio.sleep(self._token_delay())
+            yield token
+
+    def generate(self, prompt, options=None, session=None):
+        text = self._respond(prompt, session)
+        time.sleep(self.latency + self._token_delay() * len(split_tokens(text)))
+        return text
+
+
+if __name__ == "__main__":
+    import sys
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 11434
+    server = FakeOllamaServer(port=port)
+    print(f"Fake Ollama server listening on {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,467 @@
+"""Deterministic fast path for arithmetic and simple algebra prompts.
+
+`solve_prompt` recognizes prompts such as "Solve 1+1", "how much is 1+2?",
+"simplify 2x + 3x" or "solve 2x + 3 = 7" and answers them without a model
+call. Expressions are parsed with `ast` and evaluated over a whitelist of
+node types, names and functions, with exact rational arithmetic and limits on
+the size of every intermediate result, so any input is safe to try. Anything
+else returns None and is left to the agents.
+"""
+import ast
+import functools
+import math
+import re
+from fractions import Fraction
+
+import telemetry
+
+MAX_PROMPT_CHARS = 500
+MAX_NODES = 200
+MAX_EXPONENT = 10_000
+MAX_INT_BITS = 10_000  # Also keeps results below the int to str conversion limit
+MAX_DEGREE = 64
+MAX_TERMS = 1_000
+MAX_FACTORIAL = 1_000
+
+FAST_ANSWERS = telemetry.REGISTRY.counter(
+    "fast_solver_answers_total", "Prompts answered by the fast solver without a model call.", ["kind"]
+)
+
+
+class FastSolverError(ValueError):
+    """The expression is outside what the fast solver handles."""
+
+
+def _check_number(value):
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            raise FastSolverError("Result is not finite")
+    elif max(value.numerator.bit_length(), value.denominator.bit_length()) > MAX_INT_BITS:
+        raise FastSolverError("Result is too large")
+    return value
+
+
+def _number(value):
+    """Exact Fraction for ints, Fractions and decimal literals; floats stay floats."""
+    if isinstance(value, bool):
+        raise FastSolverError("Booleans are not numbers here")
+    if isinstance(value, (int, Fraction)):
+        return _check_number(Fraction(value))
+    if isinstance(value, float):
+        return _check_number(value)
+    raise FastSolverError(f"Unsupported value {value!r}")
+
+
+def _multiply_monomials(a, b):
+    exponents = dict(a)
+    for variable, exponent in b:
+        exponents[variable] = exponents.get(variable, 0) + exponent
+    return tuple(sorted(exponents.items()))
+
+
+class Polynomial:
+    """{monomial: coefficient}, where a monomial is a sorted tuple of (variable, exponent) pairs.
+
+    Constants are polynomials with the empty monomial only, so arithmetic and
+    simplification share one code path.
+    """
+
+    __slots__ = ("terms",)
+
+    def __init__(self, terms):
+        self.terms = {monomial: coefficient for monomial, coefficient in terms.items() if coefficient != 0}
+        if len(self.terms) > MAX_TERMS or self.degree() > MAX_DEGREE:
+            raise FastSolverError("Polynomial is too large")
+        for coefficient in self.terms.values():
+            _check_number(coefficient)
+
+    @classmethod
+    def constant(cls, value):
+        return cls({(): _number(value)})
+
+    @classmethod
+    def variable(cls, name):
+        return cls({((name, 1),): Fraction(1)})
+
+    def is_constant(self):
+        return all(monomial == () for monomial in self.terms)
+
+    @property
+    def value(self):
+        return self.terms.get((), Fraction(0))
+
+    def degree(self):
+        return max((sum(exponent for _, exponent in monomial) for monomial in self.terms), default=0)
+
+    def variables(self):
+        return sorted({variable for monomial in self.terms for variable, _ in monomial})
+
+    def coefficient(self, variable, exponent):
+        return self.terms.get(((variable, exponent),) if exponent else (), Fraction(0))
+
+    def __add__(self, other):
+        terms = dict(self.terms)
+        for monomial, coefficient in other.terms.items():
+            terms[monomial] = terms.get(monomial, 0) + coefficient
+        return Polynomial(terms)
+
+    def __neg__(self):
+        return Polynomial({monomial: -coefficient for monomial, coefficient in self.terms.items()})
+
+    def __sub__(self, other):
+        return self + -other
+
+    def __mul__(self, other):
+        if len(self.terms) * len(other.terms) > MAX_TERMS * 50:
+            raise FastSolverError("Polynomial is too large")
+        terms = {}
+        for m1, c1 in self.terms.items():
+            for m2, c2 in other.terms.items():
+                monomial = _multiply_monomials(m1, m2)
+                terms[monomial] = terms.get(monomial, 0) + c1 * c2
+        return Polynomial(terms)
+
+    def __pow__(self, exponent):
+        if exponent < 0 or exponent > MAX_DEGREE:
+            raise FastSolverError("Only small non-negative integer powers of expressions with variables")
+        result, base = Polynomial.constant(1), self
+        while exponent:
+            if exponent & 1:
+                result = result * base
+            exponent >>= 1
+            if exponent:
+                base = base * base
+        return result
+
+    def evaluate(self, values):
+        """The value of the polynomial with its variables bound to `values`."""
+        total = Fraction(0)
+        for monomial, coefficient in self.terms.items():
+            term = coefficient
+            for variable, exponent in monomial:
+                term *= _power(_number(values[variable]), Fraction(exponent))
+            total += term
+        return _check_number(total)
+
+    def __str__(self):
+        if not self.terms:
+            return "0"
+        ordered = sorted(self.terms.items(), key=lambda item: (-sum(e for _, e in item[0]), item[0]))
+        parts = []
+        for monomial, coefficient in ordered:
+            factors = "*".join(variable if exponent == 1 else f"{variable}^{exponent}" for variable, exponent in monomial)
+            magnitude = abs(coefficient)
+            if not factors:
+                text = format_number(magnitude, approximate=False)
+            elif magnitude == 1:
+                text = factors
+            else:
+                text = f"{format_number(magnitude, approximate=False)}*{factors}"
+            sign = "-" if coefficient < 0 else "+"
+            parts.append(("-" if sign == "-" else "") + text if not parts else f" {sign} {text}")
+        return "".join(parts)
+
+
+def _exact_root(value, n):
+    """The exact n-th root of a non-negative Fraction, or None if it is irrational."""
+    roots = []
+    for part in (value.numerator, value.denominator):
+        root = round(part ** (1 / n)) if part.bit_length() < 1000 else None
+        if root is None:
+            return None
+        root = next((r for r in (root - 1, root, root + 1) if r >= 0 and r ** n == part), None)
+        if root is None:
+            return None
+        roots.append(root)
+    return Fraction(roots[0], roots[1])
+
+
+def _power(base, exponent):
+    if isinstance(exponent, Fraction) and isinstance(base, Fraction):
+        if exponent.denominator == 1:
+            if abs(exponent) > MAX_EXPONENT or abs(exponent) * max(base.numerator.bit_length(), base.denominator.bit_length()) > MAX_INT_BITS:
+                raise FastSolverError("Power is too large")
+            if base == 0 and exponent < 0:
+                raise FastSolverError("Division by zero")
+            return _check_number(base ** int(exponent))
+        if base >= 0 and exponent.denominator <= 64:
+            root = _exact_root(base, exponent.denominator)
+            if root is not None:
+                return _power(root, Fraction(exponent.numerator))
+    try:
+        result = float(base) ** float(exponent)
+    except (OverflowError, ZeroDivisionError):
+        raise FastSolverError("Power is out of range")
+    if isinstance(result, complex):
+        raise FastSolverError("Result is not real")
+    return _check_number(result)
+
+
+def _sqrt(value):
+    return _power(value, Fraction(1, 2)) if value >= 0 else _power(float(value), 0.5)
+
+
+def _factorial(value):
+    if value != int(value) or not 0 <= value <= MAX_FACTORIAL:
+        raise FastSolverError("factorial() takes an integer from 0 to 1000")
+    return math.factorial(int(value))
+
+
+def _log(value, base=None):
+    if value <= 0 or (base is not None and (base <= 0 or base == 1)):
+        raise FastSolverError("Logarithm is not defined there")
+    return math.log(value) if base is None else math.log(value, base)
+
+
+def _integers(function):
+    def call(*args):
+        if any(arg != int(arg) for arg in args):
+            raise FastSolverError(f"{function.__name__}() takes integers")
+        return function(*(int(arg) for arg in args))
+    return call
+
+
+FUNCTIONS = {
+    "sqrt": _sqrt,
+    "abs": abs,
+    "round": round,
+    "floor": math.floor,
+    "ceil": math.ceil,
+    "min": min,
+    "max": max,
+    "factorial": _factorial,
+    "gcd": _integers(math.gcd),
+    "lcm": _integers(math.lcm),
+    "exp": math.exp,
+    "log": _log,
+    "ln": _log,
+    "log10": math.log10,
+    "log2": math.log2,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+}
+CONSTANTS = {"pi": math.pi, "e": math.e, "tau": math.tau}
+_VARIABLE = re.compile(r"[A-Za-z]")
+
+
+def _constant_value(polynomial):
+    if not polynomial.is_constant():
+        raise FastSolverError("Only constants are allowed here")
+    return polynomial.value
+
+
+def _evaluate(node):
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body)
+    if isinstance(node, ast.Constant):
+        value = node.value
+        # repr keeps decimal literals exact: 0.1 is 1/10, not the nearest float
+        return Polynomial.constant(Fraction(repr(value)) if isinstance(value, float) and math.isfinite(value) else value)
+    if isinstance(node, ast.Name):
+        if node.id in CONSTANTS:
+            return Polynomial.constant(CONSTANTS[node.id])
+        if _VARIABLE.fullmatch(node.id):
+            return Polynomial.variable(node.id)
+        raise FastSolverError(f"Unknown name {node.id}")
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        operand = _evaluate(node.operand)
+        return -operand if isinstance(node.op, ast.USub) else operand
+    if isinstance(node, ast.BinOp):
+        left, right = _evaluate(node.left), _evaluate(node.right)
+        if isinstance(node.op, ast.Add):
+            return left + right
+        if isinstance(node.op, ast.Sub):
+            return left - right
+        if isinstance(node.op, ast.Mult):
+            return left * right
+        if isinstance(node.op, ast.Div):
+            divisor = _constant_value(right)
+            if divisor == 0:
+                raise FastSolverError("Division by zero")
+            return left * Polynomial.constant(1 / divisor)
+        if isinstance(node.op, ast.Pow):
+            exponent = _constant_value(right)
+            if left.is_constant():
+                return Polynomial.constant(_power(left.value, exponent))
+            if exponent != int(exponent):
+                raise FastSolverError("Only integer powers of expressions with variables")
+            return left ** int(exponent)
+        if isinstance(node.op, (ast.FloorDiv, ast.Mod)):
+            a, b = _constant_value(left), _constant_value(right)
+            if b == 0:
+                raise FastSolverError("Division by zero")
+            return Polynomial.constant(a // b if isinstance(node.op, ast.FloorDiv) else a % b)
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS and not node.keywords:
+        args = [_constant_value(_evaluate(arg)) for arg in node.args]
+        try:
+            return Polynomial.constant(FUNCTIONS[node.func.id](*args))
+        except (TypeError, ValueError, OverflowError) as e:
+            raise FastSolverError(str(e))
+    raise FastSolverError(f"Unsupported syntax: {type(node).__name__}")
+
+
+def format_number(value, approximate=True):
+    """Integers and terminating decimals exactly; other fractions as p/q, with a decimal approximation."""
+    if isinstance(value, float):
+        if value.is_integer() and abs(value) < 1e15:
+            return str(int(value))
+        return f"{value:.12g}"
+    if value.denominator == 1:
+        return str(value.numerator)
+    denominator, digits = value.denominator, 0
+    for factor in (2, 5):
+        while denominator % factor == 0:
+            denominator //= factor
+    if denominator == 1:
+        while (10 ** digits) % value.denominator:
+            digits += 1
+        scaled = abs(value.numerator) * 10 ** digits // value.denominator
+        text = str(scaled).rjust(digits + 1, "0")
+        return f"{'-' if value < 0 else ''}{text[:-digits]}.{text[-digits:]}"
+    fraction = f"{value.numerator}/{value.denominator}"
+    return f"{fraction} ≈ {float(value):.6g}" if approximate else fraction
+
+
+class FastAnswer:
+    """An answer found without the model. `kind` is "arithmetic", "simplification" or "equation"."""
+
+    def __init__(self, kind, expression, text):
+        self.kind = kind
+        self.expression = expression
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"FastAnswer({self.kind!r}, {self.text!r})"
+
+
+_LEADING = re.compile(
+    r"^(?:please\s+)?(?:(?:solve|calculate|compute|evaluate|simplify|find|work\s+out)\b|what\s+is|what's|whats|how\s+much\s+is)"
+    r"(?:\s+the\s+value\s+of)?\s*:?\s*",
+    re.IGNORECASE,
+)
+_WORDS = [
+    (re.compile(r"\bmultiplied\s+by\b", re.IGNORECASE), "*"),
+    (re.compile(r"\bdivided\s+by\b", re.IGNORECASE), "/"),
+    (re.compile(r"\bto\s+the\s+power\s+of\b", re.IGNORECASE), "**"),
+    (re.compile(r"\bplus\b", re.IGNORECASE), "+"),
+    (re.compile(r"\bminus\b", re.IGNORECASE), "-"),
+    (re.compile(r"\btimes\b", re.IGNORECASE), "*"),
+    (re.compile(r"\bsquared\b", re.IGNORECASE), "**2"),
+    (re.compile(r"\bcubed\b", re.IGNORECASE), "**3"),
+    (re.compile(r"\bmod\b", re.IGNORECASE), "%"),
+]
+_SYMBOLS = str.maketrans({"^": "**", "×": "*", "·": "*", "÷": "/", "−": "-"})
+# 2x, 3(x + 1), (x + 1)(x - 1) -> explicit products; 2e5 stays a number
+_IMPLICIT = re.compile(r"(?<=[\d)])\s*(?![eE][+-]?\d)(?=[A-Za-z(])")
+
+
+def _normalize(expression):
+    for pattern, replacement in _WORDS:
+        expression = pattern.sub(replacement, expression)
+    return _IMPLICIT.sub("*", expression.translate(_SYMBOLS))
+
+
+def _parse(expression):
+    tree = ast.parse(_normalize(expression).strip(), mode="eval")
+    if sum(1 for _ in ast.walk(tree)) > MAX_NODES:
+        raise FastSolverError("Expression is too long")
+    return tree
+
+
+def _has_operation(tree):
+    return any(isinstance(node, (ast.BinOp, ast.Call)) for node in ast.walk(tree))
+
+
+def _solve_equation(expression, left, right):
+    difference = _evaluate(_parse(left)) - _evaluate(_parse(right))
+    variables = difference.variables()
+    if not variables:
+        holds = difference.value == 0
+        return FastAnswer("equation", expression, f"{expression} is {'true' if holds else 'false'}")
+    if len(variables) > 1 or difference.degree() > 2:
+        raise FastSolverError("Only equations in one variable of degree 1 or 2")
+    x = variables[0]
+    a, b, c = (difference.coefficient(x, exponent) for exponent in (2, 1, 0))
+    if a == 0:
+        return FastAnswer("equation", expression, f"{x} = {format_number(-c / b)}")
+    discriminant = b * b - 4 * a * c
+    if discriminant < 0:
+        return FastAnswer("equation", expression, f"{expression} has no real solution")
+    root = _sqrt(discriminant)
+    solutions = sorted({(-b - root) / (2 * a), (-b + root) / (2 * a)})
+    return FastAnswer("equation", expression, " or ".join(f"{x} = {format_number(s)}" for s in solutions))
+
+
+@functools.lru_cache(maxsize=4096)
+def solve_expression(expression):
+    """Answer a single expression or equation; raises FastSolverError (or SyntaxError) if it cannot."""
+    if expression.count("=") == 1:
+        left, right = expression.split("=")
+        return _solve_equation(expression, left.strip(), right.strip())
+    tree = _parse(expression)
+    if not _has_operation(tree):
+        raise FastSolverError("Nothing to compute")
+    result = _evaluate(tree)
+    if result.is_constant():
+        return FastAnswer("arithmetic", expression, f"{expression} = {format_number(result.value)}")
+    return FastAnswer("simplification", expression, f"{expression} = {result}")
+
+
+def _normalized(expression):
+    return re.sub(r"\s+", "", expression).replace("**", "^")
+
+
+def _unchanged(expression, text):
+    # A "simplification" that renders like the input ("x + y = x + y") answers nothing
+    return _normalized(text[len(expression):].removeprefix(" = ")) == _normalized(expression)
+
+
+def solve_prompt(prompt):
+    """The FastAnswer for `prompt`, or None if it is not a computation the fast solver handles.
+
+    Several expressions separated by semicolons or new lines are answered
+    together, one per line, only if every one of them can be. Expressions
+    with variables are only simplified when asked to ("simplify a + a"), so
+    text such as "A + B" is left to the agents.
+    """
+    if not prompt or len(prompt) > MAX_PROMPT_CHARS:
+        return None
+    answers = []
+    for part in re.split(r"[;\n]", prompt):
+        part = part.strip()
+        expression = _LEADING.sub("", part).strip().rstrip("?.! ").strip()
+        if not expression:
+            continue
+        try:
+            answer = solve_expression(expression)
+        except (FastSolverError, SyntaxError, ValueError, ZeroDivisionError, OverflowError, RecursionError,
+                MemoryError):
+            return None
+        if answer.kind == "simplification" and (expression == part.rstrip("?.! ").strip()
+                                                or _unchanged(expression, answer.text)):
+            return None
+        answers.append(answer)
+    if not answers:
+        return None
+    if len(answers) == 1:
+        answer = answers[0]
+    else:
+        answer = FastAnswer("batch", prompt, "\n".join(answer.text for answer in answers))
+    FAST_ANSWERS.inc(kind=answer.kind)
+    return answer
+
+
+def evaluate_batch(expression, rows):
+    """Evaluate `expression` for each mapping of variable values in `rows`; the expression is parsed once."""
+    polynomial = _evaluate(_parse(expression))
+    results = []
+    for row in rows:
+        missing = [variable for variable in polynomial.variables() if variable not in row]
+        if missing:
+            raise FastSolverError(f"No value for {', '.join(missing)}")
+        results.append(polynomial.evaluate(row))
+    return results
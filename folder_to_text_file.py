@@ -1,149 +1,78 @@
 import os
 
-def folder_to_text_file(folder_path, output_file="output.txt"):
-    with open(output_file, "w") as f_out:
-        # Walk through the folder
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                f_out.write(f"File: {file}\nPath: {file_path}\n\n")
-                # Read the content of each file and write to output file
-                try:
-                    with open(file_path, "r", encoding="utf-8", errors="ignore") as f_in:
-                        content = f_in.read()
-                        f_out.write(content)
-                        f_out.write("\n\n" + "="*50 + "\n\n")
-                except Exception as e:
-                    f_out.write(f"Error reading file {file}: {str(e)}\n\n" + "="*50 + "\n\n")
-    print(f"All files from {folder_path} have been written to {output_file}.")
-
-
-def folder_to_text_file_big(folder_path, output_folder="multi_agent_llm_platform", max_file_size_mb=20):
+from packer import MANIFEST_NAME, Packer, list_sources, walk_sources
+from tokens import TokenCounter
+
+# Directories skipped by folder_to_text_file_big_exclude
+EXCLUDE_DIRS = {
+    "node_modules",
+    ".git",
+    ".vscode",
+    ".idea",
+    ".husky",
+    ".svelte-kit",
+    "chart",
+    "docs",
+
+    "venv", "__pycache__"# Depending on context, may be irrelevant if it only contains static assets
+}
+# "scripts",
+# "static",
+
+
+# output_format="indexed" writes only file contents (zlib-compressed per file with
+# compression="zlib"); read them back with packer.PackReader(output_folder).
+# max_shard_tokens also caps every shard at that many tokens (estimated, or counted
+# with tiktoken when exact_tokens is set), splitting files that are larger on their own.
+def _sharded_packer(output_folder, max_file_size_mb, incremental, workers, output_format, compression,
+                    max_shard_tokens=None, exact_tokens=False):
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
-
-    output_index = 1
-    output_file = os.path.join(output_folder, f"output_{output_index}.txt")
-    f_out = open(output_file, "w")
-    current_size = 0
-    max_size_bytes = max_file_size_mb * 1024 * 1024  # Convert MB to bytes
-
-    # Walk through the folder
-    for root, dirs, files in os.walk(folder_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            try:
-                with open(file_path, "r", encoding="utf-8", errors="ignore") as f_in:
-                    content = f_in.read()
-
-                    # Check the size of the current file to be written
-                    file_size = len(content.encode('utf-8'))
-                    file_header = f"File: {file}\nPath: {file_path}\n\n"
-                    header_size = len(file_header.encode('utf-8'))
-
-                    # If adding the new file exceeds the max size, close the current file and create a new one
-                    if current_size + file_size + header_size > max_size_bytes:
-                        f_out.close()
-                        output_index += 1
-                        output_file = os.path.join(output_folder, f"output_{output_index}.txt")
-                        f_out = open(output_file, "w")
-                        current_size = 0
-
-                    # Write the file's content and update the current size
-                    f_out.write(file_header)
-                    f_out.write(content)
-                    f_out.write("\n\n" + "="*50 + "\n\n")
-                    current_size += file_size + header_size
-
-            except Exception as e:
-                error_message = f"Error reading file {file}: {str(e)}\n\n" + "="*50 + "\n\n"
-                if current_size + len(error_message.encode('utf-8')) > max_size_bytes:
-                    f_out.close()
-                    output_index += 1
-                    output_file = os.path.join(output_folder, f"output_{output_index}.txt")
-                    f_out = open(output_file, "w")
-                    current_size = 0
-                f_out.write(error_message)
-                current_size += len(error_message.encode('utf-8'))
-
-    f_out.close()
-    print(f"All files from {folder_path} have been written to {output_folder}.")
+    extension = "txt" if output_format == "text" else "pack"
+    return Packer(
+        lambda index: os.path.join(output_folder, f"output_{index}.{extension}"),
+        max_shard_bytes=max_file_size_mb * 1024 * 1024,  # Convert MB to bytes
+        # The manifest lets the next run re-read only the files that changed, and indexes the pack
+        manifest_path=os.path.join(output_folder, MANIFEST_NAME) if incremental or output_format != "text" else None,
+        incremental=incremental,
+        workers=workers,
+        output_format=output_format,
+        compression=compression,
+        max_shard_tokens=max_shard_tokens,
+        token_counter=TokenCounter(exact=exact_tokens),
+    )
+
+
+def folder_to_text_file(folder_path, output_file="output.txt", workers=None, output_format="text", compression=None):
+    # The indexed format keeps its index next to the output file
+    manifest_path = f"{output_file}.index.json" if output_format != "text" else None
+    packer = Packer(lambda index: output_file, manifest_path=manifest_path, incremental=False, workers=workers,
+                    output_format=output_format, compression=compression)
+    packer.pack(lambda pool: walk_sources(folder_path, pool))
+    print(f"All files from {folder_path} have been written to {output_file}.")
 
 
+def folder_to_text_file_big(folder_path, output_folder="multi_agent_llm_platform", max_file_size_mb=20,
+                            incremental=True, workers=None, output_format="text", compression=None,
+                            max_shard_tokens=None, exact_tokens=False):
+    packer = _sharded_packer(output_folder, max_file_size_mb, incremental, workers, output_format, compression,
+                             max_shard_tokens, exact_tokens)
+    packer.pack(lambda pool: walk_sources(folder_path, pool))
+    print(f"All files from {folder_path} have been written to {output_folder}.")
 
-def folder_to_text_file_big_exclude(folder_path, output_folder="multi_agent_llm_one_file", max_file_size_mb=20):
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
 
-    output_index = 1
-    output_file = os.path.join(output_folder, f"output_{output_index}.txt")
-    f_out = open(output_file, "w")
-    current_size = 0
-    max_size_bytes = max_file_size_mb * 1024 * 1024  # Convert MB to bytes
-
-    # Directories to exclude
-
-    exclude_dirs = {
-        "node_modules",
-        ".git",
-        ".vscode",
-        ".idea",
-        ".husky",
-        ".svelte-kit",
-        "chart",
-        "docs",
-
-        "venv", "__pycache__"# Depending on context, may be irrelevant if it only contains static assets
-    }
-    # "scripts",
-    # "static",
-    #
-    # Walk through the folder
-    for root, dirs, files in os.walk(folder_path):
-        # Exclude certain directories
-        dirs[:] = [d for d in dirs if d not in exclude_dirs]
-
-        for file in files:
-            file_path = os.path.join(root, file)
-            try:
-                with open(file_path, "r", encoding="utf-8", errors="ignore") as f_in:
-                    content = f_in.read()
-
-                    # Check the size of the current file to be written
-                    file_size = len(content.encode('utf-8'))
-                    file_header = f"File: {file}\nPath: {file_path}\n\n"
-                    header_size = len(file_header.encode('utf-8'))
-
-                    # If adding the new file exceeds the max size, close the current file and create a new one
-                    if current_size + file_size + header_size > max_size_bytes:
-                        f_out.close()
-                        output_index += 1
-                        output_file = os.path.join(output_folder, f"output_{output_index}.txt")
-                        f_out = open(output_file, "w")
-                        current_size = 0
-
-                    # Write the file's content and update the current size
-                    f_out.write(file_header)
-                    f_out.write(content)
-                    f_out.write("\n\n" + "="*50 + "\n\n")
-                    current_size += file_size + header_size
-
-            except Exception as e:
-                error_message = f"Error reading file {file}: {str(e)}\n\n" + "="*50 + "\n\n"
-                if current_size + len(error_message.encode('utf-8')) > max_size_bytes:
-                    f_out.close()
-                    output_index += 1
-                    output_file = os.path.join(output_folder, f"output_{output_index}.txt")
-                    f_out = open(output_file, "w")
-                    current_size = 0
-                f_out.write(error_message)
-                current_size += len(error_message.encode('utf-8'))
-
-    f_out.close()
+def folder_to_text_file_big_exclude(folder_path, output_folder="multi_agent_llm_one_file", max_file_size_mb=20,
+                                    incremental=True, workers=None, output_format="text", compression=None,
+                                    max_shard_tokens=None, exact_tokens=False):
+    packer = _sharded_packer(output_folder, max_file_size_mb, incremental, workers, output_format, compression,
+                             max_shard_tokens, exact_tokens)
+    packer.pack(lambda pool: walk_sources(folder_path, pool, EXCLUDE_DIRS))
     print(f"All files from {folder_path} have been written to {output_folder}.")
 
 
-def files_to_text_file(file_list, output_folder="multi_agent_llm_one_file", max_file_size_mb=20):
+def files_to_text_file(file_list, output_folder="multi_agent_llm_one_file", max_file_size_mb=20,
+                       incremental=True, workers=None, output_format="text", compression=None,
+                       max_shard_tokens=None, exact_tokens=False):
     """
     Writes the contents of the specified files in the file_list to text files in the output folder.
     The content is split into multiple files if the size exceeds max_file_size_mb.
@@ -152,63 +81,16 @@ def files_to_text_file(file_list, output_folder="multi_agent_llm_one_file", max_
     - file_list: A list of file paths to include.
     - output_folder: The folder where output text files will be saved.
     - max_file_size_mb: Maximum size of each output text file in MB.
+    - incremental: Keep a manifest in the output folder and only re-read files changed since the last run.
+    - workers: Number of reader threads (default: the thread pool's default).
+    - output_format: "text" for File:/Path: delimited shards, "indexed" for contents only, read with PackReader.
+    - compression: None, or "zlib" to compress each file of an indexed pack.
+    - max_shard_tokens: Maximum tokens per output file; larger files are split on line/function boundaries.
+    - exact_tokens: Count tokens with tiktoken (if installed) instead of the character-based estimate.
     """
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    output_index = 1
-    output_file = os.path.join(output_folder, f"output_{output_index}.txt")
-    f_out = open(output_file, "w")
-    current_size = 0
-    max_size_bytes = max_file_size_mb * 1024 * 1024  # Convert MB to bytes
-
-    for file_path in file_list:
-        if os.path.exists(file_path):
-            try:
-                with open(file_path, "r", encoding="utf-8", errors="ignore") as f_in:
-                    content = f_in.read()
-
-                    # Check the size of the current file to be written
-                    file_size = len(content.encode('utf-8'))
-                    file_header = f"File: {os.path.basename(file_path)}\nPath: {file_path}\n\n"
-                    header_size = len(file_header.encode('utf-8'))
-
-                    # If adding the new file exceeds the max size, close the current file and create a new one
-                    if current_size + file_size + header_size > max_size_bytes:
-                        f_out.close()
-                        output_index += 1
-                        output_file = os.path.join(output_folder, f"output_{output_index}.txt")
-                        f_out = open(output_file, "w")
-                        current_size = 0
-
-                    # Write the file's content and update the current size
-                    f_out.write(file_header)
-                    f_out.write(content)
-                    f_out.write("\n\n" + "="*50 + "\n\n")
-                    current_size += file_size + header_size
-
-            except Exception as e:
-                error_message = f"Error reading file {file_path}: {str(e)}\n\n" + "="*50 + "\n\n"
-                if current_size + len(error_message.encode('utf-8')) > max_size_bytes:
-                    f_out.close()
-                    output_index += 1
-                    output_file = os.path.join(output_folder, f"output_{output_index}.txt")
-                    f_out = open(output_file, "w")
-                    current_size = 0
-                f_out.write(error_message)
-                current_size += len(error_message.encode('utf-8'))
-        else:
-            error_message = f"File {file_path} does not exist.\n\n" + "="*50 + "\n\n"
-            if current_size + len(error_message.encode('utf-8')) > max_size_bytes:
-                f_out.close()
-                output_index += 1
-                output_file = os.path.join(output_folder, f"output_{output_index}.txt")
-                f_out = open(output_file, "w")
-                current_size = 0
-            f_out.write(error_message)
-            current_size += len(error_message.encode('utf-8'))
-
-    f_out.close()
+    packer = _sharded_packer(output_folder, max_file_size_mb, incremental, workers, output_format, compression,
+                             max_shard_tokens, exact_tokens)
+    packer.pack(lambda pool: list_sources(file_list, pool))
     print(f"Selected files have been written to {output_folder}.")
 
 if __name__ == "__main__":
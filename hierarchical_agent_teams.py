@@ -1,64 +1,55 @@
 import asyncio
-import subprocess
-import sys
 from langchain import LLMChain, PromptTemplate
-from langchain.llms.base import LLM
 from langchain.tools import Tool
 from langchain.agents import initialize_agent, AgentType
 from langchain.prompts import ChatPromptTemplate
 
-
-# Custom LLM class for your local model
-class LocalModelLLM(LLM):
-    def _call(self, prompt: str, *args, **kwargs) -> str:
-        if sys.platform == "win32":
-            result = subprocess.run(
-                ["ollama", "run", "llama3"],
-                input=prompt.encode('utf-8'),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            return result.stdout.decode('utf-8')
-        else:
-            process = asyncio.run(asyncio.create_subprocess_exec(
-                "ollama", "run", "llama3",
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            ))
-            stdout, _ = asyncio.run(process.communicate(input=prompt.encode('utf-8')))
-            return stdout.decode('utf-8')
-
-    @property
-    def _llm_type(self) -> str:
-        return "local_model_llm"
-
-    @property
-    def _identifying_params(self) -> dict:
-        return {"model_name": "ollama llama3"}
+from consensus import (
+    STATUS_INSTRUCTION,
+    VERDICT_OPTIONS,
+    QuorumPolicy,
+    ask_verdict,
+    claims_solved,
+    verify_concurrently,
+    verify_sequentially,
+)
+from fast_solver import solve_prompt
+from langchain_llm import LocalModelLLM
+from routing import CONCURRENCY_LIMITS, Router, Strategy
+from transcript import Transcript
+from workflow import Halt, Node, Workflow
 
 
 # Problem Solving Agent (Worker)
 class ProblemSolvingAgent:
-    def __init__(self, name):
+    def __init__(self, name, backend=None):
         self.name = name
-        self.llm = LocalModelLLM()
+        self.llm = LocalModelLLM(backend=backend)
 
         # Create a prompt template and LLMChain for problem solving
-        template = "Solve the following problem: {problem}"
-        self.prompt = PromptTemplate(template=template, input_variables=["problem"])
+        template = "Solve the following problem: {problem}\n{status}"
+        self.prompt = PromptTemplate(template=template, input_variables=["problem"],
+                                     partial_variables={"status": STATUS_INSTRUCTION})
         self.chain = LLMChain(prompt=self.prompt, llm=self.llm)
-
-    async def process_message(self, message):
-        response = await self.chain.arun({"problem": message})
+        self.fresh_chain = LLMChain(prompt=self.prompt, llm=self.llm, llm_kwargs={"use_cache": False})
+        # Verdicts are sent as-is and capped to a few tokens
+        verdict_prompt = PromptTemplate(template="{prompt}", input_variables=["prompt"])
+        self.verdict_chain = LLMChain(prompt=verdict_prompt, llm=self.llm, llm_kwargs={"options": VERDICT_OPTIONS})
+
+    async def process_message(self, message, use_cache=True):
+        chain = self.chain if use_cache else self.fresh_chain
+        response = await chain.arun({"problem": message})
         return response
 
+    async def verdict(self, prompt):
+        return await self.verdict_chain.arun({"prompt": prompt})
+
 
 # Decision Orchestrator (Coordinator)
 class OrchestratorAgent:
-    def __init__(self, name):
+    def __init__(self, name, backend=None, router=None):
         self.name = name
-        self.llm = LocalModelLLM()
+        self.llm = LocalModelLLM(backend=backend)
 
         # Define the decision-making template
         template = (
@@ -71,74 +62,143 @@ class OrchestratorAgent:
         )
         self.prompt = PromptTemplate(template=template, input_variables=["problem"])
         self.chain = LLMChain(prompt=self.prompt, llm=self.llm)
+        # The local classifier decides; the model is only asked when it is unsure
+        self.router = router or Router(
+            [Strategy.SEQUENTIAL, Strategy.PARALLEL, Strategy.COLLABORATIVE], fallback=self.ask_model
+        )
+
+    async def ask_model(self, problem):
+        return await self.chain.arun({"problem": problem})
 
     async def decide_strategy(self, problem):
-        # Get the decision from the orchestrator
-        decision = await self.chain.arun({"problem": problem})
-        print(f"Orchestrator Decision: {decision}")
-        return decision
+        decision = await self.router.aroute(problem)
+        print(f"Orchestrator Decision: {decision.strategy.value} ({decision.source}, confidence {decision.confidence:.2f})")
+        return decision.strategy
 
 
 # Environment for running agents in a collaborative way
 class Environment:
-    def __init__(self):
+    def __init__(self, verification="concurrent", quorum=None, context_budget=1536, concurrency_limits=None):
         self.agents = []
-        self.conversation = []
+        self.conversation = Transcript(context_budget=context_budget)
         self.solved = False
+        self.verification = verification
+        self.quorum = quorum or QuorumPolicy("all")
+        self.concurrency_limits = {**CONCURRENCY_LIMITS, **(concurrency_limits or {})}
 
     def add_agent(self, agent):
         self.agents.append(agent)
 
     def initiate_conversation(self, prompt):
-        self.conversation.append(f"Initial Prompt: {prompt}")
-
-    async def run_conversation(self, strategy):
-        iteration_count = 0
-        max_iterations = 5  # Prevent infinite loops
-        while not self.solved and iteration_count < max_iterations:
-            iteration_count += 1
-            print(f"--- Iteration {iteration_count} ---")
+        self.conversation.append(f"Initial Prompt: {prompt}", pinned=True)
+
+    def workflow(self, strategy, max_iterations=5):
+        """The team as a graph: `max_iterations` rounds of agent turns, each verified when it claims a solution."""
+        workflow = Workflow(max_concurrency=self.concurrency_limits[strategy])
+        previous = ()
+        for iteration in range(1, max_iterations + 1):
+            if strategy == Strategy.PARALLEL:
+                previous = self.add_parallel_round(workflow, f"{iteration}", previous, iteration)
+                continue
             for i, agent in enumerate(self.agents):
-                conversation_history = "\n".join(self.conversation)
-                response = await agent.process_message(conversation_history)
-                print(f"{agent.name} response: {response}")
-                self.conversation.append(f"{agent.name}: {response}")
-                yield f"{agent.name}: {response}"
-
-                if strategy == "Collaborative Multi-Agent":
+                name = f"{iteration}.{i}.{agent.name}"
+                workflow.add(Node(name, self.turn_step(agent, iteration if i == 0 else None), after=previous))
+                previous = (name,)
+                if strategy == Strategy.COLLABORATIVE:
                     next_agent = self.agents[(i + 1) % len(self.agents)]
-                    refined_response = await next_agent.process_message(f"{response}\nAnalyze and refine the response")
-                    print(f"{next_agent.name} refined response: {refined_response}")
-                    self.conversation.append(f"{next_agent.name}: {refined_response}")
-                    yield f"{next_agent.name}: {refined_response}"
+                    workflow.add(Node(f"{name}.refine", self.refine_step(next_agent, name), after=previous))
+                    previous = (name, f"{name}.refine")
+                workflow.add(Node(f"{name}.verify", self.verify_step(name), after=previous))
+                previous = (f"{name}.verify",)
+        workflow.add(Node("end", self.end_step, after=previous))
+        return workflow
 
-                if self.validate_solution(response):
-                    self.solved = await self.verify_solution_with_agents(response)
+    async def run_conversation(self, strategy):
+        async for message in self.workflow(strategy).run():
+            yield message
+
+    def turn_step(self, agent, iteration=None):
+        async def step(ctx, inputs):
+            if iteration is not None:
+                print(f"--- Iteration {iteration} ---")
+            response = await agent.process_message(self.conversation.window())
+            print(f"{agent.name} response: {response}")
+            self.conversation.append(f"{agent.name}: {response}")
+            ctx.emit(f"{agent.name}: {response}")
+            return response
+        return step
+
+    def refine_step(self, agent, turn):
+        async def step(ctx, inputs):
+            refined_response = await agent.process_message(f"{inputs[turn]}\nAnalyze and refine the response")
+            print(f"{agent.name} refined response: {refined_response}")
+            self.conversation.append(f"{agent.name}: {refined_response}")
+            ctx.emit(f"{agent.name}: {refined_response}")
+            return refined_response
+        return step
+
+    def verify_step(self, *turns):
+        async def step(ctx, inputs):
+            for turn in turns:
+                if claims_solved(inputs[turn]):
+                    self.solved = await self.verify_solution_with_agents(inputs[turn])
                     if self.solved:
-                        yield "Solution verified, stopping conversation."
-                        return
-            if iteration_count >= max_iterations:
-                print("Max iterations reached, stopping conversation.")
-                break
-        if not self.solved:
-            print("Conversation ended without a verified solution.")
-
-    def validate_solution(self, response):
-        if "yes problem is solved" in response.lower() or "we can't solve this" in response.lower():
-            print("Validation check: Solved")
-            return True
-        print("Validation check: Not Solved")
-        return False
+                        ctx.emit("Solution verified, stopping conversation.")
+                        return Halt(True)
+            return False
+        return step
+
+    async def end_step(self, ctx, inputs):
+        print("Max iterations reached, stopping conversation.")
+        print("Conversation ended without a verified solution.")
+
+    def add_parallel_round(self, workflow, prefix, after=(), iteration=None):
+        """All agents answer the same history at once (up to the workflow's concurrency limit).
+
+        Responses are sent as each agent finishes and added to the conversation
+        in agent order, so the next round sees the same history whatever the timing.
+        """
+        names = [f"{prefix}.{i}.{agent.name}" for i, agent in enumerate(self.agents)]
+
+        async def start(ctx, inputs):
+            if iteration is not None:
+                print(f"--- Iteration {iteration} ---")
+            return self.conversation.window()
+
+        def answer_step(agent):
+            async def step(ctx, inputs):
+                response = await agent.process_message(inputs[f"{prefix}.history"])
+                print(f"{agent.name} response: {response}")
+                ctx.emit(f"{agent.name}: {response}")
+                return response
+            return step
+
+        async def merge(ctx, inputs):
+            for agent, name in zip(self.agents, names):
+                self.conversation.append(f"{agent.name}: {inputs[name]}")
+            return [inputs[name] for name in names]
+
+        workflow.add(Node(f"{prefix}.history", start, after=after))
+        for agent, name in zip(self.agents, names):
+            workflow.add(Node(name, answer_step(agent), after=(f"{prefix}.history",)))
+        workflow.add(Node(f"{prefix}.merge", merge, after=names))
+        # Responses are only checked once all are in the conversation
+        workflow.add(Node(f"{prefix}.verify", self.verify_step(*names), after=(f"{prefix}.merge", *names)))
+        return (f"{prefix}.verify",)
 
     async def verify_solution_with_agents(self, solution):
-        for agent in self.agents:
-            verification_prompt = f"The proposed solution is: {solution}\nDo you agree with this solution? If so, say 'yes problem is solved'."
-            verification_response = await agent.process_message(verification_prompt)
-            print(f"{agent.name} verification response: {verification_response}")
-            if "no" in verification_response.lower():
+        # Ask all agents for a yes/no verdict on the solution
+        async def ask(agent):
+            return await ask_verdict(agent, solution)
+
+        def approves(agent, verdict):
+            if not verdict:
                 print(f"{agent.name} does not agree with the solution.")
-                return False
-        return True
+            return verdict
+
+        if self.verification == "sequential":
+            return await verify_sequentially(self.agents, ask, approves, self.quorum)
+        return await verify_concurrently(self.agents, ask, approves, self.quorum)
 
 
 # Initialize agents
@@ -150,7 +210,14 @@ def initialize_agents():
 
 
 # Main function to run the hierarchical team of agents
-async def orchestrate_problem_solving(orchestrator, agents, prompt):
+async def orchestrate_problem_solving(orchestrator, agents, prompt, fast_path=True):
+    # Arithmetic and simple algebra need neither a strategy nor a model call
+    answer = solve_prompt(prompt) if fast_path else None
+    if answer is not None:
+        yield f"FastSolver: {answer}"
+        yield "Solution verified, stopping conversation."
+        return
+
     env = Environment()
     for agent in agents:
         env.add_agent(agent)
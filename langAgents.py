@@ -1,65 +1,55 @@
 
 import asyncio
-import subprocess
-import sys
 from langchain import LLMChain, PromptTemplate
-from langchain.llms.base import LLM
-from typing import List
-
-# Custom LLM class for your local model
-from langchain.llms.base import LLM
-class LocalModelLLM(LLM):
-    def _call(self, prompt: str, *args, **kwargs) -> str:
-        if sys.platform == "win32":
-            result = subprocess.run(
-                ["ollama", "run", "llama3"],
-                input=prompt.encode('utf-8'),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            return result.stdout.decode('utf-8')
-        else:
-            process = asyncio.run(asyncio.create_subprocess_exec(
-                "ollama", "run", "llama3",
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            ))
-            stdout, _ = asyncio.run(process.communicate(input=prompt.encode('utf-8')))
-            return stdout.decode('utf-8')
-
-    @property
-    def _llm_type(self) -> str:
-        return "local_model_llm"
-
-    @property
-    def _identifying_params(self) -> dict:
-        return {"model_name": "ollama llama3"}
+
+from consensus import (
+    STATUS_INSTRUCTION,
+    VERDICT_OPTIONS,
+    QuorumPolicy,
+    ask_verdict,
+    claims_solved,
+    verify_concurrently,
+    verify_sequentially,
+)
+from langchain_llm import LocalModelLLM
+from transcript import Transcript
+
 class ProblemSolvingAgent:
-    def __init__(self, name):
+    def __init__(self, name, backend=None):
         self.name = name
-        self.llm = LocalModelLLM()
+        self.llm = LocalModelLLM(backend=backend)
 
         # Create a prompt template and LLMChain
-        template = "Solve the following problem: {problem}"
-        self.prompt = PromptTemplate(template=template, input_variables=["problem"])
+        template = "Solve the following problem: {problem}\n{status}"
+        self.prompt = PromptTemplate(template=template, input_variables=["problem"],
+                                     partial_variables={"status": STATUS_INSTRUCTION})
         self.chain = LLMChain(prompt=self.prompt, llm=self.llm)
-
-    async def process_message(self, message):
-        response = await self.chain.arun({"problem": message})
+        self.fresh_chain = LLMChain(prompt=self.prompt, llm=self.llm, llm_kwargs={"use_cache": False})
+        # Verdicts are sent as-is and capped to a few tokens
+        verdict_prompt = PromptTemplate(template="{prompt}", input_variables=["prompt"])
+        self.verdict_chain = LLMChain(prompt=verdict_prompt, llm=self.llm, llm_kwargs={"options": VERDICT_OPTIONS})
+
+    async def process_message(self, message, use_cache=True):
+        chain = self.chain if use_cache else self.fresh_chain
+        response = await chain.arun({"problem": message})
         return response
 
+    async def verdict(self, prompt):
+        return await self.verdict_chain.arun({"prompt": prompt})
+
 class Environment:
-    def __init__(self):
+    def __init__(self, verification="concurrent", quorum=None, context_budget=1536):
         self.agents = []
-        self.conversation = []
+        self.conversation = Transcript(context_budget=context_budget)
         self.solved = False
+        self.verification = verification
+        self.quorum = quorum or QuorumPolicy("all")
 
     def add_agent(self, agent):
         self.agents.append(agent)
 
     def initiate_conversation(self, prompt):
-        self.conversation.append(f"Initial Prompt: {prompt}")
+        self.conversation.append(f"Initial Prompt: {prompt}", pinned=True)
 
     async def run_conversation(self):
         iteration_count = 0
@@ -68,14 +58,14 @@ class Environment:
             iteration_count += 1
             print(f"--- Iteration {iteration_count} ---")
             for i, agent in enumerate(self.agents):
-                # Share the entire conversation history with each agent
-                conversation_history = "\n".join(self.conversation)
+                # Share the conversation history (within the context budget) with each agent
+                conversation_history = self.conversation.window()
                 response = await agent.process_message(conversation_history)
                 print(f"{agent.name} response: {response}")
                 self.conversation.append(f"{agent.name}: {response}")
                 yield f"{agent.name}: {response}"
 
-                if self.validate_solution(response):
+                if claims_solved(response):
                     self.solved = await self.verify_solution_with_agents(response)
                     if self.solved:
                         yield "Solution verified, stopping conversation."
@@ -86,24 +76,19 @@ class Environment:
         if not self.solved:
             print("Conversation ended without a verified solution.")
 
-    def validate_solution(self, response):
-        # Check if the response contextually solves the problem by asking if it's solved
-        if "yes problem is solved" in response.lower() or "we can't solve this" in response.lower():
-            print("Validation check: Solved")
-            return True
-        print("Validation check: Not Solved")
-        return False
-
     async def verify_solution_with_agents(self, solution):
-        # Ask all agents if they agree with the solution
-        for agent in self.agents:
-            verification_prompt = f"The proposed solution is: {solution}\nDo you agree with this solution? If so, say 'yes problem is solved' and explain why. If you can't solve the problem, say 'we can't solve this'. If not, explain why not."
-            verification_response = await agent.process_message(verification_prompt)
-            print(f"{agent.name} verification response: {verification_response}")
-            if "no" in verification_response.lower():
+        # Ask all agents for a yes/no verdict on the solution
+        async def ask(agent):
+            return await ask_verdict(agent, solution)
+
+        def approves(agent, verdict):
+            if not verdict:
                 print(f"{agent.name} does not agree with the solution.")
-                return False
-        return True
+            return verdict
+
+        if self.verification == "sequential":
+            return await verify_sequentially(self.agents, ask, approves, self.quorum)
+        return await verify_concurrently(self.agents, ask, approves, self.quorum)
 
 def initialize_agents():
     agent1 = ProblemSolvingAgent("Agent1")
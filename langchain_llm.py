@@ -0,0 +1,83 @@
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain.llms.base import LLM
+from langchain_core.outputs import GenerationChunk
+
+from llm_backend import get_backend
+from response_cache import ResponseCache, get_response_cache
+
+
+class LocalModelLLM(LLM):
+    """LangChain LLM adapter over the shared llm_backend.
+
+    `_call` and `_acall` map to the backend's native sync and async entry
+    points, so chains awaited from the FastAPI event loop never block it or
+    start a nested loop.
+    """
+
+    backend: Any = None
+    # Response cache shared with the other agents; False disables it. Pass
+    # use_cache=False (e.g. through LLMChain.llm_kwargs) to force a fresh sample.
+    response_cache: Any = None
+
+    def _get_backend(self):
+        return self.backend if self.backend is not None else get_backend()
+
+    def _get_cache(self):
+        if self.response_cache is None:
+            return get_response_cache()
+        return self.response_cache or None
+
+    def _options(self, stop, options=None):
+        # `options` (e.g. through LLMChain.llm_kwargs) are passed on to the model as-is
+        merged = {**(options or {}), **({"stop": stop} if stop else {})}
+        return merged or None
+
+    def _cache_key(self, prompt, options):
+        cache = self._get_cache()
+        if cache is None:
+            return None, None
+        return cache, ResponseCache.make_key(self._get_backend().config.model, prompt, options)
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, use_cache: bool = True, options: Optional[dict] = None, **kwargs: Any) -> str:
+        options = self._options(stop, options)
+        cache, key = self._cache_key(prompt, options)
+        cached = cache.get(key) if cache is not None and use_cache else None
+        if cached is not None:
+            return cached
+        response = self._get_backend().generate(prompt, options)
+        if cache is not None:
+            cache.put(key, response)
+        return response
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, use_cache: bool = True, options: Optional[dict] = None, **kwargs: Any) -> str:
+        options = self._options(stop, options)
+        cache, key = self._cache_key(prompt, options)
+        # aget keeps a disk-tier lookup off the event loop
+        cached = await cache.aget(key) if cache is not None and use_cache else None
+        if cached is not None:
+            return cached
+        response = await self._get_backend().agenerate(prompt, options)
+        if cache is not None:
+            cache.put(key, response)
+        return response
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, options: Optional[dict] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        for delta in self._get_backend().stream(prompt, self._options(stop, options)):
+            if run_manager:
+                run_manager.on_llm_new_token(delta)
+            yield GenerationChunk(text=delta)
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, options: Optional[dict] = None, **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        async for delta in self._get_backend().astream(prompt, self._options(stop, options)):
+            if run_manager:
+                await run_manager.on_llm_new_token(delta)
+            yield GenerationChunk(text=delta)
+
+    @property
+    def _llm_type(self) -> str:
+        return "local_model_llm"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": f"ollama {self._get_backend().config.model}"}
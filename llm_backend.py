@@ -0,0 +1,728 @@
+import abc
+import asyncio
+import codecs
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, replace
+
+import httpx
+
+import telemetry
+
+
+class LLMBackendError(RuntimeError):
+    """Raised when a backend fails to produce a response."""
+
+
+@dataclass(frozen=True)
+class BackendConfig:
+    kind: str = "http"  # "http" (Ollama REST API) or "subprocess" (`ollama run`)
+    model: str = "llama3"
+    base_url: str = "http://localhost:11434"
+    connect_timeout: float = 5.0
+    read_timeout: float = 300.0
+    max_connections: int = 8
+    max_keepalive_connections: int = 8
+    keepalive_expiry: float = 60.0
+    keep_alive: str = "5m"  # How long the Ollama server keeps the model loaded after a call
+    batch_size: int = 1  # Above 1, concurrent calls are micro-batched (see BatchingBackend)
+    batch_wait: float = 0.005  # Seconds to wait for a batch to fill
+    # Several Ollama nodes (see PooledBackend); base_url is ignored when two or more are set,
+    # and a single entry is used as base_url
+    base_urls: tuple = ()
+    affinity: bool = True  # Keep each conversation on the node that holds its KV cache
+    retries: int = 1  # Further nodes to try after a node fails a call
+    failure_threshold: int = 3  # Consecutive failures that open a node's circuit
+    circuit_cooldown: float = 30.0  # Seconds before an open circuit lets a trial call through
+    health_interval: float = 10.0  # Seconds between active health checks, 0 for none
+
+    def __post_init__(self):
+        if len(self.base_urls) == 1:
+            # One node needs no pool, but must not fall back to the default base_url
+            object.__setattr__(self, "base_url", self.base_urls[0])
+            object.__setattr__(self, "base_urls", ())
+
+    @classmethod
+    def from_env(cls):
+        """Build a config from LLM_BACKEND / OLLAMA_* environment variables."""
+        env = os.environ
+        return cls(
+            kind=env.get("LLM_BACKEND", cls.kind),
+            model=env.get("OLLAMA_MODEL", cls.model),
+            base_url=env.get("OLLAMA_BASE_URL", cls.base_url),
+            connect_timeout=float(env.get("OLLAMA_CONNECT_TIMEOUT", cls.connect_timeout)),
+            read_timeout=float(env.get("OLLAMA_READ_TIMEOUT", cls.read_timeout)),
+            max_connections=int(env.get("OLLAMA_MAX_CONNECTIONS", cls.max_connections)),
+            max_keepalive_connections=int(env.get("OLLAMA_MAX_KEEPALIVE", cls.max_keepalive_connections)),
+            keepalive_expiry=float(env.get("OLLAMA_KEEPALIVE_EXPIRY", cls.keepalive_expiry)),
+            keep_alive=env.get("OLLAMA_KEEP_ALIVE", cls.keep_alive),
+            batch_size=int(env.get("OLLAMA_BATCH_SIZE", cls.batch_size)),
+            batch_wait=float(env.get("OLLAMA_BATCH_WAIT_MS", cls.batch_wait * 1000)) / 1000,
+            base_urls=tuple(url.strip() for url in env.get("OLLAMA_BASE_URLS", "").split(",") if url.strip()),
+            affinity=env.get("OLLAMA_AFFINITY", "1") != "0",
+            retries=int(env.get("OLLAMA_RETRIES", cls.retries)),
+            failure_threshold=int(env.get("OLLAMA_FAILURE_THRESHOLD", cls.failure_threshold)),
+            circuit_cooldown=float(env.get("OLLAMA_CIRCUIT_COOLDOWN", cls.circuit_cooldown)),
+            health_interval=float(env.get("OLLAMA_HEALTH_INTERVAL", cls.health_interval)),
+        )
+
+
+def parse_duration(value):
+    """Seconds for an Ollama keep_alive duration ("5m", "30s", "1h", "300"); None means forever."""
+    value = str(value).strip()
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value and value[-1] in units:
+        seconds = float(value[:-1]) * units[value[-1]]
+    else:
+        seconds = float(value)
+    return None if seconds < 0 else seconds
+
+
+class ModelSession:
+    """Conversation state held by the model server between calls (Ollama's `context` tokens).
+
+    Passing a session to `agenerate`/`astream` sends the stored context with the
+    prompt and stores the context returned by the server, so the next call only
+    needs to submit the new suffix of the conversation.
+    """
+
+    def __init__(self):
+        self.context = None
+        self.last_used = 0.0
+        self.node = None  # The PooledBackend node holding this context in its KV cache
+
+    @property
+    def tokens(self):
+        return len(self.context) if self.context else 0
+
+    def update(self, context):
+        self.context = context
+        self.last_used = time.monotonic()
+
+    def reset(self):
+        self.context = None
+
+
+class LLMBackend(abc.ABC):
+    """Common interface of every backend: native async and sync entry points.
+
+    Async callers (agents, FastAPI) use `agenerate`/`astream`; sync callers
+    (scripts, LangChain `_call`) use `generate`/`stream`. No entry point runs
+    a nested event loop. Backends that cannot carry context between calls
+    leave a passed `session` untouched. A backend must implement `agenerate`
+    and `generate`; the streaming entry points default to a single chunk.
+    """
+
+    @abc.abstractmethod
+    async def agenerate(self, prompt, options=None, session=None):
+        raise NotImplementedError
+
+    async def astream(self, prompt, options=None, session=None):
+        yield await self.agenerate(prompt, options, session)
+
+    @abc.abstractmethod
+    def generate(self, prompt, options=None, session=None):
+        raise NotImplementedError
+
+    def stream(self, prompt, options=None, session=None):
+        yield self.generate(prompt, options, session)
+
+    async def aload(self):
+        """Load the model and reset its keep-alive timer without generating. No-op where unsupported."""
+
+    async def ahealthy(self):
+        """Whether the server answers; backends without a cheap probe report True."""
+        return True
+
+    async def aclose(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SubprocessBackend(LLMBackend):
+    """Runs `ollama run <model>` once per call.
+
+    `ollama run` takes no sampling options: only "format" (e.g. the JSON
+    verdicts) is passed on, as --format; num_predict, temperature and the
+    other options are ignored, so verdicts are not capped on this backend.
+    The child process is killed when its caller is cancelled or stops reading.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or BackendConfig(kind="subprocess")
+
+    def _command(self, options):
+        command = ["ollama", "run", self.config.model]
+        if options and options.get("format"):
+            command += ["--format", options["format"]]
+        return command
+
+    def generate(self, prompt, options=None, session=None):
+        result = subprocess.run(
+            self._command(options),
+            input=prompt.encode('utf-8'),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        return result.stdout.decode('utf-8')
+
+    @staticmethod
+    async def _kill(process):
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+    async def agenerate(self, prompt, options=None, session=None):
+        if sys.platform == "win32":
+            # The selector event loop used on Windows cannot spawn subprocesses,
+            # so the blocking call runs on a worker thread instead of the loop.
+            return await asyncio.to_thread(self.generate, prompt, options)
+        process = await asyncio.create_subprocess_exec(
+            *self._command(options),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await process.communicate(input=prompt.encode('utf-8'))
+        finally:
+            await self._kill(process)
+        return stdout.decode('utf-8')
+
+    async def astream(self, prompt, options=None, session=None):
+        if sys.platform == "win32":
+            yield await self.agenerate(prompt, options)
+            return
+        process = await asyncio.create_subprocess_exec(
+            *self._command(options),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            process.stdin.write(prompt.encode('utf-8'))
+            await process.stdin.drain()
+            process.stdin.close()
+            # Decode incrementally so multi-byte characters split across reads are not mangled
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            while True:
+                chunk = await process.stdout.read(256)
+                if not chunk:
+                    break
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+            await process.wait()
+        finally:
+            await self._kill(process)
+
+
+class OllamaHTTPBackend(LLMBackend):
+    """Talks to the Ollama REST API over a long-lived, bounded keep-alive connection pool."""
+
+    def __init__(self, config=None):
+        self.config = config or BackendConfig()
+        self._client = None
+        self._client_loop = None
+        self._sync_client = None
+
+    def _get_client(self):
+        # httpx clients are bound to the event loop they were created on, so a new
+        # pool is opened if we are called from a different loop (e.g. successive asyncio.run calls).
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(**self._client_kwargs())
+            self._client_loop = loop
+        return self._client
+
+    def _get_sync_client(self):
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(**self._client_kwargs())
+        return self._sync_client
+
+    def _client_kwargs(self):
+        return dict(
+            base_url=self.config.base_url,
+            timeout=httpx.Timeout(self.config.read_timeout, connect=self.config.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=self.config.max_connections,
+                max_keepalive_connections=self.config.max_keepalive_connections,
+                keepalive_expiry=self.config.keepalive_expiry,
+            ),
+        )
+
+    def _payload(self, prompt, options, stream, session=None):
+        payload = {
+            "model": self.config.model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.config.keep_alive,
+        }
+        options = dict(options or {})
+        # "format" (e.g. "json") constrains the output; Ollama takes it next to the options
+        if "format" in options:
+            payload["format"] = options.pop("format")
+        if options:
+            payload["options"] = options
+        if session is not None and session.context:
+            payload["context"] = session.context
+        return payload
+
+    def _parse_chunk(self, line, session):
+        chunk = json.loads(line)
+        if "error" in chunk:
+            raise LLMBackendError(f"Ollama stream from {self.config.base_url} failed: {chunk['error']}")
+        if chunk.get("done") and session is not None:
+            session.update(chunk.get("context"))
+        return chunk
+
+    def _response_text(self, response, session):
+        body = response.json()
+        if session is not None:
+            session.update(body.get("context"))
+        return body.get("response", "")
+
+    async def agenerate(self, prompt, options=None, session=None):
+        client = self._get_client()
+        try:
+            response = await client.post("/api/generate", json=self._payload(prompt, options, False, session))
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise LLMBackendError(f"Ollama request to {self.config.base_url} failed: {e}") from e
+        return self._response_text(response, session)
+
+    async def aload(self):
+        # A request without a prompt only loads the model (and refreshes keep_alive)
+        client = self._get_client()
+        try:
+            response = await client.post(
+                "/api/generate", json={"model": self.config.model, "keep_alive": self.config.keep_alive}
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise LLMBackendError(f"Loading {self.config.model} on {self.config.base_url} failed: {e}") from e
+
+    async def ahealthy(self):
+        try:
+            response = await self._get_client().get("/api/tags")
+            response.raise_for_status()
+        except httpx.HTTPError:
+            return False
+        return True
+
+    async def astream(self, prompt, options=None, session=None):
+        """Yield response text as the model generates it."""
+        client = self._get_client()
+        try:
+            async with client.stream("POST", "/api/generate", json=self._payload(prompt, options, True, session)) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = self._parse_chunk(line, session)
+                    if chunk.get("response"):
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        return
+        except httpx.HTTPError as e:
+            raise LLMBackendError(f"Ollama request to {self.config.base_url} failed: {e}") from e
+
+    def generate(self, prompt, options=None, session=None):
+        client = self._get_sync_client()
+        try:
+            response = client.post("/api/generate", json=self._payload(prompt, options, False, session))
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise LLMBackendError(f"Ollama request to {self.config.base_url} failed: {e}") from e
+        return self._response_text(response, session)
+
+    def stream(self, prompt, options=None, session=None):
+        client = self._get_sync_client()
+        try:
+            with client.stream("POST", "/api/generate", json=self._payload(prompt, options, True, session)) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = self._parse_chunk(line, session)
+                    if chunk.get("response"):
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        return
+        except httpx.HTTPError as e:
+            raise LLMBackendError(f"Ollama request to {self.config.base_url} failed: {e}") from e
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._client_loop = None
+        self.close()
+
+    def close(self):
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+
+class BatchingBackend(LLMBackend):
+    """Micro-batches concurrent calls from all sessions in front of another backend.
+
+    Ollama has no batch endpoint, but with OLLAMA_NUM_PARALLEL > 1 it decodes
+    the requests it has in flight as one batch. Calls (streamed or not) are
+    held for up to `max_wait` seconds or until `max_batch` are waiting, then
+    released together so they reach the server as a batch. Each caller runs
+    its own request, so cancelling a caller cancels its request. Sync calls
+    pass straight through.
+    """
+
+    def __init__(self, backend, max_batch=8, max_wait=0.005):
+        self.backend = backend
+        self.config = backend.config
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self._waiting = []  # Futures of the calls held for the next batch
+        self._flush_handle = None
+
+    async def _join_batch(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiting.append(future)
+        if len(self._waiting) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future in self._waiting:
+                self._waiting.remove(future)
+            raise
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._waiting = self._waiting, []
+        if batch:
+            self.batches += 1
+            for future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    async def agenerate(self, prompt, options=None, session=None):
+        await self._join_batch()
+        return await self.backend.agenerate(prompt, options, session)
+
+    async def astream(self, prompt, options=None, session=None):
+        await self._join_batch()
+        async for delta in self.backend.astream(prompt, options, session):
+            yield delta
+
+    def generate(self, prompt, options=None, session=None):
+        return self.backend.generate(prompt, options, session)
+
+    def stream(self, prompt, options=None, session=None):
+        yield from self.backend.stream(prompt, options, session)
+
+    async def aload(self):
+        await self.backend.aload()
+
+    async def ahealthy(self):
+        return await self.backend.ahealthy()
+
+    async def aclose(self):
+        await self.backend.aclose()
+
+    def close(self):
+        self.backend.close()
+
+
+POOL_OUTSTANDING = telemetry.REGISTRY.gauge("llm_node_outstanding_requests", "Calls in flight per LLM node.", ["node"])
+POOL_CIRCUIT_OPEN = telemetry.REGISTRY.gauge("llm_node_circuit_open", "1 while an LLM node's circuit is open.", ["node"])
+POOL_FAILURES = telemetry.REGISTRY.counter("llm_node_failures_total", "Failed calls per LLM node.", ["node"])
+POOL_RETRIES = telemetry.REGISTRY.counter("llm_pool_retries_total", "Calls retried on another LLM node.")
+
+
+def _node_failure(error):
+    # A 4xx (e.g. a context the server rejects) is the request's fault, not the node's
+    cause = error.__cause__
+    return not (isinstance(cause, httpx.HTTPStatusError) and 400 <= cause.response.status_code < 500)
+
+
+class PoolNode:
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.config.base_url
+        self.outstanding = 0
+        self.failures = 0  # Consecutive failed calls
+        self.open_until = 0.0  # The circuit lets no calls through before this (monotonic) time
+        self.trial = False  # A half-open trial call is in flight
+
+    def available(self, now, threshold):
+        if self.failures < threshold:
+            return True
+        return now >= self.open_until and not self.trial
+
+
+class PooledBackend(LLMBackend):
+    """Spreads calls over several nodes, sending each to the one with the fewest outstanding requests.
+
+    Passive health: `failure_threshold` consecutive failures open a node's
+    circuit for `circuit_cooldown` seconds, after which one trial call decides
+    whether it closes again. Active health: every `health_interval` seconds each
+    node is probed and its circuit opened or closed accordingly. A call that
+    fails on a node is retried on up to `retries` other nodes (streams only
+    until the first chunk). With `affinity`, a session's calls stay on the node
+    holding its context in the KV cache while that node is available; Ollama
+    context tokens are valid on any node, so moving a session costs only the
+    cache.
+    """
+
+    def __init__(self, backends, config=None, affinity=True, retries=1, failure_threshold=3, circuit_cooldown=30.0,
+                 health_interval=0.0):
+        self.nodes = [PoolNode(backend) for backend in backends]
+        self.config = config or self.nodes[0].backend.config
+        self.affinity = affinity
+        self.retries = retries
+        self.failure_threshold = failure_threshold
+        self.circuit_cooldown = circuit_cooldown
+        self.health_interval = health_interval
+        self._next = 0  # Rotates ties between equally loaded nodes
+        self._lock = threading.Lock()  # Sync callers run in threads
+        self._health_task = None
+
+    @classmethod
+    def from_config(cls, config):
+        nodes = [create_backend(replace(config, base_url=url, base_urls=(), batch_size=1)) for url in config.base_urls]
+        return cls(nodes, config, affinity=config.affinity, retries=config.retries,
+                   failure_threshold=config.failure_threshold, circuit_cooldown=config.circuit_cooldown,
+                   health_interval=config.health_interval)
+
+    def _acquire(self, session, tried):
+        now = time.monotonic()
+        with self._lock:
+            candidates = [node for node in self.nodes if node not in tried and node.available(now, self.failure_threshold)]
+            if not candidates:
+                raise LLMBackendError("No LLM node is available")
+            pinned = session.node if self.affinity and session is not None else None
+            node = next((node for node in candidates if node.name == pinned), None)
+            if node is None:
+                start = self._next % len(candidates)
+                self._next += 1
+                node = min(candidates[start:] + candidates[:start], key=lambda node: node.outstanding)
+            if node.failures >= self.failure_threshold:
+                node.trial = True
+            node.outstanding += 1
+            POOL_OUTSTANDING.set(node.outstanding, node=node.name)
+        return node
+
+    def _release(self, node, session=None, error=None):
+        with self._lock:
+            node.outstanding -= 1
+            node.trial = False
+            POOL_OUTSTANDING.set(node.outstanding, node=node.name)
+            if error is None:
+                if session is not None:
+                    session.node = node.name
+                self._close(node)
+            elif _node_failure(error):
+                POOL_FAILURES.inc(node=node.name)
+                node.failures += 1
+                if node.failures >= self.failure_threshold:
+                    self._open(node)
+
+    def _abandon(self, node):
+        # The caller went away (cancelled, or stopped reading a stream): no verdict on the node
+        with self._lock:
+            node.outstanding -= 1
+            node.trial = False
+            POOL_OUTSTANDING.set(node.outstanding, node=node.name)
+
+    def _open(self, node):
+        node.open_until = time.monotonic() + self.circuit_cooldown
+        POOL_CIRCUIT_OPEN.set(1, node=node.name)
+
+    def _close(self, node):
+        node.failures = 0
+        node.open_until = 0.0
+        POOL_CIRCUIT_OPEN.set(0, node=node.name)
+
+    def _retry(self, error, tried):
+        """Whether a failed call goes to another node; raises `error` when it does not."""
+        if not _node_failure(error) or len(tried) > self.retries:
+            raise error
+        POOL_RETRIES.inc()
+
+    def _next_node(self, session, tried, error):
+        try:
+            return self._acquire(session, tried)
+        except LLMBackendError:
+            if error is not None:
+                raise error
+            raise
+
+    async def agenerate(self, prompt, options=None, session=None):
+        self._start_health_checks()
+        tried, error = [], None
+        while True:
+            node = self._next_node(session, tried, error)
+            try:
+                result = await node.backend.agenerate(prompt, options, session)
+            except LLMBackendError as e:
+                self._release(node, error=e)
+                tried.append(node)
+                error = e
+                self._retry(e, tried)
+                continue
+            except BaseException:
+                self._abandon(node)
+                raise
+            self._release(node, session)
+            return result
+
+    async def astream(self, prompt, options=None, session=None):
+        self._start_health_checks()
+        tried, error = [], None
+        while True:
+            node = self._next_node(session, tried, error)
+            started = False
+            try:
+                async for delta in node.backend.astream(prompt, options, session):
+                    started = True
+                    yield delta
+            except LLMBackendError as e:
+                self._release(node, error=e)
+                tried.append(node)
+                error = e
+                if started:
+                    raise
+                self._retry(e, tried)
+                continue
+            except BaseException:
+                self._abandon(node)
+                raise
+            self._release(node, session)
+            return
+
+    def generate(self, prompt, options=None, session=None):
+        tried, error = [], None
+        while True:
+            node = self._next_node(session, tried, error)
+            try:
+                result = node.backend.generate(prompt, options, session)
+            except LLMBackendError as e:
+                self._release(node, error=e)
+                tried.append(node)
+                error = e
+                self._retry(e, tried)
+                continue
+            except BaseException:
+                self._abandon(node)
+                raise
+            self._release(node, session)
+            return result
+
+    def stream(self, prompt, options=None, session=None):
+        tried, error = [], None
+        while True:
+            node = self._next_node(session, tried, error)
+            started = False
+            try:
+                for delta in node.backend.stream(prompt, options, session):
+                    started = True
+                    yield delta
+            except LLMBackendError as e:
+                self._release(node, error=e)
+                tried.append(node)
+                error = e
+                if started:
+                    raise
+                self._retry(e, tried)
+                continue
+            except BaseException:
+                self._abandon(node)
+                raise
+            self._release(node, session)
+            return
+
+    async def aload(self):
+        # Every node serves traffic, so every node loads the model
+        results = await asyncio.gather(*(node.backend.aload() for node in self.nodes), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if len(errors) == len(self.nodes):
+            raise errors[0]
+
+    async def ahealthy(self):
+        return any(await asyncio.gather(*(node.backend.ahealthy() for node in self.nodes)))
+
+    async def check_health(self):
+        """Probe every node, opening the circuit of those that do not answer and closing the others'."""
+        results = await asyncio.gather(*(node.backend.ahealthy() for node in self.nodes))
+        with self._lock:
+            for node, healthy in zip(self.nodes, results):
+                if healthy:
+                    self._close(node)
+                else:
+                    node.failures = max(node.failures, self.failure_threshold)
+                    self._open(node)
+        return results
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health()
+
+    def _start_health_checks(self):
+        if not self.health_interval:
+            return
+        loop = asyncio.get_running_loop()
+        if self._health_task is None or self._health_task.done() or self._health_task.get_loop() is not loop:
+            self._health_task = loop.create_task(self._health_loop())
+
+    async def aclose(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for node in self.nodes:
+            await node.backend.aclose()
+
+    def close(self):
+        for node in self.nodes:
+            node.backend.close()
+
+
+_backends = {}
+
+
+def create_backend(config=None):
+    config = config or BackendConfig.from_env()
+    if len(config.base_urls) > 1:
+        backend = PooledBackend.from_config(config)
+    elif config.kind == "http":
+        backend = OllamaHTTPBackend(config)
+    elif config.kind == "subprocess":
+        backend = SubprocessBackend(config)
+    else:
+        raise ValueError(f"Unknown LLM backend kind: {config.kind!r}")
+    if config.batch_size > 1:
+        backend = BatchingBackend(backend, max_batch=config.batch_size, max_wait=config.batch_wait)
+    return backend
+
+
+def get_backend(config=None):
+    """Return the shared backend for a config, so every agent reuses one connection pool."""
+    config = config or BackendConfig.from_env()
+    if config not in _backends:
+        _backends[config] = create_backend(config)
+    return _backends[config]
@@ -0,0 +1,260 @@
+"""End-to-end load test for the /solve SSE endpoint.
+
+Opens up to --clients concurrent /solve streams, arriving at --rate requests per
+second (Poisson arrivals; 0 starts them as fast as slots free up), with prompts
+drawn from a mix. Without --url it starts `uvicorn main:app` against the fake
+Ollama server, so no model is needed:
+
+    python loadtest.py --clients 200 --requests 1000 --rate 50
+    python loadtest.py --url http://localhost:8000 --prompts prompts.txt
+    python loadtest.py --replay prompt_log.jsonl --speed 10
+
+Reports time to first event, gaps between events and total stream duration
+percentiles, and the rate of errors and 429/503 rejections. A replay log has
+one JSON object per line with a `prompt` and a `timestamp` in seconds; arrivals
+keep the recorded spacing divided by --speed.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from fake_ollama import FakeOllamaServer
+
+# Every default prompt goes through the model: arithmetic would be answered by the fast path
+DEFAULT_PROMPTS = [
+    "Explain how you would check that 1+1 equals 2.",
+    "What is the capital of France?",
+    "Explain the difference between a process and a thread.",
+    # {n} makes every request unique, so it is not coalesced with another one in flight
+    "Write a haiku about request number {n}.",
+]
+
+
+class StreamResult:
+    def __init__(self, prompt):
+        self.prompt = prompt
+        self.status = None
+        self.error = None
+        self.started = None
+        self.event_times = []
+        self.finished = None
+
+    @property
+    def time_to_first_event(self):
+        return self.event_times[0] - self.started if self.event_times else None
+
+    @property
+    def gaps(self):
+        return [later - earlier for earlier, later in zip(self.event_times, self.event_times[1:])]
+
+    @property
+    def duration(self):
+        return self.finished - self.started if self.finished is not None else None
+
+
+async def run_stream(client, prompt, client_id):
+    result = StreamResult(prompt)
+    result.started = time.perf_counter()
+    try:
+        async with client.stream("GET", "/solve", params={"prompt": prompt}, headers={"X-Client-Id": client_id}) as response:
+            result.status = response.status_code
+            if response.status_code != 200:
+                await response.aread()
+                return result
+            pending = False
+            async for line in response.aiter_lines():
+                # An SSE event ends at a blank line
+                if line:
+                    pending = True
+                elif pending:
+                    result.event_times.append(time.perf_counter())
+                    pending = False
+            if pending:
+                result.event_times.append(time.perf_counter())
+    except (httpx.HTTPError, OSError) as e:
+        result.error = f"{type(e).__name__}: {e}"
+    finally:
+        result.finished = time.perf_counter()
+    return result
+
+
+def poisson_arrivals(prompts, requests, rate):
+    offset = 0.0
+    for n in range(requests):
+        yield offset, random.choice(prompts).format(n=n)
+        if rate > 0:
+            offset += random.expovariate(rate)
+
+
+def replay_arrivals(path, speed):
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records:
+        return
+    start = records[0].get("timestamp", 0.0)
+    for record in records:
+        yield (record.get("timestamp", start) - start) / speed, record["prompt"]
+
+
+async def run_load(client, arrivals, clients=100, client_ids=None):
+    """Run every (offset, prompt) arrival with at most `clients` streams open at once."""
+    slots = asyncio.Semaphore(clients)
+    client_ids = client_ids or clients
+    begin = time.perf_counter()
+    tasks = []
+
+    async def limited(prompt, client_id):
+        async with slots:
+            return await run_stream(client, prompt, client_id)
+
+    for n, (offset, prompt) in enumerate(arrivals):
+        delay = begin + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(limited(prompt, f"loadtest-{n % client_ids}")))
+    results = await asyncio.gather(*tasks)
+    return results, time.perf_counter() - begin
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """Nearest-rank percentiles in milliseconds."""
+    if not values:
+        return {f"p{point}": None for point in points}
+    ordered = sorted(values)
+    report = {}
+    for point in points:
+        index = max(0, -(-point * len(ordered) // 100) - 1)
+        report[f"p{point}"] = round(1000 * ordered[index], 2)
+    report["max"] = round(1000 * ordered[-1], 2)
+    return report
+
+
+def summarize(results, elapsed):
+    total = len(results)
+    ok = [result for result in results if result.status == 200 and result.error is None]
+    statuses = {}
+    for result in results:
+        if result.status is not None:
+            statuses[str(result.status)] = statuses.get(str(result.status), 0) + 1
+    errors = sum(1 for result in results if result.error is not None)
+
+    def rate(count):
+        return round(count / total, 4) if total else 0.0
+
+    return {
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+        "statuses": statuses,
+        "error_rate": rate(errors),
+        "rate_429": rate(statuses.get("429", 0)),
+        "rate_503": rate(statuses.get("503", 0)),
+        "time_to_first_event_ms": percentiles([r.time_to_first_event for r in ok if r.time_to_first_event is not None]),
+        "inter_event_gap_ms": percentiles(list(itertools.chain.from_iterable(r.gaps for r in ok))),
+        "stream_duration_ms": percentiles([r.duration for r in ok]),
+        "events_per_stream": round(sum(len(r.event_times) for r in ok) / len(ok), 2) if ok else 0,
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_until_up(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while True:
+            try:
+                await client.get("/openapi.json")
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Server at {url} did not start within {timeout} seconds")
+                await asyncio.sleep(0.1)
+
+
+def start_local_server(fake, port):
+    """Start `uvicorn main:app` against the fake Ollama server.
+
+    The response cache is off, so repeated prompts are measured end to end instead of as cache hits.
+    """
+    env = dict(os.environ, OLLAMA_BASE_URL=fake.base_url, LLM_BACKEND="http", RESPONSE_CACHE_SIZE="0")
+    env.pop("RESPONSE_CACHE_DB", None)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL,  # main.py prints every message it sends
+    )
+
+
+async def main_async(args, url):
+    if args.replay:
+        arrivals = replay_arrivals(args.replay, args.speed)
+    else:
+        prompts = DEFAULT_PROMPTS
+        if args.prompts:
+            with open(args.prompts) as f:
+                prompts = [line.strip() for line in f if line.strip()]
+        arrivals = poisson_arrivals(prompts, args.requests, args.rate)
+
+    await wait_until_up(url)
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    timeout = httpx.Timeout(args.timeout, connect=10.0)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        results, elapsed = await run_load(client, arrivals, args.clients, args.client_ids)
+    return summarize(results, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Server to test; by default a local server backed by the fake model is started")
+    parser.add_argument("--clients", type=int, default=100, help="Maximum concurrent streams")
+    parser.add_argument("--client-ids", type=int, default=None, help="Distinct X-Client-Id values (default: --clients)")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=0.0, help="Mean arrivals per second, 0 for no pacing")
+    parser.add_argument("--prompts", help="File with one prompt per line; {n} is replaced by the request number")
+    parser.add_argument("--replay", help="JSONL prompt log to replay instead of generated arrivals")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed-up factor")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Read timeout per stream, in seconds")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake model latency per call, in seconds")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="Fake model delay between tokens, in seconds")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    fake = server = None
+    url = args.url
+    if url is None:
+        fake = FakeOllamaServer(latency=args.latency, token_delay=args.token_delay).start()
+        port = free_port()
+        server = start_local_server(fake, port)
+        url = f"http://127.0.0.1:{port}"
+    try:
+        report = asyncio.run(main_async(args, url))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if fake is not None:
+            fake.stop()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
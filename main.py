@@ -1,11 +1,30 @@
-from fastapi import FastAPI
+from typing import Optional
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from agents import initialize_agents, orchestrate_problem_solving
+from coalescing import RunRegistry
+from scheduler import AdmissionScheduler, QueueFullError
+from session_log import format_event_id, get_session_log, new_session_id, parse_event_id
+from warmup import ModelWarmer
 import asyncio
+import contextlib
+import json
+import telemetry
 
-app = FastAPI()
+# Loads and warms up the model(s) in the background at startup, then keeps them resident
+# (WARMUP, OLLAMA_PRELOAD_MODELS, OLLAMA_PING_INTERVAL); /readyz reports when they are warm.
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    app.state.warmer = ModelWarmer.from_env()
+    app.state.warmer.start()
+    try:
+        yield
+    finally:
+        await app.state.warmer.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS middleware for allowing requests from all origins.
 app.add_middleware(
@@ -19,19 +38,157 @@ app.add_middleware(
 class Prompt(BaseModel):
     prompt: str
 
-# Generator for streaming messages to frontend
-async def message_stream(agents, prompt):
-    async for message in orchestrate_problem_solving(agents, prompt):
-        # Log the message being sent to the frontend
-        print(f"Sending message: {message}")
+# Admission control: caps concurrent orchestrations globally and per client (SOLVE_* environment variables)
+scheduler = AdmissionScheduler.from_env()
+# In-flight orchestrations, shared by identical /solve prompts
+runs = RunRegistry()
+# Every event of every session, so dropped streams can resume and finished ones be replayed
+# (SESSION_LOG_DB, SESSION_LOG_MAX_SESSIONS); writes are queued, so logging never blocks the loop
+session_log = get_session_log()
+
+# Stop proxies from buffering the stream, which would delay the first tokens
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+ACTIVE_RUNS = telemetry.REGISTRY.gauge("solve_active_runs", "Orchestrations currently running.")
+QUEUED_RUNS = telemetry.REGISTRY.gauge("solve_queued_runs", "Orchestrations waiting for admission.")
+
+# Format one orchestration event as a server-sent event
+def format_sse(message, event_id=None):
+    # The id is echoed back by the browser in Last-Event-ID when it reconnects
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    if isinstance(message, dict):
+        # Token deltas, queue updates and workflow node completions go out as named events
+        # so EventSource.onmessage keeps receiving only complete agent messages.
+        return f"{prefix}event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+
+    # Log the message being sent to the frontend
+    print(f"Sending message: {message}")
+
+    # Split message into lines and prefix each with 'data:'
+    message_lines = message.strip().splitlines()
+    return prefix + '\n'.join(f"data: {line}" for line in message_lines) + '\n\n'
+
+# Waits for an admission slot, reporting the queue position, then runs the orchestration
+async def admitted_events(ticket, prompt, trace_id=None):
+    telemetry.current_trace.set(trace_id)
+    try:
+        async for position in ticket.wait():
+            yield {"type": "queue", "position": position}
+        telemetry.QUEUE_WAIT_SECONDS.observe(ticket.admitted_at - ticket.enqueued_at)
+        agents = initialize_agents()  # Initialize agents
+        async for message in orchestrate_problem_solving(agents, prompt, stream=True, node_events=True):
+            yield message
+    finally:
+        ticket.release()
 
-        # Split message into lines and prefix each with 'data:'
-        message_lines = message.strip().splitlines()
-        sse_message = '\n'.join(f"data: {line}" for line in message_lines) + '\n\n'
-        yield sse_message
+# Appends each event of a session to the session log before it is sent
+async def logged_events(session_id, source):
+    status = "interrupted"
+    index = 0
+    try:
+        async with contextlib.aclosing(source):
+            async for event in source:
+                session_log.append(session_id, index, event)
+                index += 1
+                yield event
+        status = "finished"
+    finally:
+        session_log.finish(session_id, status)
+
+async def subscriber_stream(run, trace=False, start=0):
+    if trace:
+        yield format_sse({"type": "trace", "trace_id": run.trace_id})
+    index = start
+    async for message in run.subscribe(start):
+        yield format_sse(message, format_event_id(run.session_id, index))
+        index += 1
+    yield format_sse({"type": "end", "session": run.session_id, "status": "finished"})
+
+# Replays a session from the log after event `after`, then follows the live run if it is still going
+async def resumed_stream(session_id, after):
+    run = runs.find(session_id)
+    index = after
+    for index, message in await asyncio.to_thread(session_log.events, session_id, after):
+        yield format_sse(message, format_event_id(session_id, index))
+    if run is not None:
+        async for chunk in subscriber_stream(run, start=index + 1):
+            yield chunk
+        return
+    status = (await asyncio.to_thread(session_log.session, session_id))["status"]
+    yield format_sse({"type": "end", "session": session_id, "status": status})
 
 @app.get("/solve")
-async def solve_problem(prompt: str):
-    agents = initialize_agents()  # Initialize agents
-    # Return a streaming response for real-time updates
-    return StreamingResponse(message_stream(agents, prompt), media_type="text/event-stream")
+async def solve_problem(request: Request, prompt: Optional[str] = None, priority: int = 0, trace: bool = False,
+                        session: Optional[str] = None, last_event_id: Optional[str] = None):
+    # A reconnecting EventSource sends Last-Event-ID; `session` replays a session from its start
+    last_event_id = request.headers.get("Last-Event-ID") or last_event_id
+    if last_event_id or session:
+        session_id, after = parse_event_id(last_event_id) if last_event_id else (session, -1)
+        if session_id is None or await asyncio.to_thread(session_log.session, session_id) is None:
+            return JSONResponse({"detail": "Unknown session."}, status_code=404)
+        return StreamingResponse(
+            resumed_stream(session_id, after),
+            media_type="text/event-stream",
+            headers={**SSE_HEADERS, "X-Session-Id": session_id},
+        )
+    if not prompt:
+        return JSONResponse({"detail": "A prompt is required."}, status_code=400)
+
+    # Identical in-flight prompts share one orchestration; late joiners replay what they missed
+    run = runs.get(prompt)
+    if run is None:
+        client_id = request.headers.get("X-Client-Id") or (request.client.host if request.client else "anonymous")
+        try:
+            # `priority` is untrusted: the scheduler clamps it to SOLVE_MIN_PRIORITY..SOLVE_MAX_PRIORITY
+            ticket = scheduler.enqueue(client_id, priority)
+        except QueueFullError as e:
+            telemetry.SOLVE_REQUESTS.inc(outcome=f"rejected_{e.status_code}")
+            return JSONResponse(
+                {"detail": str(e)}, status_code=e.status_code, headers={"Retry-After": str(e.retry_after)}
+            )
+        trace_id = request.headers.get("X-Trace-Id") or telemetry.new_trace_id()
+        session_id = new_session_id()
+        session_log.create(session_id, prompt)
+        run = runs.start(
+            prompt, logged_events(session_id, admitted_events(ticket, prompt, trace_id)),
+            trace_id=trace_id, session_id=session_id,
+        )
+        telemetry.SOLVE_REQUESTS.inc(outcome="started")
+    else:
+        telemetry.SOLVE_REQUESTS.inc(outcome="coalesced")
+    # Return a streaming response for real-time updates; trace=true also sends the run's
+    # trace id as a "trace" event, which matches the telemetry log lines for this run
+    return StreamingResponse(
+        subscriber_stream(run, trace),
+        media_type="text/event-stream",
+        headers={**SSE_HEADERS, "X-Trace-Id": run.trace_id, "X-Session-Id": run.session_id},
+    )
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    # A session's prompt, status and every event it sent, without running any agents
+    info = await asyncio.to_thread(session_log.session, session_id)
+    if info is None:
+        return JSONResponse({"detail": "Unknown session."}, status_code=404)
+    events = await asyncio.to_thread(session_log.events, session_id)
+    return {**info, "events": [{"id": format_event_id(session_id, index), "event": event}
+                               for index, event in events]}
+
+@app.get("/healthz")
+async def healthz():
+    # Liveness: the process is up and serving requests
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    # Readiness: only send traffic to this instance once its models are loaded and warm
+    warmer = getattr(app.state, "warmer", None)
+    status = warmer.status() if warmer is not None else {"ready": False, "models": {}}
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text exposition format
+    ACTIVE_RUNS.set(scheduler.active)
+    QUEUED_RUNS.set(scheduler.queued)
+    return PlainTextResponse(telemetry.REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -33,14 +33,32 @@ function App() {
       };
     }
 
-    setMessages((prevMessages) => [...prevMessages, parsedMessage]); // Append new messages
+    setMessages((prevMessages) => {
+      // Replace the in-progress streamed message of the same agent with the complete one
+      const last = prevMessages[prevMessages.length - 1];
+      if (last && last.streaming && last.agent === parsedMessage.agent) {
+        return [...prevMessages.slice(0, -1), parsedMessage];
+      }
+      return [...prevMessages, parsedMessage]; // Append new messages
+    });
+  };
+
+  // Function to handle token deltas streamed while an agent is still generating
+  const handleDelta = ({ agent, turn, delta }) => {
+    setMessages((prevMessages) => {
+      const last = prevMessages[prevMessages.length - 1];
+      if (last && last.streaming && last.turn === turn) {
+        return [...prevMessages.slice(0, -1), { ...last, content: last.content + delta }];
+      }
+      return [...prevMessages, { type: 'agent', agent, turn, content: delta, streaming: true }];
+    });
   };
 
   return (
     <div className="App">
       <header className="App-header">
         <h1>Multi-Agent LLM Platform</h1>
-        <PromptInput onNewMessage={handleNewMessage} /> {/* Pass the function to capture new messages */}
+        <PromptInput onNewMessage={handleNewMessage} onDelta={handleDelta} /> {/* Pass the functions to capture new messages */}
       </header>
       <Conversation messages={messages} /> {/* Display the conversation outside the header */}
     </div>
@@ -1,17 +1,29 @@
 // File: PromptInput.js
 // Path: C:/Users/Asael/PycharmProjects/multi_agent_llm_platform/multiagentapp/src/PromptInput.js
 
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 
-function PromptInput({ onNewMessage }) {
+function PromptInput({ onNewMessage, onDelta }) {
   const [prompt, setPrompt] = useState('');
   const [loading, setLoading] = useState(false);
+  const [queuePosition, setQueuePosition] = useState(0);
   const [eventSource, setEventSource] = useState(null);
 
-  const handleSubmit = async (e) => {
-    e.preventDefault();
-    if (prompt.trim() === '') return;
+  // Resume a session that was still running when the page was reloaded
+  useEffect(() => {
+    const session = sessionStorage.getItem('activeSession');
+    if (session) {
+      openStream(`http://localhost:8000/solve?session=${encodeURIComponent(session)}`);
+    }
+  }, []); // eslint-disable-line react-hooks/exhaustive-deps
 
+  const finish = (source) => {
+    source.close();
+    sessionStorage.removeItem('activeSession');
+    setLoading(false);
+  };
+
+  const openStream = (url) => {
     setLoading(true);
 
     // Close any existing EventSource to prevent multiple connections
@@ -19,9 +31,9 @@ function PromptInput({ onNewMessage }) {
       eventSource.close();
     }
 
-    const newEventSource = new EventSource(
-      `http://localhost:8000/solve?prompt=${encodeURIComponent(prompt)}`
-    );
+    // Every event carries an id; if the connection drops, the browser reconnects
+    // with Last-Event-ID and the server replays what was missed from its session log.
+    const newEventSource = new EventSource(url);
 
     setEventSource(newEventSource);
 
@@ -31,6 +43,7 @@ function PromptInput({ onNewMessage }) {
 
     newEventSource.onmessage = function (event) {
       console.log('Message received from backend:', event.data);
+      sessionStorage.setItem('activeSession', event.lastEventId.split(':')[0]);
       onNewMessage(event.data);
 
       // Check for completion messages to close the EventSource
@@ -39,16 +52,38 @@ function PromptInput({ onNewMessage }) {
         event.data.includes('Conversation ended without a verified solution.') ||
         event.data.includes('Max iterations reached, stopping conversation.')
       ) {
-        newEventSource.close();
-        setLoading(false);
+        finish(newEventSource);
       }
     };
 
+    newEventSource.addEventListener('end', function () {
+      finish(newEventSource);
+    });
+
+    newEventSource.addEventListener('queue', function (event) {
+      setQueuePosition(JSON.parse(event.data).position);
+    });
+
+    newEventSource.addEventListener('delta', function (event) {
+      onDelta(JSON.parse(event.data));
+    });
+
     newEventSource.onerror = function (err) {
-      console.error('EventSource failed:', err);
-      newEventSource.close();
-      setLoading(false);
+      // The browser retries on its own unless the server refused the stream
+      if (newEventSource.readyState === EventSource.CLOSED) {
+        console.error('EventSource failed:', err);
+        finish(newEventSource);
+      } else {
+        console.warn('Connection lost, reconnecting...');
+      }
     };
+  };
+
+  const handleSubmit = async (e) => {
+    e.preventDefault();
+    if (prompt.trim() === '') return;
+
+    openStream(`http://localhost:8000/solve?prompt=${encodeURIComponent(prompt)}`);
 
     setPrompt(''); // Clear input field after submission
   };
@@ -65,7 +100,7 @@ function PromptInput({ onNewMessage }) {
           disabled={loading}
         />
         <button type="submit" className="submit-button" disabled={loading}>
-          {loading ? 'Processing...' : 'Submit'}
+          {loading ? (queuePosition > 0 ? `Queued (#${queuePosition})` : 'Processing...') : 'Submit'}
         </button>
       </div>
     </form>
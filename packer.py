@@ -0,0 +1,826 @@
+"""Packing engine behind the folder_to_text_file functions.
+
+Sources are listed with a thread pool (directories are scanned in parallel,
+but files come out in os.walk order), small files are read ahead by the pool
+and large ones are copied in chunks, so memory stays bounded whatever the file
+sizes. Sizes come from stat and from the bytes actually written; nothing is
+encoded twice.
+
+Sharded packs keep a manifest (path, size, mtime, content hash, and where the
+entry sits in which shard) next to the shards. On the next run only new and
+changed files are read: unchanged entries keep their shard, shards none of
+whose entries changed are left untouched, and rewritten shards copy their
+unchanged segments straight from the previous shard file.
+
+The manifest doubles as an index: PackReader memory-maps the shards and
+returns any one file as a slice without scanning. The "indexed" output format
+drops the File:/Path: headers and separators, storing only file contents,
+each optionally zlib-compressed.
+
+With `max_shard_tokens` shards are also limited by tokens, as counted by a
+tokens.TokenCounter. New and changed files are then read once more up front
+to be measured; the counts are kept in the manifest. A file over the budget
+is split into parts on line boundaries, preferably before a top-level
+definition or after a blank line, and each part is packed as its own entry.
+"""
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import re
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from tokens import TokenCounter, estimate_tokens
+
+SEPARATOR = "\n\n" + "=" * 50 + "\n\n"
+MANIFEST_NAME = "pack_manifest.json"
+MANIFEST_VERSION = 3
+OUTPUT_FORMATS = ("text", "indexed")
+COMPRESSIONS = (None, "zlib")
+
+CHUNK_SIZE = 1024 * 1024  # Characters per read when copying a large file
+INLINE_LIMIT = 1024 * 1024  # Files up to this many bytes are read ahead whole by the pool
+BATCH_FILES = 64  # Most files read ahead by one pool task
+
+
+class Source:
+    """A file to pack. `label` names it in error messages."""
+
+    def __init__(self, path, name=None, label=None, size=None, mtime_ns=None, missing=False, tokens=None, part=None):
+        self.path = path
+        self.name = name or os.path.basename(path)
+        self.label = label or self.name
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.missing = missing
+        self.tokens = tokens
+        self.part = part  # (index from 1, count, start byte, end byte) of a file split to fit the token budget
+
+    def header(self):
+        return text_header(self.name, self.path, self.part)
+
+    def split(self, parts):
+        """One Source per (start, end, tokens) part of this file."""
+        return [
+            Source(self.path, self.name, self.label, self.size, self.mtime_ns,
+                   tokens=tokens, part=(index, len(parts), start, end))
+            for index, (start, end, tokens) in enumerate(parts, 1)
+        ]
+
+    def error_message(self, exc):
+        if self.missing:
+            return f"File {self.path} does not exist."
+        return f"Error reading file {self.label}: {exc}"
+
+    def error(self, exc):
+        return f"{self.error_message(exc)}{SEPARATOR}".encode("utf-8")
+
+
+def text_header(name, path, part=None):
+    if part is not None:
+        name = f"{name} (part {part[0]}/{part[1]})"
+    return f"File: {name}\nPath: {path}\n\n".encode("utf-8")
+
+
+def normalize_text(data):
+    """What reading `data` as UTF-8 text with errors ignored and universal newlines yields, re-encoded.
+
+    Plain ASCII or valid UTF-8 without carriage returns, the common case, is
+    returned as is without decoding.
+    """
+    if b"\r" not in data:
+        if data.isascii():
+            return data
+        try:
+            data.decode("utf-8")
+            return data
+        except UnicodeDecodeError:
+            pass
+    text = data.decode("utf-8", errors="ignore")
+    return text.replace("\r\n", "\n").replace("\r", "\n").encode("utf-8")
+
+
+_DEFINITION = re.compile(
+    rb"(async\s+def|def|class|function|func|fn|export|public|private|protected|static|interface|struct|impl|type)\b"
+)
+
+
+def _decode_line(line):
+    return line.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _split_line(line, offset, budget, counter):
+    # Between words; a single word over the budget is kept whole rather than cut mid-token
+    pieces = []
+    start = tokens = 0
+    for match in re.finditer(rb"\S+\s*|\s+", line):
+        word_tokens = counter.count(_decode_line(match.group()))
+        if tokens + word_tokens > budget and match.start() > start:
+            pieces.append((offset + start, offset + match.start(), tokens))
+            start, tokens = match.start(), 0
+        tokens += word_tokens
+    pieces.append((offset + start, offset + len(line), tokens))
+    return pieces
+
+
+def split_points(raw, budget, counter):
+    """Split file bytes `raw` into parts of at most `budget` tokens; return [(start, end, tokens)].
+
+    Parts end on line boundaries. A part is cut before the last top-level
+    definition, else after the last blank line, as long as that keeps it at
+    least half full; otherwise just before the line that does not fit.
+    """
+    parts = []
+    start = position = tokens = 0
+    definition = blank = None  # (position, tokens before it) of boundaries in the current part
+    previous_blank = False
+    for line in raw.splitlines(keepends=True):
+        text = _decode_line(line)
+        stripped = text.strip()
+        line_tokens = counter.count(text)
+        if position > start and stripped:
+            if not text[0].isspace() and (previous_blank or _DEFINITION.match(line)):
+                definition = (position, tokens)
+            elif previous_blank:
+                blank = (position, tokens)
+        if line_tokens > budget:
+            if position > start:
+                parts.append((start, position, tokens))
+            parts.extend(_split_line(line, position, budget, counter))
+            start, tokens = position + len(line), 0
+            definition = blank = None
+        else:
+            if tokens + line_tokens > budget and position > start:
+                cut = next((c for c in (definition, blank) if c is not None and c[1] >= budget // 2), (position, tokens))
+                parts.append((start, cut[0], cut[1]))
+                start, tokens = cut[0], tokens - cut[1]
+                definition = blank = None
+                if tokens + line_tokens > budget:
+                    # What was carried over from the cut does not leave room for this line
+                    parts.append((start, position, tokens))
+                    start, tokens = position, 0
+            tokens += line_tokens
+        position += len(line)
+        previous_blank = not stripped
+    if position > start or not parts:
+        parts.append((start, position, tokens))
+    return parts
+
+
+def _scan(path, exclude_dirs):
+    files, dirs = [], []
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError:
+        return files, dirs  # os.walk skips unreadable directories too
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            # Like os.walk, symlinked directories are neither packed nor descended into
+            if entry.name not in exclude_dirs and not entry.is_symlink():
+                dirs.append(entry.path)
+            continue
+        try:
+            st = entry.stat()
+            files.append(Source(entry.path, entry.name, size=st.st_size, mtime_ns=st.st_mtime_ns))
+        except OSError:
+            files.append(Source(entry.path, entry.name))
+    return files, dirs
+
+
+def walk_sources(folder_path, pool, exclude_dirs=()):
+    """Yield a Source per file under folder_path in os.walk order, scanning directories in parallel."""
+    exclude_dirs = frozenset(exclude_dirs)
+    stack = [pool.submit(_scan, folder_path, exclude_dirs)]
+    while stack:
+        files, dirs = stack.pop().result()
+        yield from files
+        # Subdirectories are scanned ahead while the caller consumes these files
+        stack.extend(reversed([pool.submit(_scan, path, exclude_dirs) for path in dirs]))
+
+
+def _stat_source(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return Source(path, label=path, missing=True)
+    except OSError:
+        return Source(path, label=path)
+    return Source(path, label=path, size=st.st_size, mtime_ns=st.st_mtime_ns)
+
+
+def list_sources(file_list, pool):
+    """Sources for an explicit list of paths, in order; missing files are kept and reported in the pack."""
+    return list(pool.map(_stat_source, file_list))
+
+
+class _Item:
+    """One entry of the pack plan: a source, and the previous manifest entry if its segment can be reused."""
+
+    def __init__(self, source, previous=None, reuse=False, group=None):
+        self.source = source
+        self.previous = previous
+        self.reuse = reuse
+        self.group = group  # The sources of all parts of a split file, which move together
+
+
+class Packer:
+    """Writes sources into shards of at most `max_shard_bytes` named by `shard_path(index)` (from 1).
+
+    With a `manifest_path` the pack is indexed, and incremental as described in
+    the module docstring unless `incremental` is False; without one (or with
+    `max_shard_bytes=None`, a single output file) every run packs everything.
+    Shards must sit in the manifest's directory. `max_shard_tokens` also
+    limits shards by tokens, counted by `token_counter` (the estimate by default).
+    """
+
+    def __init__(self, shard_path, max_shard_bytes=None, manifest_path=None, workers=None,
+                 chunk_size=CHUNK_SIZE, inline_limit=INLINE_LIMIT, incremental=True,
+                 output_format="text", compression=None, max_shard_tokens=None, token_counter=None):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {output_format!r}, expected one of {OUTPUT_FORMATS}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression!r}, expected one of {COMPRESSIONS}")
+        if output_format == "indexed" and not manifest_path:
+            raise ValueError("The indexed output format needs a manifest_path for its index")
+        self.shard_path = shard_path
+        self.max_shard_bytes = max_shard_bytes
+        self.manifest_path = manifest_path
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.inline_limit = inline_limit
+        self.incremental = incremental
+        self.output_format = output_format
+        self.compression = compression
+        self.max_shard_tokens = max_shard_tokens
+        self.token_counter = token_counter or TokenCounter()
+
+    # Manifest
+
+    def _settings(self):
+        return {
+            "version": MANIFEST_VERSION,
+            "max_shard_bytes": self.max_shard_bytes,
+            "output_format": self.output_format,
+            "compression": self.compression,
+            "max_shard_tokens": self.max_shard_tokens,
+            "tokenizer": self.token_counter.name if self.max_shard_tokens is not None else None,
+        }
+
+    def _load_manifest(self):
+        if not self.manifest_path or not self.incremental or not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("settings") != self._settings():
+            return None  # Packed with other settings; start over
+        return manifest
+
+    def _save_manifest(self, entries, shard_sizes):
+        manifest = {
+            "settings": self._settings(),
+            "shards": {
+                str(index): {"file": os.path.basename(self.shard_path(index)), "size": size}
+                for index, size in shard_sizes.items()
+            },
+            "entries": entries,
+        }
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps(manifest))  # dumps uses the C encoder, dump does not
+        os.replace(tmp, self.manifest_path)
+
+    # Planning
+
+    def _plan(self, sources, manifest):
+        """Assign every source to a shard; return ({index: [items]}, dirty shard indexes)."""
+        shards = {}
+        dirty = set()
+        new = []
+        old_entries = {}  # path -> entries, in pack order (a file list may name a file twice)
+        valid_shards = set()
+        if manifest is not None:
+            for entry in manifest["entries"]:
+                old_entries.setdefault(entry["path"], deque()).append(entry)
+            for index, shard in manifest["shards"].items():
+                path = self.shard_path(int(index))
+                shards[int(index)] = []
+                if os.path.exists(path) and os.path.getsize(path) == shard["size"]:
+                    valid_shards.add(int(index))
+                else:
+                    dirty.add(int(index))
+
+        groups = []
+        moved = set()  # ids of the groups that leave their place
+        group = None
+        for source in sources:
+            if source.part is not None and source.part[0] == 1:
+                group = []
+                groups.append(group)
+            if source.part is not None:
+                group.append(source)
+            item_group = group if source.part is not None else None
+            previous = old_entries.get(source.path)
+            if not previous:
+                new.append(_Item(source, group=item_group))
+                if item_group is not None:
+                    moved.add(id(item_group))
+                continue
+            previous = previous.popleft()
+            reuse = (
+                previous["shard"] in valid_shards
+                and "error" not in previous  # Errors are always retried
+                and previous["size"] == source.size
+                and previous["mtime_ns"] == source.mtime_ns
+                and previous.get("part") == (source.part[0] if source.part else None)
+            )
+            shards[previous["shard"]].append(_Item(source, previous, reuse, item_group))
+            if not reuse:
+                dirty.add(previous["shard"])
+        # Entries of files that no longer exist are dropped from their shard
+        for remaining in old_entries.values():
+            for entry in remaining:
+                dirty.add(entry["shard"])
+
+        for index, items in shards.items():
+            # Keep the previous order inside a shard; move changed files that no longer fit to the end
+            items.sort(key=lambda item: item.previous["offset"])
+            if self._limited():
+                total = (0, 0)
+                kept = []
+                for item in items:
+                    cost = self._cost(item)
+                    if kept and self._exceeds(total, cost) and not item.reuse:
+                        if item.group is not None:
+                            moved.add(id(item.group))
+                        new.append(_Item(item.source, group=item.group))
+                        continue
+                    kept.append(item)
+                    total = (total[0] + cost[0], total[1] + cost[1])
+                shards[index] = kept
+
+        # A split file moves as a whole: when any of its parts has to move, all
+        # of them go to the end of the plan, in part order
+        if moved:
+            for index, items in shards.items():
+                kept = [item for item in items if item.group is None or id(item.group) not in moved]
+                if len(kept) != len(items):
+                    shards[index] = kept
+                    dirty.add(index)
+            new = [item for item in new if item.group is None or id(item.group) not in moved]
+            for group in groups:
+                if id(group) in moved:
+                    new.extend(_Item(source, group=group) for source in group)
+
+        # New files go to the last shard while they fit, then to new shards
+        index = max(shards, default=1)
+        items = shards.setdefault(index, [])
+        total = (0, 0)
+        for item in items:
+            cost = self._cost(item)
+            total = (total[0] + cost[0], total[1] + cost[1])
+        for item in new:
+            cost = self._cost(item)
+            if self._limited() and items and self._exceeds(total, cost):
+                index += 1
+                items = shards.setdefault(index, [])
+                total = (0, 0)
+            items.append(item)
+            total = (total[0] + cost[0], total[1] + cost[1])
+            dirty.add(index)
+        return shards, dirty
+
+    def _limited(self):
+        return self.max_shard_bytes is not None or self.max_shard_tokens is not None
+
+    def _exceeds(self, total, cost):
+        return any(
+            limit is not None and used + extra > limit
+            for limit, used, extra in zip((self.max_shard_bytes, self.max_shard_tokens), total, cost)
+        )
+
+    def _cost(self, item):
+        """(bytes, tokens) an item adds to its shard; tokens are only counted with a token budget."""
+        if self.max_shard_tokens is None:
+            return self._estimate(item), 0
+        tokens = item.previous["tokens"] if item.reuse else item.source.tokens or 0
+        return self._estimate(item), tokens + self._overhead(item.source)
+
+    def _overhead(self, source):
+        # Tokens of the File:/Path: header and separator around an entry; estimated, as they are mostly ASCII
+        if self.output_format != "text":
+            return 0
+        return estimate_tokens((source.header() + SEPARATOR.encode("utf-8")).decode("utf-8"))
+
+    def _estimate(self, item):
+        """Upper bound of an item's segment size: decoding with errors ignored and newline translation only shrink a file."""
+        if item.reuse:
+            return item.previous["length"]
+        source = item.source
+        size = source.part[3] - source.part[2] if source.part is not None else source.size or 0
+        if self.output_format == "indexed":
+            # zlib can grow incompressible data by a few bytes per block
+            return size + size // 1000 + 64 if self.compression else size
+        if source.missing:
+            return len(source.error(None))
+        return len(source.header()) + size + len(SEPARATOR)
+
+    # Measuring
+
+    def _measure(self, pool, sources, manifest):
+        """Token counts for the sources, with files over the budget split into parts.
+
+        Files unchanged since the manifest keep their counts and parts; the
+        others are read and counted on the pool.
+        """
+        previous = {}
+        if manifest is not None:
+            for entry in manifest["entries"]:
+                previous.setdefault(entry["path"], deque()).append(entry)
+                if "part" not in entry and entry.get("sha256") and "tokens" in entry:
+                    self.token_counter.remember(entry["sha256"], entry["tokens"])
+        measured = []
+        pending = []
+        for source in sources:
+            old = previous.get(source.path)
+            if old:
+                group = [old.popleft() for _ in range(min(old[0].get("parts", 1), len(old)))]
+                group.sort(key=lambda entry: entry.get("part", 1))
+                first = group[0]
+                if "error" not in first and first["size"] == source.size and first["mtime_ns"] == source.mtime_ns:
+                    if "part" in first:
+                        measured.append(source.split([(e["part_start"], e["part_end"], e["tokens"]) for e in group]))
+                    else:
+                        source.tokens = first["tokens"]
+                        measured.append([source])
+                    continue
+            measured.append(None)
+            pending.append((len(measured) - 1, source))
+        batches = [pending[i:i + BATCH_FILES] for i in range(0, len(pending), BATCH_FILES)]
+        futures = [pool.submit(self._measure_batch, [source for _, source in batch]) for batch in batches]
+        for batch, future in zip(batches, futures):
+            for (position, _), parts in zip(batch, future.result()):
+                measured[position] = parts
+        return [source for parts in measured for source in parts]
+
+    def _measure_batch(self, sources):
+        return [self._measure_source(source) for source in sources]
+
+    def _measure_source(self, source):
+        if source.missing:
+            return [source]
+        try:
+            with open(source.path, "rb") as f_in:
+                raw = f_in.read()
+        except Exception:
+            return [source]  # Reported when the file is packed
+        content = normalize_text(raw)
+        # Leave room for the header of a part, which is a little longer than the file's own
+        budget = self.max_shard_tokens - self._overhead(Source(source.path, source.name, part=(10 ** 6, 10 ** 6, 0, 0)))
+        source.tokens = self.token_counter.count_content(hashlib.sha256(content).hexdigest(), content)
+        if source.tokens <= budget:
+            return [source]
+        return source.split(split_points(raw, max(budget, 1), self.token_counter))
+
+    # Reading
+
+    def _read_ahead(self, item):
+        """Runs on the pool: (segment, content hash, entry fields) for a small file, or None to stream it in the writer."""
+        source = item.source
+        if source.missing:
+            return self._error_segment(source, None)
+        if source.part is None and (source.size is None or source.size > self.inline_limit):
+            return None
+        try:
+            with open(source.path, "rb") as f_in:
+                if source.part is not None:
+                    # Parts are bounded by the token budget, so they are always read ahead
+                    f_in.seek(source.part[2])
+                    content = normalize_text(f_in.read(source.part[3] - source.part[2]))
+                else:
+                    content = normalize_text(f_in.read())
+        except Exception as e:
+            return self._error_segment(source, e)
+        digest = self._digest(content)
+        if self.output_format == "text":
+            return source.header() + content + SEPARATOR.encode("utf-8"), digest, {}
+        fields = {"raw_length": len(content), "compression": None}
+        if self.compression == "zlib":
+            # Kept uncompressed when compression does not pay off, so it can be read without a copy
+            packed = zlib.compress(content)
+            if len(packed) < len(content):
+                content = packed
+                fields["compression"] = "zlib"
+        return content, digest, fields
+
+    def _digest(self, content):
+        # Hashes are only needed to record the pack in a manifest
+        return hashlib.sha256(content).hexdigest() if self.manifest_path else ""
+
+    def _error_segment(self, source, exc):
+        if self.output_format == "text":
+            return source.error(exc), None, {"error": source.error_message(exc)}
+        return b"", None, {"error": source.error_message(exc)}
+
+    def _stream(self, item, f_out):
+        """Copy a large file in chunks; return (bytes written, content hash, entry fields)."""
+        source = item.source
+        try:
+            f_in = open(source.path, "r", encoding="utf-8", errors="ignore")
+        except Exception as e:
+            data, digest, fields = self._error_segment(source, e)
+            f_out.write(data)
+            return len(data), digest, fields
+        text = self.output_format == "text"
+        compressor = zlib.compressobj() if not text and self.compression == "zlib" else None
+        written = raw_length = 0
+        digest = hashlib.sha256() if self.manifest_path else None
+        with f_in:
+            if text:
+                header = source.header()
+                f_out.write(header)
+                written += len(header)
+            try:
+                while True:
+                    chunk = f_in.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    data = chunk.encode("utf-8")
+                    raw_length += len(data)
+                    if digest is not None:
+                        digest.update(data)
+                    if compressor is not None:
+                        data = compressor.compress(data)
+                    f_out.write(data)
+                    written += len(data)
+            except Exception as e:
+                if not text:
+                    raise  # A partly written entry cannot be described by the index
+                data = source.error(e)
+                f_out.write(data)
+                return written + len(data), None, {"error": source.error_message(e)}
+        data = SEPARATOR.encode("utf-8") if text else (compressor.flush() if compressor is not None else b"")
+        f_out.write(data)
+        fields = {} if text else {"raw_length": raw_length, "compression": self.compression}
+        return written + len(data), digest.hexdigest() if digest is not None else "", fields
+
+    def _batches(self, items):
+        # Small files are read in batches, so each pool task does enough work to outweigh its overhead
+        batch, size = [], 0
+        for item in items:
+            batch.append(item)
+            size += self._estimate(item)
+            if len(batch) >= BATCH_FILES or size >= self.inline_limit:
+                yield batch
+                batch, size = [], 0
+        if batch:
+            yield batch
+
+    def _read_batch(self, batch):
+        return [self._read_ahead(item) for item in batch]
+
+    def _ordered(self, pool, items):
+        """Read ahead up to a bounded window of batches on the pool, yielding results in order."""
+        window = 2 * (self.workers or min(32, (os.cpu_count() or 1) + 4))
+        batches = self._batches(items)
+        pending = deque((batch, pool.submit(self._read_batch, batch)) for batch in itertools.islice(batches, window))
+        while pending:
+            batch, future = pending.popleft()
+            following = next(batches, None)
+            if following is not None:
+                pending.append((following, pool.submit(self._read_batch, following)))
+            yield from zip(batch, future.result())
+
+    # Packing
+
+    def pack(self, sources):
+        """Pack `sources` (Sources, or a callable taking the pool and returning them)."""
+        with ThreadPoolExecutor(self.workers) as pool:
+            if callable(sources):
+                sources = sources(pool)
+            sources = list(sources)
+            files = len(sources)
+            manifest = self._load_manifest()
+            if self.max_shard_tokens is not None:
+                sources = self._measure(pool, sources, manifest)
+            shards, dirty = self._plan(sources, manifest)
+            old_shards = {}
+            if manifest is not None:
+                old_shards = {int(index): shard["size"] for index, shard in manifest["shards"].items()}
+
+            # Drop shards that ended up empty at the end of the pack
+            while len(shards) > 1 and not shards[max(shards)]:
+                shards.pop(max(shards))
+            shard_sizes = {index: old_shards.get(index, 0) for index in shards}
+
+            to_write = [index for index in sorted(shards) if index in dirty or index not in old_shards]
+            reads = [item for index in to_write for item in shards[index] if not item.reuse]
+            results = self._ordered(pool, reads)
+            entries = []
+            readers = {}
+            tmp_paths = []
+            stats = {"files": files, "read": len(reads), "reused": 0, "shards_written": len(to_write)}
+            try:
+                for index in to_write:
+                    tmp = self.shard_path(index) + ".tmp"
+                    tmp_paths.append((tmp, self.shard_path(index)))
+                    offset = 0
+                    with open(tmp, "wb") as f_out:
+                        for item in shards[index]:
+                            if item.reuse:
+                                length = self._copy_segment(readers, item.previous, f_out)
+                                entries.append({**item.previous, "shard": index, "offset": offset})
+                                stats["reused"] += 1
+                            else:
+                                _, result = next(results)
+                                if result is None:
+                                    length, digest, fields = self._stream(item, f_out)
+                                else:
+                                    data, digest, fields = result
+                                    f_out.write(data)
+                                    length = len(data)
+                                entries.append(self._entry(item.source, index, offset, length, digest, fields))
+                            offset += length
+                    shard_sizes[index] = offset
+            finally:
+                for f in readers.values():
+                    f.close()
+            # Only replace shards once all of them are written: rewritten shards may copy from older ones
+            for tmp, path in tmp_paths:
+                os.replace(tmp, path)
+
+        # Entries of untouched shards carry over from the manifest
+        for index in shards:
+            if index not in to_write:
+                for item in shards[index]:
+                    entries.append(item.previous)
+                    stats["reused"] += 1
+        if self._limited():
+            # Remove shards left over from a previous, larger pack
+            index = max(shards) + 1
+            while index <= max(old_shards, default=0) or os.path.exists(self.shard_path(index)):
+                if os.path.exists(self.shard_path(index)):
+                    os.remove(self.shard_path(index))
+                index += 1
+
+        if self.manifest_path:
+            entries.sort(key=lambda entry: (entry["shard"], entry["offset"]))
+            self._save_manifest(entries, shard_sizes)
+        stats["shards"] = len(shards)
+        return stats
+
+    def _copy_segment(self, readers, previous, f_out):
+        f_in = readers.get(previous["shard"])
+        if f_in is None:
+            f_in = readers[previous["shard"]] = open(self.shard_path(previous["shard"]), "rb")
+        f_in.seek(previous["offset"])
+        remaining = previous["length"]
+        while remaining:
+            data = f_in.read(min(remaining, INLINE_LIMIT))
+            if not data:
+                raise OSError(f"Shard {previous['shard']} is shorter than its manifest")
+            f_out.write(data)
+            remaining -= len(data)
+        return previous["length"]
+
+    def _entry(self, source, shard, offset, length, digest, fields):
+        # A segment holding an error message has no hash and is never reused
+        if source.tokens is not None:
+            fields = {**fields, "tokens": source.tokens}
+        if source.part is not None:
+            index, count, start, end = source.part
+            fields = {**fields, "part": index, "parts": count, "part_start": start, "part_end": end}
+        return {
+            "path": source.path,
+            "size": source.size,
+            "mtime_ns": source.mtime_ns,
+            "sha256": digest,
+            "shard": shard,
+            "offset": offset,
+            "length": length,
+            **fields,
+        }
+
+
+class PackReader:
+    """Random access to the files of a pack through its manifest, with memory-mapped shards.
+
+    `path` is the manifest, or the output folder holding pack_manifest.json.
+    `view` returns a zero-copy memoryview into the shard for entries stored
+    uncompressed; compressed entries are inflated into new bytes, and the parts
+    of a split file are joined.
+    """
+
+    def __init__(self, path):
+        if os.path.isdir(path):
+            path = os.path.join(path, MANIFEST_NAME)
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("settings", {}).get("version") != MANIFEST_VERSION:
+            raise ValueError(f"{path} was written by an incompatible packer version")
+        self.folder = os.path.dirname(path)
+        self.output_format = manifest["settings"]["output_format"]
+        self.shard_files = {int(index): shard["file"] for index, shard in manifest["shards"].items()}
+        self.entries = {}
+        self._parts = {}  # path -> entries of the parts of a split file, in part order
+        for entry in manifest["entries"]:
+            # A file listed twice is read from its first entry
+            self.entries.setdefault(entry["path"], entry)
+            if "part" in entry:
+                self._parts.setdefault(entry["path"], []).append(entry)
+        for path, entries in self._parts.items():
+            parts = []
+            for entry in sorted(entries, key=lambda entry: entry["part"]):  # Stable: duplicates keep pack order
+                if entry["part"] == len(parts) + 1:
+                    parts.append(entry)
+            self._parts[path] = parts
+            if parts:
+                self.entries[path] = parts[0]
+        self._maps = {}
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, path):
+        return path in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def paths(self):
+        return list(self.entries)
+
+    def _map(self, shard):
+        if shard not in self._maps:
+            f = open(os.path.join(self.folder, self.shard_files[shard]), "rb")
+            self._files[shard] = f
+            # mmap cannot map an empty file
+            self._maps[shard] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        return self._maps[shard]
+
+    def parts(self, path):
+        """The manifest entries holding `path`: one, or one per part of a split file."""
+        return self._parts.get(path) or [self.entries[path]]
+
+    def digest(self, path):
+        """A hash of the content of `path`, which changes whenever any of its parts does."""
+        parts = self.parts(path)
+        if len(parts) == 1:
+            return parts[0]["sha256"]
+        return hashlib.sha256("".join(entry["sha256"] for entry in parts).encode("ascii")).hexdigest()
+
+    def view(self, path):
+        """The packed content of `path`, as a memoryview for uncompressed entries."""
+        if path in self._parts:
+            return b"".join(self._segment(entry) for entry in self._parts[path])
+        return self._segment(self.entries[path])
+
+    def _segment(self, entry):
+        if "error" in entry:
+            raise OSError(entry["error"])
+        start, end = entry["offset"], entry["offset"] + entry["length"]
+        if self.output_format == "text":
+            # Skip the File:/Path: header and the trailing separator
+            part = (entry["part"], entry["parts"]) if "part" in entry else None
+            start += len(text_header(os.path.basename(entry["path"]), entry["path"], part))
+            end -= len(SEPARATOR)
+        data = memoryview(self._map(entry["shard"]))[start:end]
+        if entry.get("compression") == "zlib":
+            return zlib.decompress(data)
+        return data
+
+    def read_bytes(self, path):
+        return bytes(self.view(path))
+
+    def read_text(self, path):
+        return self.read_bytes(path).decode("utf-8")
+
+    def verify(self, path):
+        """Check the content of `path` against the hash recorded when it was packed."""
+        return all(hashlib.sha256(self._segment(entry)).hexdigest() == entry["sha256"] for entry in self.parts(path))
+
+    def close(self):
+        for data in self._maps.values():
+            if isinstance(data, mmap.mmap):
+                try:
+                    data.close()
+                except BufferError:
+                    pass  # Views handed out are still alive; the map is released with them
+        for f in self._files.values():
+            f.close()
+        self._maps.clear()
+        self._files.clear()
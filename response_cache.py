@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_prompt(prompt):
+    """Normalize line endings and surrounding/trailing whitespace so trivially different prompts share an entry."""
+    lines = prompt.replace("\r\n", "\n").strip().split("\n")
+    return "\n".join(line.rstrip() for line in lines)
+
+
+class ResponseCache:
+    """Cache of model responses keyed by model, normalized prompt and sampling options.
+
+    A bounded in-memory LRU tier sits in front of an optional SQLite tier that
+    survives restarts. Entries older than `ttl` seconds are treated as misses.
+    Disk writes are queued to a writer thread, so `put` never waits on SQLite;
+    async callers use `aget`, which reads the disk tier off the event loop.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None, sqlite_path=None, max_disk_entries=100_000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (response, stored_at)
+        self._lock = threading.Lock()
+        self._db = None
+        self._writes = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            self._db.commit()
+            self._db_lock = threading.Lock()
+            self._writes = queue.Queue()  # (sql, params), a threading.Event to set once written, or None to stop
+            self._writer = threading.Thread(target=self._write_loop, name="response-cache-writer", daemon=True)
+            self._writer.start()
+
+    @staticmethod
+    def make_key(model, prompt, options=None):
+        raw = json.dumps([model, normalize_prompt(prompt), options or {}], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def _write_loop(self):
+        puts = 0
+        while True:
+            writes = [self._writes.get()]
+            while True:
+                try:
+                    writes.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            with self._db_lock:
+                for write in writes:
+                    if isinstance(write, tuple):
+                        try:
+                            self._db.execute(*write)
+                        except sqlite3.Error as e:
+                            print(f"Response cache write failed: {e}")
+                        puts += 1
+                        if puts % 100 == 0:
+                            self._evict_disk()
+                self._db.commit()
+            for write in writes:
+                if isinstance(write, threading.Event):
+                    write.set()
+            if None in writes:
+                return
+
+    def flush(self):
+        """Block until every disk write queued so far is committed."""
+        if self._writes is not None:
+            written = threading.Event()
+            self._writes.put(written)
+            written.wait()
+
+    def _memory_entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1]):
+                del self._entries[key]
+                entry = None
+            return entry
+
+    def _disk_entry(self, key):
+        with self._db_lock:
+            row = self._db.execute("SELECT response, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or self._expired(row[1]):
+            return None
+        with self._lock:
+            self._store_memory(key, row)
+        return row
+
+    def _result(self, key, entry):
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get(self, key):
+        entry = self._memory_entry(key)
+        if entry is None and self._db is not None:
+            entry = self._disk_entry(key)
+        return self._result(key, entry)
+
+    async def aget(self, key):
+        """`get` for async callers: a memory miss is looked up on disk in a worker thread."""
+        entry = self._memory_entry(key)
+        if entry is None and self._db is not None:
+            entry = await asyncio.to_thread(self._disk_entry, key)
+        return self._result(key, entry)
+
+    def put(self, key, response):
+        entry = (response, time.time())
+        with self._lock:
+            self._store_memory(key, entry)
+        if self._writes is not None:
+            self._writes.put(("INSERT OR REPLACE INTO responses (key, response, stored_at) VALUES (?, ?, ?)", (key, *entry)))
+
+    def _evict_disk(self):
+        # Trimming scans the table, so it runs every 100 writes rather than on each one
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.ttl,))
+        self._db.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY stored_at DESC LIMIT ?)",
+            (self.max_disk_entries,),
+        )
+
+    def _store_memory(self, key, entry):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._writes is not None:
+            self._writes.put(("DELETE FROM responses", ()))
+            self.flush()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def close(self):
+        if self._db is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._db.close()
+            self._db = None
+            self._writes = None
+
+
+_cache = None
+
+
+def get_response_cache():
+    """Return the process-wide cache configured by RESPONSE_CACHE_* environment variables.
+
+    RESPONSE_CACHE_SIZE=0 (with no RESPONSE_CACHE_DB) disables caching and returns None.
+    """
+    global _cache
+    if _cache is None:
+        size = int(os.environ.get("RESPONSE_CACHE_SIZE", 1024))
+        ttl = os.environ.get("RESPONSE_CACHE_TTL")
+        sqlite_path = os.environ.get("RESPONSE_CACHE_DB")
+        if size <= 0 and not sqlite_path:
+            return None
+        _cache = ResponseCache(max_entries=size, ttl=float(ttl) if ttl else None, sqlite_path=sqlite_path)
+    return _cache
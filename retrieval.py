@@ -0,0 +1,279 @@
+"""BM25 retrieval over packed repositories.
+
+`build_index` splits every file of a pack (see packer.py) into chunks of
+consecutive lines and builds an inverted index whose postings are numpy
+arrays, saved next to the pack. Rebuilding only re-tokenizes files whose
+content hash changed; the postings themselves are regrouped with numpy.
+`ChunkIndex.search` scores all chunks of the query terms at once, so queries
+take milliseconds even with hundreds of thousands of chunks. An Environment
+given a retriever pins the top chunks for the prompt ahead of the conversation.
+"""
+import json
+import os
+import re
+
+import numpy as np
+
+from packer import PackReader
+from tokens import estimate_tokens
+
+INDEX_NAME = "retrieval_index"
+INDEX_VERSION = 1
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|[0-9]+")
+_CAMEL = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+
+def tokenize(text):
+    """Lowercased words; identifiers also yield their snake_case and camelCase parts."""
+    terms = []
+    for word in _WORD.findall(text):
+        terms.append(word.lower())
+        parts = [part for piece in word.split("_") for part in _CAMEL.findall(piece)]
+        if len(parts) > 1:
+            terms.extend(part.lower() for part in parts)
+    return terms
+
+
+def split_chunks(content, chunk_lines=40):
+    """Yield (start_line, end_line, start_byte, end_byte) for runs of `chunk_lines` lines of `content` (bytes)."""
+    start_byte = 0
+    line = 0
+    while start_byte < len(content):
+        end_byte = start_byte
+        for _ in range(chunk_lines):
+            newline = content.find(b"\n", end_byte)
+            if newline == -1:
+                end_byte = len(content)
+                break
+            end_byte = newline + 1
+        end_line = line + content.count(b"\n", start_byte, end_byte)
+        yield line, end_line, start_byte, end_byte
+        start_byte, line = end_byte, end_line
+
+
+class Chunk:
+    __slots__ = ("path", "start_line", "end_line", "start", "end", "score")
+
+    def __init__(self, path, start_line, end_line, start, end, score=0.0):
+        self.path = path
+        self.start_line = start_line
+        self.end_line = end_line
+        self.start = start
+        self.end = end
+        self.score = score
+
+    def __repr__(self):
+        return f"Chunk({self.path}:{self.start_line + 1}-{self.end_line}, score={self.score:.3f})"
+
+
+class ChunkIndex:
+    """An in-memory BM25 index over the chunks of a pack.
+
+    Postings are stored CSR-style: the chunk ids and term frequencies of term
+    `t` are `chunk_ids[offsets[t]:offsets[t + 1]]` and `tfs[...]`. A forward
+    copy (terms per chunk) is kept so unchanged files are not re-tokenized when
+    the index is rebuilt.
+    """
+
+    def __init__(self, pack_path, vocabulary, files, chunks, forward_offsets, forward_terms, forward_tfs,
+                 k1=1.2, b=0.75):
+        self.pack_path = pack_path
+        self.vocabulary = vocabulary  # term -> id
+        self.files = files  # path -> {"sha256", "first_chunk", "chunks"}
+        self.chunks = chunks  # [(path, start_line, end_line, start_byte, end_byte)]
+        self.forward_offsets = forward_offsets
+        self.forward_terms = forward_terms
+        self.forward_tfs = forward_tfs
+        self.k1 = k1
+        self.b = b
+        self._reader = None
+        self._invert()
+
+    def _invert(self):
+        lengths = np.diff(self.forward_offsets)
+        chunk_of_posting = np.repeat(np.arange(len(self.chunks), dtype=np.int32), lengths)
+        order = np.argsort(self.forward_terms, kind="stable")
+        self.chunk_ids = chunk_of_posting[order]
+        self.tfs = self.forward_tfs[order].astype(np.float32)
+        counts = np.bincount(self.forward_terms, minlength=len(self.vocabulary))
+        self.offsets = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        self.chunk_lengths = np.zeros(len(self.chunks), dtype=np.float32)
+        np.add.at(self.chunk_lengths, chunk_of_posting, self.forward_tfs)
+        self.average_length = float(self.chunk_lengths.mean()) if len(self.chunks) else 0.0
+        n = len(self.chunks)
+        self.idf = np.log1p((n - counts + 0.5) / (counts + 0.5)).astype(np.float32)
+        # The length normalization of every chunk only depends on the chunk, so it is computed once
+        self._norm = self.k1 * (1 - self.b + self.b * self.chunk_lengths / max(self.average_length, 1e-9))
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def search(self, query, k=5):
+        """Return the top `k` chunks for `query` by BM25 score, best first."""
+        term_ids = {self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary}
+        if not term_ids or not self.chunks:
+            return []
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            ids = self.chunk_ids[start:end]
+            tf = self.tfs[start:end]
+            scores[ids] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + self._norm[ids])
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [Chunk(*self.chunks[i], score=float(scores[i])) for i in candidates]
+
+    def text(self, chunk):
+        """The text of a chunk, read from the pack."""
+        if self._reader is None:
+            self._reader = PackReader(self.pack_path)
+        return bytes(self._reader.view(chunk.path)[chunk.start:chunk.end]).decode("utf-8", errors="ignore")
+
+    def context(self, query, k=5, budget=512):
+        """Top chunks for `query` formatted for a prompt, within `budget` estimated tokens."""
+        parts = []
+        used = 0
+        for chunk in self.search(query, k):
+            part = f"{chunk.path} (lines {chunk.start_line + 1}-{chunk.end_line}):\n{self.text(chunk).rstrip()}"
+            tokens = estimate_tokens(part)
+            if parts and used + tokens > budget:
+                break
+            parts.append(part)
+            used += tokens
+        return "\n\n".join(parts)
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    # Persistence
+
+    def save(self, index_path):
+        with open(index_path + ".json.tmp", "w", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "version": INDEX_VERSION,
+                "pack": os.path.abspath(self.pack_path),
+                "vocabulary": list(self.vocabulary),
+                "files": self.files,
+                "chunks": self.chunks,
+            }))
+        with open(index_path + ".npz.tmp", "wb") as f:
+            np.savez(f, forward_offsets=self.forward_offsets, forward_terms=self.forward_terms, forward_tfs=self.forward_tfs)
+        os.replace(index_path + ".npz.tmp", index_path + ".npz")
+        os.replace(index_path + ".json.tmp", index_path + ".json")
+
+    @classmethod
+    def load(cls, index_path):
+        with open(index_path + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"{index_path} was built by an incompatible version")
+        arrays = np.load(index_path + ".npz")
+        return cls(
+            meta["pack"],
+            {term: i for i, term in enumerate(meta["vocabulary"])},
+            meta["files"],
+            [tuple(chunk) for chunk in meta["chunks"]],
+            arrays["forward_offsets"],
+            arrays["forward_terms"],
+            arrays["forward_tfs"],
+        )
+
+
+def default_index_path(pack_path):
+    folder = pack_path if os.path.isdir(pack_path) else os.path.dirname(pack_path)
+    return os.path.join(folder, INDEX_NAME)
+
+
+def build_index(pack_path, index_path=None, chunk_lines=40):
+    """Build (or incrementally update) the index of the pack at `pack_path` and save it.
+
+    Files whose content hash is unchanged since the previous build keep their
+    chunks and term counts; only new and changed files are read and tokenized.
+    """
+    index_path = index_path or default_index_path(pack_path)
+    previous = None
+    if os.path.exists(index_path + ".json"):
+        try:
+            previous = ChunkIndex.load(index_path)
+        except (OSError, ValueError, KeyError):
+            previous = None
+    vocabulary = dict(previous.vocabulary) if previous is not None else {}
+
+    files = {}
+    chunks = []
+    lengths, term_parts, tf_parts = [], [], []
+    with PackReader(pack_path) as reader:
+        for path in reader.paths():
+            entry = reader.entries[path]
+            if "error" in entry:
+                continue
+            old = previous.files.get(path) if previous is not None else None
+            first = len(chunks)
+            digest = reader.digest(path)
+            if old is not None and old["sha256"] == digest and old.get("chunk_lines") == chunk_lines:
+                # Unchanged: carry the chunks and their term counts over
+                start, count = old["first_chunk"], old["chunks"]
+                chunks.extend(previous.chunks[start:start + count])
+                begin, end = previous.forward_offsets[start], previous.forward_offsets[start + count]
+                lengths.append(np.diff(previous.forward_offsets[start:start + count + 1]))
+                term_parts.append(previous.forward_terms[begin:end])
+                tf_parts.append(previous.forward_tfs[begin:end])
+            else:
+                content = reader.read_bytes(path)
+                chunk_lengths = []
+                for start_line, end_line, start, end in split_chunks(content, chunk_lines):
+                    counts = {}
+                    for term in tokenize(content[start:end].decode("utf-8", errors="ignore")):
+                        term_id = vocabulary.setdefault(term, len(vocabulary))
+                        counts[term_id] = counts.get(term_id, 0) + 1
+                    chunks.append((path, start_line, end_line, start, end))
+                    chunk_lengths.append(len(counts))
+                    term_parts.append(np.fromiter(counts.keys(), dtype=np.int32, count=len(counts)))
+                    tf_parts.append(np.fromiter(counts.values(), dtype=np.int32, count=len(counts)))
+                lengths.append(np.array(chunk_lengths, dtype=np.int64))
+            files[path] = {
+                "sha256": digest,
+                "first_chunk": first,
+                "chunks": len(chunks) - first,
+                "chunk_lines": chunk_lines,
+            }
+
+    forward_offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    if lengths:
+        np.cumsum(np.concatenate(lengths), out=forward_offsets[1:])
+    forward_terms = np.concatenate(term_parts) if term_parts else np.zeros(0, dtype=np.int32)
+    forward_tfs = np.concatenate(tf_parts) if tf_parts else np.zeros(0, dtype=np.int32)
+    index = ChunkIndex(pack_path, vocabulary, files, chunks, forward_offsets, forward_terms, forward_tfs)
+    index.save(index_path)
+    return index
+
+
+_retriever = None
+
+
+def get_retriever():
+    """Return the index named by RETRIEVAL_INDEX (an index path or a pack folder), or None if it is not set."""
+    global _retriever
+    if _retriever is None:
+        path = os.environ.get("RETRIEVAL_INDEX")
+        if not path:
+            return None
+        if os.path.isdir(path):
+            path = default_index_path(path)
+        _retriever = ChunkIndex.load(path)
+    return _retriever
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    start = time.perf_counter()
+    built = build_index(sys.argv[1])
+    print(f"Indexed {len(built)} chunks from {sys.argv[1]} in {time.perf_counter() - start:.2f}s.")
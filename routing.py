@@ -0,0 +1,247 @@
+"""Strategy routing without a model call.
+
+`StrategyClassifier` is a nearest-centroid classifier over hashed word and
+word-pair features, built from a few example prompts per strategy; it picks a
+strategy in microseconds. `Router` caches its decisions per prompt and only
+asks the model (an optional async `fallback`) when the classifier is unsure.
+`AgentRegistry` finds agents by name or capability with dict lookups.
+"""
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from enum import Enum
+
+import numpy as np
+
+import telemetry
+
+
+class Strategy(str, Enum):
+    SEQUENTIAL = "Sequential Chain"
+    PARALLEL = "Parallel Chain"
+    COLLABORATIVE = "Collaborative Multi-Agent"
+    CRITIC_ACTOR = "Critic-Actor"
+    GENERAL = "General"
+
+
+# Most agents working at once under each strategy, so one request cannot oversubscribe the backend
+CONCURRENCY_LIMITS = {
+    Strategy.SEQUENTIAL: 1,
+    Strategy.PARALLEL: 4,
+    Strategy.COLLABORATIVE: 2,
+    Strategy.CRITIC_ACTOR: 1,
+    Strategy.GENERAL: 1,
+}
+
+DEFAULT_EXAMPLES = {
+    Strategy.SEQUENTIAL: [
+        "solve this math problem step by step",
+        "calculate the result and then convert it",
+        "first compute the total then apply the discount",
+        "math equation to solve",
+        "what is the sum of these numbers",
+        "follow these steps in order",
+        "translate the text and then summarize it",
+    ],
+    Strategy.PARALLEL: [
+        "compare several independent options",
+        "list the pros and cons of each approach",
+        "brainstorm multiple ideas at once",
+        "give me different alternatives for this",
+        "evaluate each of these candidates separately",
+        "research these topics independently",
+        "suggest a few names for my project",
+    ],
+    Strategy.COLLABORATIVE: [
+        "create a phone calculator app",
+        "design the architecture of a web service",
+        "build a complex system with several components",
+        "plan and implement a new feature",
+        "solve this logic puzzle together",
+        "write a program and review it",
+        "develop a strategy for a complex problem",
+    ],
+    Strategy.CRITIC_ACTOR: [
+        "critique and improve this essay",
+        "review my solution and give feedback",
+        "refine this draft until it is good",
+        "find the flaws in this argument and fix them",
+        "a complex problem that needs careful review",
+    ],
+    Strategy.GENERAL: [
+        "who wrote this famous novel",
+        "what is the capital of france",
+        "explain how photosynthesis works",
+        "tell me about the history of rome",
+        "give me a method to solve the lottery",
+        "write a poem",
+    ],
+}
+
+ALIASES = {
+    Strategy.SEQUENTIAL: ("sequential",),
+    Strategy.PARALLEL: ("parallel",),
+    Strategy.COLLABORATIVE: ("collaborative", "multi-agent"),
+    Strategy.CRITIC_ACTOR: ("critic", "actor"),
+    Strategy.GENERAL: ("general",),
+}
+
+ROUTING_DECISIONS = telemetry.REGISTRY.counter(
+    "routing_decisions_total", "Strategy decisions by strategy and source (classifier, model, cache).", ["strategy", "source"]
+)
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def features(text, dim):
+    """Hashed unigram and bigram features of `text`: (indexes, counts)."""
+    words = _WORD.findall(text.lower())
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not grams:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    # crc32 rather than hash(): str hashes change between processes
+    indexes = np.fromiter((zlib.crc32(gram.encode("utf-8")) % dim for gram in grams), dtype=np.int64, count=len(grams))
+    indexes, counts = np.unique(indexes, return_counts=True)
+    return indexes, counts.astype(np.float32)
+
+
+class StrategyClassifier:
+    """Picks the strategy whose example prompts are closest (cosine) to a prompt."""
+
+    def __init__(self, examples=None, strategies=None, dim=1 << 14, temperature=0.1):
+        examples = examples or DEFAULT_EXAMPLES
+        self.strategies = list(strategies or examples)
+        self.dim = dim
+        self.temperature = temperature
+        self.centroids = np.zeros((len(self.strategies), dim), dtype=np.float32)
+        for row, strategy in enumerate(self.strategies):
+            for example in examples.get(strategy, ()):
+                indexes, counts = features(example, dim)
+                if len(indexes):
+                    self.centroids[row, indexes] += counts / np.linalg.norm(counts)
+            norm = np.linalg.norm(self.centroids[row])
+            if norm:
+                self.centroids[row] /= norm
+
+    def scores(self, text):
+        indexes, counts = features(text, self.dim)
+        if not len(indexes):
+            return np.zeros(len(self.strategies), dtype=np.float32)
+        return self.centroids[:, indexes] @ (counts / np.linalg.norm(counts))
+
+    def predict(self, text):
+        """(strategy, confidence), the confidence being the softmax probability of the best strategy."""
+        scores = self.scores(text)
+        weights = np.exp((scores - scores.max()) / self.temperature)
+        best = int(np.argmax(scores))
+        return self.strategies[best], float(weights[best] / weights.sum())
+
+
+def parse_strategy(text, strategies):
+    """The strategy a free-text (model) answer names first, or None."""
+    text = text.lower()
+    found = []
+    for strategy in strategies:
+        names = (strategy.value.lower(),) + ALIASES.get(strategy, ())
+        positions = [text.find(name) for name in names if name in text]
+        if positions:
+            found.append((min(positions), strategy))
+    return min(found)[1] if found else None
+
+
+class Decision:
+    def __init__(self, strategy, confidence, source):
+        self.strategy = strategy
+        self.confidence = confidence
+        self.source = source  # "classifier", "model" or "cache"
+
+    def __repr__(self):
+        return f"Decision({self.strategy.value!r}, {self.confidence:.2f}, {self.source!r})"
+
+
+class Router:
+    """Decides a strategy per prompt: cached, else classified, else (when unsure) asked to `fallback`.
+
+    `fallback` is an async callable taking the prompt and returning free text
+    that names a strategy. Without one, the classifier always decides.
+    """
+
+    def __init__(self, strategies=None, classifier=None, fallback=None, threshold=0.5, cache_size=1024):
+        self.classifier = classifier or StrategyClassifier(strategies=strategies)
+        self.strategies = self.classifier.strategies
+        self.fallback = fallback
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # normalized prompt -> Decision
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(prompt):
+        return " ".join(prompt.lower().split())
+
+    def _cached(self, key):
+        with self._lock:
+            decision = self._cache.get(key)
+            if decision is not None:
+                self._cache.move_to_end(key)
+                ROUTING_DECISIONS.inc(strategy=decision.strategy.value, source="cache")
+                return Decision(decision.strategy, decision.confidence, "cache")
+        return None
+
+    def _store(self, key, decision):
+        ROUTING_DECISIONS.inc(strategy=decision.strategy.value, source=decision.source)
+        with self._lock:
+            self._cache[key] = decision
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return decision
+
+    def route(self, prompt):
+        """Decide with the classifier only."""
+        key = self.key(prompt)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        strategy, confidence = self.classifier.predict(prompt)
+        return self._store(key, Decision(strategy, confidence, "classifier"))
+
+    async def aroute(self, prompt):
+        """Decide with the classifier, asking the fallback when its confidence is below the threshold."""
+        key = self.key(prompt)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        strategy, confidence = self.classifier.predict(prompt)
+        if confidence < self.threshold and self.fallback is not None:
+            answer = await self.fallback(prompt)
+            named = parse_strategy(answer, self.strategies)
+            if named is not None:
+                return self._store(key, Decision(named, 1.0, "model"))
+        return self._store(key, Decision(strategy, confidence, "classifier"))
+
+
+class AgentRegistry:
+    """Agents by name and by capability."""
+
+    def __init__(self):
+        self.by_name = {}
+        self.by_capability = {}
+
+    def register(self, agent, capabilities=()):
+        self.by_name[agent.name] = agent
+        for capability in capabilities:
+            self.by_capability.setdefault(capability, []).append(agent)
+        return agent
+
+    def get(self, name):
+        return self.by_name[name]
+
+    def with_capability(self, capability):
+        return self.by_capability.get(capability, [])
+
+    def first(self, capability):
+        agents = self.by_capability.get(capability)
+        if not agents:
+            raise KeyError(f"No agent with capability {capability!r}")
+        return agents[0]
@@ -0,0 +1,161 @@
+import asyncio
+import bisect
+import itertools
+import math
+import os
+import time
+from collections import Counter
+
+
+class QueueFullError(Exception):
+    """Raised when a request cannot even be queued; carries the HTTP status and Retry-After."""
+
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A request's place in the admission queue."""
+
+    def __init__(self, scheduler, client_id, priority, seq):
+        self.scheduler = scheduler
+        self.client_id = client_id
+        self.priority = priority
+        self.seq = seq
+        self.admitted = False
+        self.released = False
+        self.enqueued_at = time.monotonic()
+        self.admitted_at = None
+        self._changed = asyncio.Event()
+
+    def sort_key(self):
+        return (self.priority, self.seq)
+
+    def __lt__(self, other):
+        return self.sort_key() < other.sort_key()
+
+    @property
+    def position(self):
+        """1-based position in the wait queue, 0 once admitted."""
+        return 0 if self.admitted else self.scheduler.position(self)
+
+    async def wait(self):
+        """Yield the queue position each time it changes, finishing once admitted."""
+        last = None
+        while not self.admitted:
+            position = self.position
+            if position != last:
+                last = position
+                yield position
+            self._changed.clear()
+            if not self.admitted:
+                await self._changed.wait()
+        if last is not None:
+            yield 0  # Tell a client that was told it was queued that it has been admitted
+
+    def release(self):
+        self.scheduler.release(self)
+
+
+class AdmissionScheduler:
+    """Bounds concurrent /solve orchestrations globally and per client.
+
+    Requests beyond the caps wait in a priority queue (lower priority value
+    first, FIFO within a priority). A client waiting at its own cap does not
+    block other clients queued behind it. When the queue is full, `enqueue`
+    raises QueueFullError with 503 (server saturated) or 429 (this client has
+    too many queued requests) and a Retry-After estimate.
+
+    Priorities come from clients, so they are clamped to
+    [`min_priority`, `max_priority`]: by default a client can lower its own
+    requests' priority but not jump ahead of others.
+    """
+
+    def __init__(self, max_active=4, max_per_client=2, max_queue=64, max_queued_per_client=8,
+                 min_priority=0, max_priority=9):
+        self.max_active = max_active
+        self.max_per_client = max_per_client
+        self.max_queue = max_queue
+        self.max_queued_per_client = max_queued_per_client
+        self.min_priority = min_priority
+        self.max_priority = max_priority
+        self.active = 0
+        self._active_by_client = Counter()
+        self._queued_by_client = Counter()
+        self._queue = []  # Tickets sorted by (priority, seq)
+        self._seq = itertools.count()
+        self._avg_service_time = 30.0  # Seconds, exponentially weighted
+
+    @classmethod
+    def from_env(cls):
+        env = os.environ
+        return cls(
+            max_active=int(env.get("SOLVE_MAX_ACTIVE", 4)),
+            max_per_client=int(env.get("SOLVE_MAX_PER_CLIENT", 2)),
+            max_queue=int(env.get("SOLVE_MAX_QUEUE", 64)),
+            max_queued_per_client=int(env.get("SOLVE_MAX_QUEUED_PER_CLIENT", 8)),
+            min_priority=int(env.get("SOLVE_MIN_PRIORITY", 0)),
+            max_priority=int(env.get("SOLVE_MAX_PRIORITY", 9)),
+        )
+
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    def retry_after(self):
+        waves = (len(self._queue) + 1) / max(self.max_active, 1)
+        return max(1, math.ceil(self._avg_service_time * waves))
+
+    def enqueue(self, client_id, priority=0):
+        if len(self._queue) >= self.max_queue:
+            raise QueueFullError("Server is at capacity, try again later.", 503, self.retry_after())
+        if self._queued_by_client[client_id] >= self.max_queued_per_client:
+            raise QueueFullError("Too many queued requests for this client.", 429, self.retry_after())
+        priority = min(max(priority, self.min_priority), self.max_priority)
+        ticket = Ticket(self, client_id, priority, next(self._seq))
+        bisect.insort(self._queue, ticket)
+        self._queued_by_client[client_id] += 1
+        self._dispatch()
+        return ticket
+
+    def position(self, ticket):
+        index = bisect.bisect_left(self._queue, ticket)
+        if index < len(self._queue) and self._queue[index] is ticket:
+            return index + 1
+        return 0
+
+    def release(self, ticket):
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.admitted:
+            self.active -= 1
+            self._active_by_client[ticket.client_id] -= 1
+            elapsed = time.monotonic() - ticket.admitted_at
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * elapsed
+        else:
+            self._queue.remove(ticket)
+            self._queued_by_client[ticket.client_id] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        admitted = []
+        for ticket in self._queue:
+            if self.active >= self.max_active:
+                break
+            if self._active_by_client[ticket.client_id] >= self.max_per_client:
+                continue
+            ticket.admitted = True
+            ticket.admitted_at = time.monotonic()
+            self.active += 1
+            self._active_by_client[ticket.client_id] += 1
+            self._queued_by_client[ticket.client_id] -= 1
+            admitted.append(ticket)
+        if admitted:
+            admitted_ids = set(map(id, admitted))
+            self._queue = [ticket for ticket in self._queue if id(ticket) not in admitted_ids]
+        # Every waiter's position may have moved
+        for ticket in admitted + self._queue:
+            ticket._changed.set()
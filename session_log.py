@@ -0,0 +1,149 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def format_event_id(session_id, index):
+    return f"{session_id}:{index}"
+
+
+def parse_event_id(event_id):
+    """Split a `<session>:<index>` SSE event id; returns (None, None) if it is malformed."""
+    session_id, _, index = (event_id or "").rpartition(":")
+    if not session_id or not index.lstrip("-").isdigit():
+        return None, None
+    return session_id, int(index)
+
+
+class SessionLog:
+    """Append-only SQLite log of every event of every /solve session.
+
+    Events are numbered from 0 in the order they were sent, so a client that
+    reconnects with the id of the last event it received can be sent the rest,
+    and a finished session can be replayed without running the agents again.
+    Writes are queued and applied by a writer thread, one transaction for all
+    the writes queued since the last one, so the event loop never waits on
+    SQLite. Reads see every write queued before them. Only the newest
+    `max_sessions` sessions are kept (None keeps them all).
+    """
+
+    def __init__(self, path=":memory:", max_sessions=None):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.max_sessions = max_sessions
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, prompt TEXT NOT NULL, status TEXT NOT NULL, "
+            "created_at REAL NOT NULL, finished_at REAL);"
+            "CREATE INDEX IF NOT EXISTS sessions_created_at ON sessions (created_at);"
+            "CREATE TABLE IF NOT EXISTS events ("
+            "session_id TEXT NOT NULL, event_id INTEGER NOT NULL, event TEXT NOT NULL, "
+            "PRIMARY KEY (session_id, event_id));"
+        )
+        self._db.commit()
+        self._writes = queue.Queue()  # (sql, params), a threading.Event to set once written, or None to stop
+        self._writer = threading.Thread(target=self._write_loop, name="session-log-writer", daemon=True)
+        self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            writes = [self._writes.get()]
+            while True:
+                try:
+                    writes.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            with self._lock:
+                for write in writes:
+                    if isinstance(write, tuple):
+                        try:
+                            self._db.execute(*write)
+                        except sqlite3.Error as e:
+                            print(f"Session log write failed: {e}")
+                self._db.commit()
+            for write in writes:
+                if isinstance(write, threading.Event):
+                    write.set()
+            if None in writes:
+                return
+
+    def flush(self):
+        """Block until every write queued so far is committed."""
+        written = threading.Event()
+        self._writes.put(written)
+        written.wait()
+
+    def create(self, session_id, prompt):
+        self._writes.put((
+            "INSERT INTO sessions (id, prompt, status, created_at) VALUES (?, ?, 'running', ?)",
+            (session_id, prompt, time.time()),
+        ))
+        if self.max_sessions is not None:
+            self._prune(self.max_sessions)
+
+    def _prune(self, keep):
+        # Running sessions are never pruned, so their streams can still be resumed
+        expired = ("SELECT id FROM sessions WHERE status != 'running' AND id NOT IN "
+                   "(SELECT id FROM sessions ORDER BY created_at DESC LIMIT ?)")
+        self._writes.put((f"DELETE FROM events WHERE session_id IN ({expired})", (keep,)))
+        self._writes.put((f"DELETE FROM sessions WHERE id IN ({expired})", (keep,)))
+
+    def append(self, session_id, event_id, event):
+        self._writes.put((
+            "INSERT INTO events (session_id, event_id, event) VALUES (?, ?, ?)",
+            (session_id, event_id, json.dumps(event)),
+        ))
+
+    def finish(self, session_id, status="finished"):
+        self._writes.put((
+            "UPDATE sessions SET status = ?, finished_at = ? WHERE id = ?", (status, time.time(), session_id)
+        ))
+
+    def session(self, session_id):
+        self.flush()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, prompt, status, created_at, finished_at FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "prompt", "status", "created_at", "finished_at"), row))
+
+    def events(self, session_id, after=-1):
+        """Return [(event_id, event)] for events numbered above `after`."""
+        self.flush()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT event_id, event FROM events WHERE session_id = ? AND event_id > ? ORDER BY event_id",
+                (session_id, after),
+            ).fetchall()
+        return [(event_id, json.loads(event)) for event_id, event in rows]
+
+    def close(self):
+        self._writes.put(None)
+        self._writer.join()
+        with self._lock:
+            self._db.close()
+
+
+_log = None
+
+
+def get_session_log():
+    """Return the process-wide log stored in SESSION_LOG_DB (default sessions.db; ":memory:" keeps it in memory).
+
+    It keeps the newest SESSION_LOG_MAX_SESSIONS sessions (default 1000; 0 keeps them all).
+    """
+    global _log
+    if _log is None:
+        max_sessions = int(os.environ.get("SESSION_LOG_MAX_SESSIONS", "1000"))
+        _log = SessionLog(os.environ.get("SESSION_LOG_DB", "sessions.db"), max_sessions=max_sessions or None)
+    return _log
@@ -0,0 +1,199 @@
+import contextlib
+import contextvars
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+
+logger = logging.getLogger("telemetry")
+
+# Trace id of the /solve run being served, and the role/iteration of the current agent turn
+current_trace = contextvars.ContextVar("current_trace", default=None)
+_labels = contextvars.ContextVar("span_labels", default={})
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._samples(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        entry = self._values.get(self._key(labels))
+        return entry[0][-1] if entry else 0
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines = [
+            f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(bound))])} {count}"
+            for bound, count in zip(self.buckets, counts)
+        ]
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics rendered in the Prometheus text exposition format, without a client library."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+PHASE_SECONDS = REGISTRY.histogram(
+    "agent_phase_seconds",
+    "Time spent per phase of an agent turn (prompt_build, time_to_first_token, generation, verification).",
+    ["phase", "role", "iteration"],
+)
+GENERATED_TOKENS = REGISTRY.counter(
+    "agent_generated_tokens_total", "Estimated tokens generated by the model.", ["role"]
+)
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    "agent_tokens_per_second",
+    "Estimated generation rate of each model call.",
+    ["role"],
+    buckets=(1, 2.5, 5, 10, 20, 40, 80, 160, 320),
+)
+QUEUE_WAIT_SECONDS = REGISTRY.histogram("solve_queue_wait_seconds", "Time /solve runs waited for admission.")
+SOLVE_REQUESTS = REGISTRY.counter(
+    "solve_requests_total", "/solve requests by outcome (started, coalesced, rejected).", ["outcome"]
+)
+
+
+@contextlib.contextmanager
+def labels(**values):
+    """Tag the spans recorded inside the block, e.g. with the agent role and iteration."""
+    previous = _labels.get()
+    _labels.set({**previous, **values})
+    try:
+        yield
+    finally:
+        # Not reset by token: async generators may be finalized from another context
+        _labels.set(previous)
+
+
+def current_labels():
+    return _labels.get()
+
+
+def observe(phase, seconds, **extra):
+    tags = {**_labels.get(), **extra}
+    PHASE_SECONDS.observe(seconds, phase=phase, **tags)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps({"trace_id": current_trace.get(), "phase": phase, "seconds": round(seconds, 6), **tags}))
+
+
+@contextlib.contextmanager
+def span(phase, **extra):
+    """Time the block as `phase`, tagged with the current labels."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(phase, time.perf_counter() - start, **extra)
+
+
+def record_generation(tokens, seconds):
+    role = _labels.get().get("role", "")
+    GENERATED_TOKENS.inc(tokens, role=role)
+    if seconds > 0:
+        TOKENS_PER_SECOND.observe(tokens / seconds, role=role)
@@ -1,11 +1,15 @@
+import asyncio
 import unittest
-from agents import ProblemSolvingAgent, initialize_agents, orchestrate_problem_solving
+from agents import SPECULATIONS, Environment, ProblemSolvingAgent, initialize_agents, orchestrate_problem_solving
+from consensus import STATUS_INSTRUCTION
+from fake_ollama import FakeBackend, FakeOllamaServer, scripted_responder
+from llm_backend import BackendConfig, OllamaHTTPBackend
 
 class TestAgents(unittest.TestCase):
 
     def test_problem_solving_agent(self):
-        agent = ProblemSolvingAgent("TestAgent")
-        response = agent.process_message("Test message")
+        agent = ProblemSolvingAgent("TestAgent", FakeBackend(), cache=False)
+        response = asyncio.run(agent.process_message("Test message"))
         self.assertIsInstance(response, str)
 
     def test_initialize_agents(self):
@@ -14,10 +18,106 @@ class TestAgents(unittest.TestCase):
         self.assertTrue(all(isinstance(agent, ProblemSolvingAgent) for agent in agents))
 
     def test_orchestrate_problem_solving(self):
-        agents = initialize_agents()
-        conversation, solution = orchestrate_problem_solving(agents, "Test prompt")
-        self.assertIsInstance(conversation, list)
-        self.assertIsInstance(solution, str)
+        backend = FakeBackend()
+        agents = [ProblemSolvingAgent("Solver", backend, cache=False), ProblemSolvingAgent("Reviewer", backend, cache=False)]
+
+        async def collect():
+            return [message async for message in orchestrate_problem_solving(agents, "Test prompt")]
+
+        conversation = asyncio.run(collect())
+        self.assertTrue(all(isinstance(message, str) for message in conversation))
+        self.assertTrue(conversation[0].startswith("Solver: "))
+        self.assertEqual(conversation[-1], "Solution verified, stopping conversation.")
+
+class TestStreamingConversation(unittest.IsolatedAsyncioTestCase):
+
+    async def test_deltas_are_streamed_before_each_message(self):
+        with FakeOllamaServer() as server:
+            backend = OllamaHTTPBackend(BackendConfig(base_url=server.base_url))
+            agents = [ProblemSolvingAgent("Solver", backend, cache=False), ProblemSolvingAgent("Reviewer", backend, cache=False)]
+            events = [event async for event in orchestrate_problem_solving(agents, "Solve 1+1", stream=True, fast_path=False)]
+            await backend.aclose()
+
+        deltas = [event for event in events if isinstance(event, dict)]
+        self.assertTrue(deltas)
+        self.assertTrue(all(event["agent"] == "Solver" and event["turn"] == 1 for event in deltas))
+        self.assertIsInstance(events[0], dict)
+        first_message = next(event for event in events if isinstance(event, str))
+        self.assertEqual(first_message, "Solver: " + "".join(event["delta"] for event in deltas).strip())
+        self.assertEqual(events[-1], "Solution verified, stopping conversation.")
+
+class TestContextReuse(unittest.IsolatedAsyncioTestCase):
+
+    async def run_conversation(self, server):
+        backend = OllamaHTTPBackend(BackendConfig(base_url=server.base_url))
+        agents = [ProblemSolvingAgent("Solver", backend, cache=False), ProblemSolvingAgent("Reviewer", backend, cache=False)]
+        events = [event async for event in orchestrate_problem_solving(agents, "Write a poem")]
+        await backend.aclose()
+        return events
+
+    async def test_later_turns_send_only_the_new_suffix(self):
+        with FakeOllamaServer(responder=lambda prompt: "Here is a draft.") as server:
+            events = await self.run_conversation(server)
+        self.assertEqual(events[-1], "Conversation ended without a verified solution.")
+        turns = [request for request in server.requests if "As the" in request["prompt"]]
+        self.assertNotIn("context", turns[0])
+        self.assertIn("Initial Prompt: Write a poem", turns[0]["prompt"])
+        refine = turns[2]
+        self.assertTrue(refine["context"])
+        self.assertEqual(refine["prompt"], "Reviewer: Here is a draft.\n"
+                                           "As the Solver, please refine your solution based on the Reviewer's feedback. "
+                                           f"{STATUS_INSTRUCTION}")
+
+    async def test_falls_back_to_full_prompt_when_context_is_rejected(self):
+        with FakeOllamaServer(responder=lambda prompt: "Here is a draft.") as server:
+            server.reject_context = True
+            events = await self.run_conversation(server)
+        self.assertEqual(len([event for event in events if event.startswith("Solver:")]), 6)
+        full_prompts = [request for request in server.requests if "context" not in request]
+        self.assertTrue(all("Initial Prompt: Write a poem" in request["prompt"] for request in full_prompts))
+
+class TestPipelinedConversation(unittest.IsolatedAsyncioTestCase):
+
+    async def converse(self, pipeline):
+        responder = scripted_responder([
+            ("Do you agree", "No, the problem is not solved."),
+            ("As the Reviewer", "The draft looks incomplete. Please add more detail."),
+            ("refine", "Refined draft. It now has more detail."),
+        ], default="First draft. It still needs work.")
+        backend = FakeBackend(responder, tokens_per_second=500)
+        env = Environment(pipeline=pipeline, speculate_tokens=2, max_iterations=2)
+        env.add_agent(ProblemSolvingAgent("Solver", backend, cache=False))
+        env.add_agent(ProblemSolvingAgent("Reviewer", backend, cache=False))
+        env.initiate_conversation("Solve 1+1")
+        messages = [message async for message in env.run_conversation()]
+        return messages, backend
+
+    async def test_pipelined_conversation_matches_sequential(self):
+        accepted = SPECULATIONS.value(outcome="accepted")
+        discarded = SPECULATIONS.value(outcome="discarded")
+        sequential, _ = await self.converse(pipeline=False)
+        pipelined, backend = await self.converse(pipeline=True)
+
+        self.assertEqual(pipelined, sequential)
+        # Each draft settles twice: the speculation on the first sentence is
+        # discarded, the one on the complete draft is continued
+        self.assertEqual(SPECULATIONS.value(outcome="accepted") - accepted, 4)
+        self.assertEqual(SPECULATIONS.value(outcome="discarded") - discarded, 4)
+        speculative = [prompt for prompt in backend.prompts if prompt.endswith("Solver: First draft.\nAs the Reviewer, please evaluate the Solver's solution and "
+                                                                                 f"suggest improvements if necessary. {STATUS_INSTRUCTION}")]
+        self.assertEqual(len(speculative), 2)
+
+    async def test_speculation_is_cancelled_when_solved(self):
+        backend = FakeBackend(tokens_per_second=500)
+        env = Environment(pipeline=True, speculate_tokens=2)
+        env.add_agent(ProblemSolvingAgent("Solver", backend, cache=False))
+        env.add_agent(ProblemSolvingAgent("Reviewer", backend, cache=False))
+        env.initiate_conversation("Solve 1+1")
+        messages = [message async for message in env.run_conversation()]
+
+        self.assertEqual(messages[-1], "Solution verified, stopping conversation.")
+        self.assertIsNone(env.speculation)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,48 @@
+import asyncio
+import unittest
+
+from coalescing import RunRegistry, coalesce_key
+
+
+async def counting_source(calls, count=3, delay=0.01):
+    calls.append(1)
+    for i in range(count):
+        await asyncio.sleep(delay)
+        yield f"event {i}"
+
+
+class TestRunRegistry(unittest.IsolatedAsyncioTestCase):
+
+    def test_key(self):
+        self.assertEqual(coalesce_key("  Solve 1+1\n"), coalesce_key("solve   1+1"))
+
+    async def test_late_joiner_replays_then_follows(self):
+        registry = RunRegistry()
+        calls = []
+        run = registry.start("Solve 1+1", counting_source(calls))
+        first = asyncio.create_task(self.collect(run))
+        await asyncio.sleep(0.015)
+        self.assertIs(registry.get("solve 1+1"), run)
+        second = await self.collect(registry.get("solve 1+1"))
+        self.assertEqual(await first, ["event 0", "event 1", "event 2"])
+        self.assertEqual(second, ["event 0", "event 1", "event 2"])
+        self.assertEqual(len(calls), 1)
+        await asyncio.sleep(0)
+        self.assertIsNone(registry.get("Solve 1+1"))
+
+    async def test_run_is_cancelled_when_abandoned(self):
+        registry = RunRegistry(idle_timeout=0.01)
+        run = registry.start("slow", counting_source([], count=100, delay=0.01))
+        subscription = run.subscribe()
+        await subscription.__anext__()
+        await subscription.aclose()
+        await asyncio.wait_for(run.wait(), 1)
+        self.assertTrue(run.done)
+        self.assertLess(len(run.events), 100)
+
+    async def collect(self, run):
+        return [event async for event in run.subscribe()]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import asyncio
+import time
+import unittest
+
+from agents import Environment, ProblemSolvingAgent
+from consensus import QuorumPolicy, ask_verdict, claims_solved, parse_verdict, verify_concurrently, verify_sequentially
+from fake_ollama import FakeOllamaServer, scripted_responder
+from llm_backend import BackendConfig, OllamaHTTPBackend
+
+
+class FakeVerifier:
+    def __init__(self, name, answer, delay):
+        self.name = name
+        self.answer = answer
+        self.delay = delay
+        self.cancelled = False
+
+    async def ask(self):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return self.answer
+
+
+async def ask(agent):
+    return await agent.ask()
+
+
+def approves(agent, response):
+    return response == "yes"
+
+
+class TestQuorumPolicy(unittest.TestCase):
+
+    def test_decide(self):
+        self.assertFalse(QuorumPolicy("all").decide(2, 1, 3))
+        self.assertIsNone(QuorumPolicy("all").decide(2, 0, 3))
+        self.assertTrue(QuorumPolicy("majority").decide(2, 0, 3))
+        self.assertIsNone(QuorumPolicy("majority").decide(1, 1, 3))
+        self.assertFalse(QuorumPolicy("majority").decide(1, 2, 3))
+        self.assertTrue(QuorumPolicy("first-k", k=1).decide(1, 0, 3))
+        with self.assertRaises(ValueError):
+            QuorumPolicy("most")
+
+
+class TestVerification(unittest.IsolatedAsyncioTestCase):
+
+    async def test_rejection_cancels_remaining_verifiers(self):
+        slow = FakeVerifier("Slow", "yes", 5)
+        agents = [FakeVerifier("Fast", "no", 0.01), slow]
+        start = time.perf_counter()
+        self.assertFalse(await verify_concurrently(agents, ask, approves))
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertTrue(slow.cancelled)
+
+    async def test_concurrent_latency_is_max_not_sum(self):
+        agents = [FakeVerifier(f"A{i}", "yes", 0.1) for i in range(3)]
+        start = time.perf_counter()
+        self.assertTrue(await verify_concurrently(agents, ask, approves))
+        self.assertLess(time.perf_counter() - start, 0.25)
+
+    async def test_majority_tolerates_one_rejection(self):
+        agents = [FakeVerifier("A", "no", 0.01), FakeVerifier("B", "yes", 0.02), FakeVerifier("C", "yes", 0.03)]
+        policy = QuorumPolicy("majority")
+        self.assertTrue(await verify_concurrently(agents, ask, approves, policy))
+        self.assertTrue(await verify_sequentially(agents, ask, approves, policy))
+
+    async def test_first_k_stops_after_k_approvals(self):
+        slow = FakeVerifier("Slow", "yes", 5)
+        agents = [FakeVerifier("Fast", "yes", 0.01), slow]
+        self.assertTrue(await verify_concurrently(agents, ask, approves, QuorumPolicy("first-k", k=1)))
+        self.assertTrue(slow.cancelled)
+
+
+class ScriptedVerifier:
+    def __init__(self, *replies):
+        self.name = "Verifier"
+        self.replies = list(replies)
+        self.prompts = []
+
+    async def verdict(self, prompt):
+        self.prompts.append(prompt)
+        return self.replies.pop(0)
+
+
+class TestVerdicts(unittest.IsolatedAsyncioTestCase):
+
+    def test_parse_verdict(self):
+        self.assertTrue(parse_verdict('{"verdict": "yes"}'))
+        self.assertFalse(parse_verdict('```json\n{"verdict": "No"}\n```'))
+        self.assertTrue(parse_verdict('{"verdict": true}'))
+        # Substrings of other words are not verdicts
+        for reply in ("I know this works.", "Not only is it correct...", "The answer is 2. Yes.", '{"verdict": "maybe"}', ""):
+            self.assertIsNone(parse_verdict(reply), reply)
+
+    def test_leading_word_fallback(self):
+        # For backends that cannot constrain the reply to JSON: only a leading yes or no counts
+        self.assertFalse(parse_verdict("No, the problem is not solved."))
+        self.assertTrue(parse_verdict('"Yes."'))
+        self.assertTrue(parse_verdict("yes"))
+        self.assertFalse(parse_verdict("  NO"))
+        # The JSON verdict wins over the leading word
+        self.assertTrue(parse_verdict('No doubt: {"verdict": "yes"}'))
+        for reply in ("Yesterday it worked.", "Nobody knows.", "I would say yes."):
+            self.assertIsNone(parse_verdict(reply), reply)
+
+    def test_claims_solved(self):
+        self.assertTrue(claims_solved('The answer is 2.\n{"solved": true}'))
+        self.assertTrue(claims_solved('The answer is 2.\n```json\n{"solved": true}\n```'))
+        for response in ('The answer is 2.\n{"solved": false}', "Yes problem is solved.", "The problem is solved.",
+                         '{"solved": true}\nBut the proof is still missing.', '{"solved": "yes"}', ""):
+            self.assertFalse(claims_solved(response), response)
+
+    async def test_unreadable_reply_is_asked_again_once(self):
+        verifier = ScriptedVerifier("I think it works.", "yes")
+        self.assertTrue(await ask_verdict(verifier, "x = 2"))
+        self.assertEqual(len(verifier.prompts), 2)
+        self.assertIn("exactly one word", verifier.prompts[1])
+
+        verifier = ScriptedVerifier("Hmm.", "Let me think about it.")
+        self.assertFalse(await ask_verdict(verifier, "x = 2"))
+        self.assertEqual(len(verifier.prompts), 2)
+
+    async def test_verdicts_are_capped_to_a_few_tokens(self):
+        responder = scripted_responder([('"verdict"', '{"verdict": "yes"}')])
+        with FakeOllamaServer(responder=responder) as server:
+            backend = OllamaHTTPBackend(BackendConfig(base_url=server.base_url))
+            env = Environment()
+            env.add_agent(ProblemSolvingAgent("Solver", backend, cache=False))
+            env.add_agent(ProblemSolvingAgent("Reviewer", backend, cache=False))
+            self.assertTrue(await env.verify_solution_with_agents("x = 2"))
+            await backend.aclose()
+        self.assertEqual(len(server.requests), 2)
+        self.assertTrue(all(request["options"]["num_predict"] <= 16 for request in server.requests))
+        # Ollama constrains the verdict to JSON
+        self.assertTrue(all(request["format"] == "json" and "format" not in request["options"]
+                            for request in server.requests))
+
+
+if __name__ == '__main__':
+    unittest.main()
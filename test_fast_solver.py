@@ -0,0 +1,64 @@
+import unittest
+from fractions import Fraction
+
+from agents import ProblemSolvingAgent, orchestrate_problem_solving
+from fake_ollama import FakeBackend
+from fast_solver import FastSolverError, evaluate_batch, solve_expression, solve_prompt
+
+
+class TestFastSolver(unittest.TestCase):
+
+    def answer(self, prompt):
+        answer = solve_prompt(prompt)
+        return answer.text if answer is not None else None
+
+    def test_arithmetic(self):
+        self.assertEqual(self.answer("Solve 1+1"), "1+1 = 2")
+        self.assertEqual(self.answer("how much is 1+2?"), "1+2 = 3")
+        self.assertEqual(self.answer("What's 7 times 6?"), "7 times 6 = 42")
+        self.assertEqual(self.answer("0.1 + 0.2"), "0.1 + 0.2 = 0.3")
+        self.assertEqual(self.answer("1/3 + 1/3"), "1/3 + 1/3 = 2/3 ≈ 0.666667")
+        self.assertEqual(self.answer("2^10 + sqrt(16)"), "2^10 + sqrt(16) = 1028")
+        self.assertEqual(self.answer("3(4 + 5)"), "3(4 + 5) = 27")
+
+    def test_algebra(self):
+        self.assertEqual(self.answer("simplify 2x + 3x - x"), "2x + 3x - x = 4*x")
+        self.assertEqual(self.answer("Simplify (x + 1)^2"), "(x + 1)^2 = x^2 + 2*x + 1")
+        self.assertEqual(self.answer("solve 2x + 3 = 7"), "x = 2")
+        self.assertEqual(self.answer("x^2 - 5x + 6 = 0"), "x = 2 or x = 3")
+        self.assertEqual(self.answer("1 + 1 = 3"), "1 + 1 = 3 is false")
+
+    def test_batch(self):
+        self.assertEqual(self.answer("1+1; 2*3"), "1+1 = 2\n2*3 = 6")
+        self.assertIsNone(solve_prompt("1+1; write a poem"))
+        self.assertEqual(evaluate_batch("x^2 + y", [{"x": 1, "y": 2}, {"x": 3, "y": Fraction(1, 2)}]),
+                         [3, Fraction(19, 2)])
+        with self.assertRaisesRegex(FastSolverError, "No value for y"):
+            evaluate_batch("x + y", [{"x": 1}])
+
+    def test_declines_everything_else(self):
+        for prompt in ("Write a poem", "create a phone calculator app", "A + B", "Solve x", "trace 1+1",
+                       "__import__('os').system('ls')", "().__class__.__bases__", "2**100000000", "10**10**10",
+                       "(x + y + z)^40", "1/0", "x = y",
+                       "What is x + y?", "Solve a + b", "simplify x^2 + y", "factorial(100000)", "1" * 600):
+            self.assertIsNone(solve_prompt(prompt), prompt)
+        with self.assertRaises(FastSolverError):
+            solve_expression("open('f')")
+
+
+class TestFastPath(unittest.IsolatedAsyncioTestCase):
+
+    async def test_orchestrator_answers_without_a_model_call(self):
+        backend = FakeBackend()
+        agents = [ProblemSolvingAgent("Solver", backend, cache=False), ProblemSolvingAgent("Reviewer", backend, cache=False)]
+        events = [event async for event in orchestrate_problem_solving(agents, "Solve 1+1", stream=True)]
+        self.assertEqual(events, ["FastSolver: 1+1 = 2", "Solution verified, stopping conversation."])
+        self.assertEqual(backend.prompts, [])
+
+        events = [event async for event in orchestrate_problem_solving(agents, "Solve 1+1", fast_path=False)]
+        self.assertTrue(events[0].startswith("Solver: "))
+        self.assertTrue(backend.prompts)
+
+
+if __name__ == "__main__":
+    unittest.main()
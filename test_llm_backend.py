@@ -0,0 +1,325 @@
+import asyncio
+import contextlib
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from agents import ProblemSolvingAgent, orchestrate_problem_solving
+from fake_ollama import FakeBackend, FakeOllamaServer, default_responder
+from langchain_llm import LocalModelLLM
+from llm_backend import (
+    BackendConfig,
+    BatchingBackend,
+    LLMBackend,
+    LLMBackendError,
+    ModelSession,
+    OllamaHTTPBackend,
+    PooledBackend,
+    SubprocessBackend,
+    create_backend,
+)
+
+
+class TestOllamaHTTPBackend(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.server = FakeOllamaServer(responder=lambda prompt: f"echo: {prompt}").start()
+        self.config = BackendConfig(base_url=self.server.base_url, model="test-model", keep_alive="10m")
+        self.backend = OllamaHTTPBackend(self.config)
+
+    async def asyncTearDown(self):
+        await self.backend.aclose()
+
+    def tearDown(self):
+        self.server.stop()
+
+    async def test_generate(self):
+        response = await self.backend.agenerate("hello", options={"temperature": 0})
+        self.assertEqual(response, "echo: hello")
+        payload = self.server.requests[0]
+        self.assertEqual(payload["model"], "test-model")
+        self.assertEqual(payload["keep_alive"], "10m")
+        self.assertEqual(payload["options"], {"temperature": 0})
+        self.assertFalse(payload["stream"])
+
+    async def test_stream(self):
+        deltas = [delta async for delta in self.backend.astream("one two three")]
+        self.assertGreater(len(deltas), 1)
+        self.assertEqual("".join(deltas), "echo: one two three")
+        self.assertTrue(self.server.requests[0]["stream"])
+
+    async def test_connection_is_kept_alive(self):
+        for i in range(5):
+            await self.backend.agenerate(f"prompt {i}")
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(self.server.connections, 1)
+
+    async def test_http_error_raises(self):
+        self.server.status = 500
+        with self.assertRaises(LLMBackendError):
+            await self.backend.agenerate("hello")
+
+    async def test_agent_uses_backend(self):
+        agent = ProblemSolvingAgent("Solver", backend=self.backend, cache=False)
+        response = await agent.process_message("1+1")
+        self.assertEqual(response, "echo: 1+1")
+
+
+class TestSyncEntryPoints(unittest.TestCase):
+
+    def test_generate_and_stream(self):
+        with FakeOllamaServer(responder=lambda prompt: f"echo: {prompt}") as server:
+            backend = OllamaHTTPBackend(BackendConfig(base_url=server.base_url))
+            self.assertEqual(backend.generate("hi"), "echo: hi")
+            self.assertEqual("".join(backend.stream("hi there")), "echo: hi there")
+            backend.close()
+
+
+class TestLangChainAdapter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_acall_runs_inside_event_loop(self):
+        with FakeOllamaServer(responder=lambda prompt: f"echo: {prompt}") as server:
+            backend = OllamaHTTPBackend(BackendConfig(base_url=server.base_url))
+            llm = LocalModelLLM(backend=backend, response_cache=False)
+            self.assertEqual(await llm.ainvoke("hi"), "echo: hi")
+            chunks = [chunk async for chunk in llm.astream("a b")]
+            self.assertEqual("".join(chunks), "echo: a b")
+            self.assertEqual(llm.invoke("sync", stop=["\n"]), "echo: sync")
+            self.assertEqual(server.requests[-1]["options"], {"stop": ["\n"]})
+            await backend.aclose()
+
+
+class TestBatchingBackend(unittest.IsolatedAsyncioTestCase):
+
+    async def test_concurrent_calls_are_dispatched_together(self):
+        with FakeOllamaServer(responder=lambda prompt: f"echo: {prompt}") as server:
+            inner = OllamaHTTPBackend(BackendConfig(base_url=server.base_url))
+            backend = BatchingBackend(inner, max_batch=4, max_wait=0.05)
+            results = await asyncio.gather(*(backend.agenerate(f"p{i}") for i in range(6)))
+            await backend.aclose()
+        self.assertEqual(results, [f"echo: p{i}" for i in range(6)])
+        # One full batch of 4, then the remaining 2 after max_wait
+        self.assertEqual(backend.batches, 2)
+
+    async def test_errors_are_routed_to_their_caller(self):
+        with FakeOllamaServer() as server:
+            server.status = 500
+            backend = BatchingBackend(OllamaHTTPBackend(BackendConfig(base_url=server.base_url)), max_wait=0.001)
+            with self.assertRaises(LLMBackendError):
+                await backend.agenerate("hi")
+            await backend.aclose()
+
+    async def test_streamed_calls_join_batches(self):
+        backend = BatchingBackend(FakeBackend(), max_batch=4, max_wait=0.05)
+
+        async def collect(prompt):
+            return "".join([delta async for delta in backend.astream(prompt)])
+
+        results = await asyncio.gather(backend.agenerate("p0"), *(collect(f"p{i}") for i in range(1, 4)))
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(backend.batches, 1)
+
+    async def test_cancelled_callers_cancel_their_request(self):
+        cancelled = []
+
+        class Slow(FakeBackend):
+            async def agenerate(self, prompt, options=None, session=None):
+                try:
+                    return await super().agenerate(prompt, options, session)
+                except asyncio.CancelledError:
+                    cancelled.append(prompt)
+                    raise
+
+        backend = BatchingBackend(Slow(latency=10), max_batch=2, max_wait=0.01)
+        tasks = [asyncio.create_task(backend.agenerate(f"p{i}")) for i in range(2)]
+        await asyncio.sleep(0.05)  # Both requests are in flight
+        tasks[0].cancel()
+        await asyncio.sleep(0)
+        self.assertEqual(cancelled, ["p0"])
+        tasks[1].cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        # A caller cancelled while it waits for its batch never sends a request
+        backend = BatchingBackend(Slow(), max_batch=8, max_wait=0.05)
+        waiting = asyncio.create_task(backend.agenerate("early"))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        self.assertEqual(await backend.agenerate("late"), default_responder("late"))
+        self.assertEqual(backend.backend.prompts, ["late"])
+
+
+class TestPooledBackend(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.stack = contextlib.ExitStack()
+        self.servers = [self.stack.enter_context(FakeOllamaServer(responder=lambda prompt: f"echo: {prompt}"))
+                        for _ in range(3)]
+
+    async def asyncTearDown(self):
+        self.stack.close()
+
+    def pool(self, **kwargs):
+        return PooledBackend([OllamaHTTPBackend(BackendConfig(base_url=server.base_url)) for server in self.servers], **kwargs)
+
+    async def test_calls_go_to_the_least_loaded_node(self):
+        for server in self.servers:
+            server.latency = 0.05
+        pool = self.pool()
+        results = await asyncio.gather(*(pool.agenerate(f"p{i}") for i in range(6)))
+        await pool.aclose()
+        self.assertEqual(results, [f"echo: p{i}" for i in range(6)])
+        self.assertEqual([len(server.requests) for server in self.servers], [2, 2, 2])
+
+    async def test_failed_calls_are_retried_and_the_circuit_opens(self):
+        self.servers[0].status = 500
+        pool = self.pool(failure_threshold=2, circuit_cooldown=60)
+        results = [await pool.agenerate(f"p{i}") for i in range(6)]
+        self.assertEqual(results, [f"echo: p{i}" for i in range(6)])
+        self.assertEqual(len(self.servers[0].requests), 2)
+        self.assertGreater(pool.nodes[0].open_until, 0)
+
+        # Active checks open and close circuits too
+        self.servers[1].status = 500
+        self.assertEqual(await pool.check_health(), [False, False, True])
+        self.servers[0].status = self.servers[1].status = 200
+        await pool.check_health()
+        self.assertTrue(all(node.failures == 0 for node in pool.nodes))
+        await pool.aclose()
+
+    async def test_all_nodes_failing_raises(self):
+        for server in self.servers:
+            server.status = 500
+        pool = self.pool(retries=5)
+        with self.assertRaises(LLMBackendError):
+            await pool.agenerate("hi")
+        self.assertEqual([len(server.requests) for server in self.servers], [1, 1, 1])
+        await pool.aclose()
+
+    async def test_session_affinity(self):
+        pool = self.pool()
+        session = ModelSession()
+        for i in range(4):
+            await pool.agenerate(f"p{i}", session=session)
+        self.assertEqual(sorted(len(server.requests) for server in self.servers), [0, 0, 4])
+
+        # The session moves on when its node fails, carrying its context along
+        pinned = next(server for server in self.servers if server.requests)
+        pinned.status = 500
+        await pool.agenerate("moved", session=session)
+        moved = next(server for server in self.servers if server.requests and server is not pinned)
+        self.assertTrue(moved.requests[-1]["context"])
+        await pool.aclose()
+
+        pool = self.pool(affinity=False)
+        session = ModelSession()
+        for server in self.servers:
+            server.requests.clear()
+            server.status = 200
+        for i in range(3):
+            await pool.agenerate(f"p{i}", session=session)
+        self.assertEqual([len(server.requests) for server in self.servers], [1, 1, 1])
+        await pool.aclose()
+
+    async def test_rejected_context_is_not_a_node_failure(self):
+        for server in self.servers:
+            server.reject_context = True
+        pool = self.pool()
+        session = ModelSession()
+        session.update([1, 2, 3])
+        with self.assertRaises(LLMBackendError):
+            await pool.agenerate("hi", session=session)
+        self.assertEqual(sum(len(server.requests) for server in self.servers), 1)
+        self.assertTrue(all(node.failures == 0 for node in pool.nodes))
+        await pool.aclose()
+
+    async def test_stream_and_agents(self):
+        pool = self.pool()
+        self.assertEqual("".join([delta async for delta in pool.astream("hi")]), "echo: hi")
+        self.assertEqual("".join(pool.stream("hi")), "echo: hi")
+        self.assertTrue(all(node.outstanding == 0 for node in pool.nodes))
+        for server in self.servers:
+            server.responder = default_responder
+        agents = [ProblemSolvingAgent("Solver", pool, cache=False), ProblemSolvingAgent("Reviewer", pool, cache=False)]
+        events = [event async for event in orchestrate_problem_solving(agents, "Write a poem")]
+        self.assertEqual(events[-1], "Solution verified, stopping conversation.")
+        await pool.aclose()
+
+
+@unittest.skipIf(sys.platform == "win32", "needs a POSIX shell")
+class TestSubprocessBackend(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        # A stand-in `ollama` that records its pid and arguments, prints a word and then hangs
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        script = os.path.join(self.tmp.name, "ollama")
+        with open(script, "w") as f:
+            f.write(f'#!/bin/sh\necho $$ > {self.tmp.name}/pid\necho "$@" > {self.tmp.name}/args\n'
+                    "printf 'hello '\nexec sleep 30\n")
+        os.chmod(script, 0o755)
+        patcher = mock.patch.dict(os.environ, {"PATH": f"{self.tmp.name}{os.pathsep}{os.environ['PATH']}"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.backend = SubprocessBackend()
+
+    async def child(self):
+        path = os.path.join(self.tmp.name, "pid")
+        while not os.path.exists(path) or not open(path).read().strip():
+            await asyncio.sleep(0.01)
+        return int(open(path).read())
+
+    def assertGone(self, pid):
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+
+    async def test_cancelled_calls_kill_the_child(self):
+        task = asyncio.create_task(self.backend.agenerate("hi", {"format": "json", "num_predict": 12}))
+        pid = await self.child()
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertGone(pid)
+        with open(os.path.join(self.tmp.name, "args")) as f:
+            self.assertEqual(f.read().split(), ["run", "llama3", "--format", "json"])
+
+    async def test_closed_streams_kill_the_child(self):
+        stream = self.backend.astream("hi")
+        self.assertEqual(await anext(stream), "hello ")
+        pid = await self.child()
+        await stream.aclose()
+        self.assertGone(pid)
+
+
+class TestBackendConfig(unittest.TestCase):
+
+    def test_create_backend_by_kind(self):
+        self.assertIsInstance(create_backend(BackendConfig(kind="http")), OllamaHTTPBackend)
+        self.assertIsInstance(create_backend(BackendConfig(kind="subprocess")), SubprocessBackend)
+        self.assertIsInstance(create_backend(BackendConfig(batch_size=4)), BatchingBackend)
+        pool = create_backend(BackendConfig(base_urls=("http://a:11434", "http://b:11434")))
+        self.assertIsInstance(pool, PooledBackend)
+        self.assertEqual([node.name for node in pool.nodes], ["http://a:11434", "http://b:11434"])
+        with self.assertRaises(ValueError):
+            create_backend(BackendConfig(kind="carrier-pigeon"))
+
+    def test_backends_must_implement_both_entry_points(self):
+        class AsyncOnly(LLMBackend):
+            async def agenerate(self, prompt, options=None, session=None):
+                return prompt
+
+        with self.assertRaises(TypeError):
+            AsyncOnly()
+
+    def test_a_single_base_urls_entry_is_the_base_url(self):
+        with mock.patch.dict(os.environ, {"OLLAMA_BASE_URLS": " http://gpu-1:11434 "}):
+            config = BackendConfig.from_env()
+        self.assertEqual((config.base_url, config.base_urls), ("http://gpu-1:11434", ()))
+        backend = create_backend(config)
+        self.assertIsInstance(backend, OllamaHTTPBackend)
+        self.assertEqual(backend.config.base_url, "http://gpu-1:11434")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from httpx import ASGITransport, AsyncClient
+
+from fake_ollama import FakeOllamaServer
+from fast_solver import solve_prompt
+from loadtest import (
+    DEFAULT_PROMPTS,
+    percentiles,
+    poisson_arrivals,
+    replay_arrivals,
+    run_load,
+    start_local_server,
+    summarize,
+)
+# Keep the session log of the app under test in memory, not in sessions.db
+os.environ.setdefault("SESSION_LOG_DB", ":memory:")
+from main import app
+
+
+class TestLoadTest(unittest.IsolatedAsyncioTestCase):
+
+    def test_percentiles(self):
+        report = percentiles([i / 1000 for i in range(1, 101)])
+        self.assertEqual(report, {"p50": 50.0, "p90": 90.0, "p99": 99.0, "max": 100.0})
+        self.assertIsNone(percentiles([])["p50"])
+
+    def test_replay_scales_recorded_spacing(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as f:
+            for timestamp, prompt in [(100.0, "a"), (102.0, "b"), (110.0, "c")]:
+                f.write(json.dumps({"timestamp": timestamp, "prompt": prompt}) + "\n")
+        self.addCleanup(os.remove, f.name)
+        self.assertEqual(list(replay_arrivals(f.name, speed=2)), [(0.0, "a"), (1.0, "b"), (5.0, "c")])
+
+    def test_default_prompts_reach_the_model(self):
+        for prompt in DEFAULT_PROMPTS:
+            self.assertIsNone(solve_prompt(prompt.format(n=1)), prompt)
+
+    def test_local_server_runs_without_the_response_cache(self):
+        with mock.patch("subprocess.Popen") as popen, \
+                mock.patch.dict(os.environ, {"RESPONSE_CACHE_SIZE": "1024", "RESPONSE_CACHE_DB": "cache.db"}):
+            start_local_server(mock.Mock(base_url="http://fake"), 8123)
+        env = popen.call_args.kwargs["env"]
+        self.assertEqual(env["RESPONSE_CACHE_SIZE"], "0")
+        self.assertNotIn("RESPONSE_CACHE_DB", env)
+
+    def test_unpaced_arrivals_start_together(self):
+        arrivals = list(poisson_arrivals(["prompt {n}"], 3, rate=0))
+        self.assertEqual(arrivals, [(0.0, "prompt 0"), (0.0, "prompt 1"), (0.0, "prompt 2")])
+
+    async def test_run_load_against_app(self):
+        with FakeOllamaServer() as server, mock.patch.dict(os.environ, {"OLLAMA_BASE_URL": server.base_url}):
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+                results, elapsed = await run_load(client, poisson_arrivals(["load {n}"], 3, rate=0), clients=2)
+
+        report = summarize(results, elapsed)
+        self.assertEqual(report["requests"], 3)
+        self.assertEqual(report["statuses"], {"200": 3})
+        self.assertEqual(report["error_rate"], 0.0)
+        self.assertGreater(report["events_per_stream"], 1)
+        self.assertIsNotNone(report["stream_duration_ms"]["p50"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,18 +1,121 @@
+import asyncio
+import os
+
 import pytest
-from fastapi.testclient import TestClient
-from httpx import AsyncClient
-from main import app
+from httpx import ASGITransport, AsyncClient
+
+from fake_ollama import FakeOllamaServer
+# Keep the session log of the app under test in memory, not in sessions.db
+os.environ.setdefault("SESSION_LOG_DB", ":memory:")
+from main import app, logged_events, resumed_stream, runs, session_log
+from session_log import new_session_id
+
+def content_events(response):
+    # Complete messages are unnamed events; token deltas are sent as "event: delta"
+    blocks = [block for block in response.text.split("\n\n") if block]
+    return [block for block in blocks if "\nevent: " not in block and not block.startswith("event: ")]
+
+@pytest.mark.asyncio
+async def test_solve_problem(monkeypatch):
+    with FakeOllamaServer() as server:
+        monkeypatch.setenv("OLLAMA_BASE_URL", server.base_url)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.get("/solve", params={"prompt": "Describe a sunset over the sea"})
+
+    assert response.status_code == 200
+    assert server.requests
+    content = content_events(response)
+    assert "data: Solver:" in content[0]
+    assert "Solution verified, stopping conversation." in content[-1]
+
+@pytest.mark.asyncio
+async def test_arithmetic_takes_the_fast_path(monkeypatch):
+    with FakeOllamaServer() as server:
+        monkeypatch.setenv("OLLAMA_BASE_URL", server.base_url)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.get("/solve", params={"prompt": "how much is 1+1"})
+
+    assert response.status_code == 200
+    assert not server.requests
+    assert "data: FastSolver: 1+1 = 2" in content_events(response)[0]
+
+@pytest.mark.asyncio
+async def test_trace_id_and_metrics(monkeypatch):
+    with FakeOllamaServer() as server:
+        monkeypatch.setenv("OLLAMA_BASE_URL", server.base_url)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.get("/solve", params={"prompt": "trace 1+1", "trace": "true"}, headers={"X-Trace-Id": "abc123"})
+            metrics = await ac.get("/metrics")
+
+    assert response.headers["X-Trace-Id"] == "abc123"
+    assert response.text.startswith('event: trace\ndata: {"type": "trace", "trace_id": "abc123"}')
+    assert metrics.status_code == 200
+    assert 'solve_requests_total{outcome="started"}' in metrics.text
+    assert "solve_queue_wait_seconds_count" in metrics.text
+    assert 'agent_phase_seconds_bucket{phase="generation",role="Solver",iteration="1",le="+Inf"}' in metrics.text
+
+@pytest.mark.asyncio
+async def test_finished_session_is_replayed_from_the_log(monkeypatch):
+    with FakeOllamaServer() as server:
+        monkeypatch.setenv("OLLAMA_BASE_URL", server.base_url)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.get("/solve", params={"prompt": "replay 1+1"})
+            session_id = response.headers["X-Session-Id"]
+            calls = len(server.requests)
+
+            resumed = await ac.get("/solve", headers={"Last-Event-ID": f"{session_id}:1"})
+            session = await ac.get(f"/sessions/{session_id}")
+            missing = await ac.get("/solve", headers={"Last-Event-ID": "unknown:3"})
+        assert len(server.requests) == calls  # Nothing was generated again
+
+    original = response.text.split("\n\n")
+    replayed = resumed.text.split("\n\n")
+    assert replayed[0].startswith(f"id: {session_id}:2\n")
+    assert replayed[:-2] == original[2:-2]
+    assert replayed[-2].startswith("event: end")
+    assert session.json()["status"] == "finished"
+    assert len(session.json()["events"]) == len(original) - 2
+    assert missing.status_code == 404
 
 @pytest.mark.asyncio
-async def test_solve_problem():
-    async with AsyncClient(app=app, base_url="http://test") as ac:
-        response = await ac.post("/solve", json={"prompt": "how much is 1+1"})
+async def test_resume_attaches_to_the_live_run():
+    release = asyncio.Event()
+
+    async def source():
+        yield "Solver: first"
+        await release.wait()
+        yield "Reviewer: second"
+
+    session_id = new_session_id()
+    session_log.create(session_id, "live resume")
+    runs.start("live resume", logged_events(session_id, source()), session_id=session_id)
+    while not session_log.events(session_id):
+        await asyncio.sleep(0)
 
-        assert response.status_code == 200
-        content = response.text.splitlines()
+    stream = resumed_stream(session_id, -1)
+    assert await anext(stream) == f"id: {session_id}:0\ndata: Solver: first\n\n"
+    release.set()
+    rest = [chunk async for chunk in stream]
+    assert rest[0] == f"id: {session_id}:1\ndata: Reviewer: second\n\n"
+    assert rest[-1].startswith("event: end")
+    assert session_log.session(session_id)["status"] == "finished"
+
+@pytest.mark.asyncio
+async def test_readiness_follows_the_warm_up(monkeypatch):
+    with FakeOllamaServer(latency=0.1) as server:
+        monkeypatch.setenv("OLLAMA_BASE_URL", server.base_url)
+        monkeypatch.setenv("OLLAMA_PING_INTERVAL", "60")
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            async with app.router.lifespan_context(app):
+                health = await ac.get("/healthz")
+                starting = await ac.get("/readyz")
+                while (ready := await ac.get("/readyz")).status_code != 200:
+                    await asyncio.sleep(0.02)
 
-        assert "Agent1:" in content[0]
-        assert "Solution verified, stopping conversation." in content[-1]
+    assert health.json() == {"status": "ok"}
+    assert starting.status_code == 503
+    assert ready.json() == {"ready": True, "models": {"llama3": "ready"}}
+    assert server.requests[0] == {"model": "llama3", "keep_alive": "5m"}
 
 if __name__ == '__main__':
     pytest.main()
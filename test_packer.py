@@ -0,0 +1,256 @@
+import os
+import random
+import re
+import tempfile
+import unittest
+
+from folder_to_text_file import files_to_text_file, folder_to_text_file, folder_to_text_file_big_exclude
+from packer import MANIFEST_NAME, SEPARATOR, PackReader, Packer, split_points, walk_sources
+from tokens import TokenCounter, estimate_tokens
+
+
+def reference_pack(folder_path, exclude_dirs=()):
+    """The original single-threaded packing, for comparison."""
+    parts = []
+    for root, dirs, files in os.walk(folder_path):
+        dirs[:] = [d for d in dirs if d not in exclude_dirs]
+        for file in files:
+            file_path = os.path.join(root, file)
+            with open(file_path, "r", encoding="utf-8", errors="ignore") as f_in:
+                parts.append(f"File: {file}\nPath: {file_path}\n\n{f_in.read()}{SEPARATOR}")
+    return "".join(parts)
+
+
+class PackTreeTestCase(unittest.TestCase):
+    """Builds a small source tree to pack."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.src = os.path.join(self.tmp.name, "src")
+        self.out = os.path.join(self.tmp.name, "out")
+        for directory in ("a/b", "node_modules", "c"):
+            os.makedirs(os.path.join(self.src, directory))
+        for i in range(20):
+            self.write(f"a/file{i}.py", f"print({i})\r\n" * (i * 15))
+        self.write("a/b/deep.txt", "deep")
+        self.write("node_modules/dep.js", "module.exports = 1")
+        with open(os.path.join(self.src, "c", "bad.bin"), "wb") as f:
+            f.write(b"\xff\xfeok")
+
+    def write(self, relative, content):
+        with open(os.path.join(self.src, relative), "w", newline="") as f:
+            f.write(content)
+
+    def read_shards(self):
+        shards = []
+        index = 1
+        while os.path.exists(os.path.join(self.out, f"output_{index}.txt")):
+            with open(os.path.join(self.out, f"output_{index}.txt"), encoding="utf-8") as f:
+                shards.append(f.read())
+            index += 1
+        return shards
+
+    def packer(self, **kwargs):
+        os.makedirs(self.out, exist_ok=True)
+        return Packer(
+            lambda index: os.path.join(self.out, f"output_{index}.txt"),
+            max_shard_bytes=4096,
+            manifest_path=os.path.join(self.out, MANIFEST_NAME),
+            **kwargs,
+        )
+
+
+class TestPacker(PackTreeTestCase):
+
+    def test_single_file_matches_original_format(self):
+        output_file = os.path.join(self.tmp.name, "output.txt")
+        folder_to_text_file(self.src, output_file, workers=4)
+        with open(output_file, encoding="utf-8") as f:
+            self.assertEqual(f.read(), reference_pack(self.src))
+
+    def test_large_files_are_streamed_in_chunks(self):
+        output_file = os.path.join(self.tmp.name, "output.txt")
+        Packer(lambda index: output_file, chunk_size=64, inline_limit=100).pack(lambda pool: walk_sources(self.src, pool))
+        with open(output_file, encoding="utf-8") as f:
+            self.assertEqual(f.read(), reference_pack(self.src))
+
+    def test_shards_respect_size_and_exclusions(self):
+        folder_to_text_file_big_exclude(self.src, self.out, max_file_size_mb=4096 / (1024 * 1024))
+        shards = self.read_shards()
+        self.assertGreater(len(shards), 1)
+        for shard in shards:
+            # Only a file that is larger than the limit on its own gets an oversized shard
+            self.assertTrue(len(shard.encode("utf-8")) <= 4096 or shard.count(SEPARATOR) == 1)
+        self.assertEqual("".join(shards), reference_pack(self.src, {"node_modules"}))
+
+    def test_missing_files_are_reported(self):
+        files_to_text_file([os.path.join(self.src, "a", "b", "deep.txt"), "nowhere.py"], self.out)
+        self.assertTrue(self.read_shards()[0].endswith(f"File nowhere.py does not exist.{SEPARATOR}"))
+
+    def test_incremental_repack_reads_only_changed_files(self):
+        self.packer().pack(lambda pool: walk_sources(self.src, pool))
+        first = self.read_shards()
+        mtimes = [os.path.getmtime(os.path.join(self.out, f"output_{i + 1}.txt")) for i in range(len(first))]
+
+        stats = self.packer().pack(lambda pool: walk_sources(self.src, pool))
+        self.assertEqual((stats["read"], stats["shards_written"]), (0, 0))
+        self.assertEqual(self.read_shards(), first)
+
+        self.write("a/file3.py", "print('changed')\n")
+        os.remove(os.path.join(self.src, "a", "file5.py"))
+        stats = self.packer().pack(lambda pool: walk_sources(self.src, pool))
+        self.assertEqual(stats["read"], 1)
+        shards = self.read_shards()
+        packed = "".join(shards)
+        self.assertIn("print('changed')\n", packed)
+        self.assertNotIn("file5.py", packed)
+        self.assertEqual(sorted(packed.split(SEPARATOR)), sorted(reference_pack(self.src).split(SEPARATOR)))
+        untouched = [i for i in range(len(shards)) if os.path.getmtime(os.path.join(self.out, f"output_{i + 1}.txt")) == mtimes[i]]
+        self.assertGreater(len(untouched), 0)
+
+
+class TestPackReader(PackTreeTestCase):
+
+    def expected(self, relative):
+        with open(os.path.join(self.src, relative), "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+
+    def check_random_access(self, reader, excluded=True):
+        for relative in ("a/file7.py", "a/b/deep.txt", "c/bad.bin", "a/file0.py"):
+            path = os.path.join(self.src, relative)
+            self.assertEqual(reader.read_text(path), self.expected(relative))
+            self.assertTrue(reader.verify(path))
+        self.assertEqual(os.path.join(self.src, "node_modules", "dep.js") in reader, not excluded)
+
+    def test_reads_text_shards_through_the_manifest(self):
+        folder_to_text_file_big_exclude(self.src, self.out, max_file_size_mb=4096 / (1024 * 1024))
+        with PackReader(self.out) as reader:
+            self.check_random_access(reader)
+            self.assertIsInstance(reader.view(os.path.join(self.src, "a", "b", "deep.txt")), memoryview)
+
+    def test_indexed_format_with_compression(self):
+        folder_to_text_file_big_exclude(self.src, self.out, max_file_size_mb=4096 / (1024 * 1024),
+                                        output_format="indexed", compression="zlib")
+        self.assertFalse(os.path.exists(os.path.join(self.out, "output_1.txt")))
+        with PackReader(self.out) as reader:
+            self.check_random_access(reader)
+            entry = reader.entries[os.path.join(self.src, "a", "file19.py")]
+            self.assertEqual(entry["compression"], "zlib")
+            self.assertLess(entry["length"], entry["raw_length"])
+
+        # Streamed (large) files are compressed in chunks and read back the same way
+        self.packer(output_format="indexed", compression="zlib", incremental=False, inline_limit=100,
+                    chunk_size=64).pack(lambda pool: walk_sources(self.src, pool))
+        with PackReader(self.out) as reader:
+            self.check_random_access(reader, excluded=False)
+
+    def test_single_file_indexed(self):
+        output_file = os.path.join(self.tmp.name, "output.pack")
+        folder_to_text_file(self.src, output_file, output_format="indexed")
+        with PackReader(f"{output_file}.index.json") as reader:
+            self.check_random_access(reader, excluded=False)
+
+    def test_missing_files_are_errors(self):
+        files_to_text_file([os.path.join(self.src, "a", "b", "deep.txt"), "nowhere.py"], self.out, output_format="indexed")
+        with PackReader(self.out) as reader:
+            self.assertEqual(reader.read_text(os.path.join(self.src, "a", "b", "deep.txt")), "deep")
+            with self.assertRaises(OSError):
+                reader.read_bytes("nowhere.py")
+
+
+class CountingTokenCounter(TokenCounter):
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def count(self, text):
+        self.calls += 1
+        return super().count(text)
+
+
+class TestTokenBudget(PackTreeTestCase):
+
+    def setUp(self):
+        super().setUp()
+        functions = "".join(
+            f"def handler_{i}(request):\n    value = request.get('key_{i}')\n    return value * {i}\n\n" for i in range(40)
+        )
+        self.write("c/handlers.py", functions)
+
+    def test_shards_fit_the_token_budget(self):
+        folder_to_text_file_big_exclude(self.src, self.out, max_file_size_mb=1, max_shard_tokens=300)
+        shards = self.read_shards()
+        self.assertGreater(len(shards), 3)
+        for shard in shards:
+            self.assertLessEqual(estimate_tokens(shard), 300)
+        handlers = os.path.join(self.src, "c", "handlers.py")
+        with PackReader(self.out) as reader:
+            parts = reader.parts(handlers)
+            self.assertGreater(len(parts), 1)
+            self.assertTrue(reader.verify(handlers))
+            with open(handlers) as f:
+                self.assertEqual(reader.read_text(handlers), f.read())
+            for entry in parts[1:]:
+                # Parts start at a function definition
+                self.assertTrue(reader._segment(entry).tobytes().startswith(b"def handler_"))
+        self.assertIn("File: handlers.py (part 2/", "".join(shards))
+
+    def test_token_counts_are_reused(self):
+        counter = CountingTokenCounter()
+        self.packer(max_shard_tokens=300, token_counter=counter).pack(lambda pool: walk_sources(self.src, pool))
+        first = self.read_shards()
+        counter.calls = 0
+        stats = self.packer(max_shard_tokens=300, token_counter=counter).pack(lambda pool: walk_sources(self.src, pool))
+        self.assertEqual((stats["read"], stats["shards_written"]), (0, 0))
+        self.assertEqual(self.read_shards(), first)
+        self.assertEqual(counter.calls, 0)
+
+        # A copy of a file has the same hash, so its count comes from the cache
+        with open(os.path.join(self.src, "a", "file7.py"), newline="") as f:
+            self.write("a/copy.py", f.read())
+        stats = self.packer(max_shard_tokens=300, token_counter=counter).pack(lambda pool: walk_sources(self.src, pool))
+        self.assertEqual(stats["read"], 1)
+        self.assertEqual(counter.calls, 0)
+
+    def test_split_files_stay_whole_and_in_order_across_edits(self):
+        def functions(prefix, count):
+            return "".join(f"def {prefix}_{i}(request):\n    return request * {i}\n\n" for i in range(count))
+
+        for seed in range(6):
+            rng = random.Random(seed)
+            src = os.path.join(self.tmp.name, f"split{seed}")
+            os.makedirs(src)
+            files = {}
+            for round_ in range(8):
+                for i in rng.sample(range(8), 8 if round_ == 0 else rng.randint(1, 3)):
+                    path = os.path.join(src, f"f{i}.py")
+                    files[path] = functions(f"h{round_}", rng.randint(1, 80))
+                    with open(path, "w", newline="") as f:
+                        f.write(files[path])
+                    os.utime(path, ns=(round_, round_))
+                self.packer(max_shard_tokens=500).pack(lambda pool: walk_sources(src, pool))
+                text = "".join(self.read_shards())
+                with PackReader(self.out) as reader:
+                    for path, content in files.items():
+                        self.assertEqual(reader.read_text(path), content)
+                        # Parts are numbered 1..n and sit one after the other in the pack
+                        parts = reader.parts(path)
+                        self.assertEqual([entry.get("part", 1) for entry in parts], list(range(1, len(parts) + 1)))
+                        positions = [(entry["shard"], entry["offset"]) for entry in parts]
+                        self.assertEqual(positions, sorted(positions))
+                        headers = re.findall(rf"File: {os.path.basename(path)} \(part (\d+)/", text)
+                        self.assertEqual(headers, [str(i) for i in range(1, len(headers) + 1)])
+
+    def test_long_lines_are_split_between_words(self):
+        raw = b"short line\n" + b" ".join(b"word%d" % i for i in range(200)) + b"\nend\n"
+        parts = split_points(raw, 50, TokenCounter())
+        self.assertEqual(b"".join(raw[start:end] for start, end, _ in parts), raw)
+        for start, end, tokens in parts:
+            self.assertLessEqual(tokens, 50)
+            self.assertTrue(end == len(raw) or raw[end - 1:end] in (b" ", b"\n"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from agents import ProblemSolvingAgent
+from fake_ollama import FakeOllamaServer
+from llm_backend import BackendConfig, OllamaHTTPBackend
+from response_cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_key_normalizes_prompt_and_includes_options(self):
+        key = ResponseCache.make_key("llama3", "Solve 1+1  \r\n")
+        self.assertEqual(key, ResponseCache.make_key("llama3", "  Solve 1+1"))
+        self.assertNotEqual(key, ResponseCache.make_key("mistral", "Solve 1+1"))
+        self.assertNotEqual(key, ResponseCache.make_key("llama3", "Solve 1+1", {"temperature": 0}))
+
+    def test_lru_eviction_and_counters(self):
+        cache = ResponseCache(max_entries=2)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")
+        cache.put("c", "3")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "1")
+        self.assertEqual(cache.stats(), {"hits": 2, "misses": 1, "entries": 2})
+
+    def test_ttl(self):
+        cache = ResponseCache(ttl=0.01)
+        cache.put("a", "1")
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+
+    def test_sqlite_tier_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.db")
+            cache = ResponseCache(sqlite_path=path)
+            cache.put("a", "1")
+            cache.close()
+            cache = ResponseCache(sqlite_path=path)
+            self.assertEqual(cache.get("a"), "1")
+            cache.close()
+
+
+class TestAsyncDiskTier(unittest.IsolatedAsyncioTestCase):
+
+    async def test_disk_reads_and_writes_stay_off_the_event_loop(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResponseCache(max_entries=0, sqlite_path=os.path.join(tmp, "cache.db"))
+            main_thread = threading.get_ident()
+            threads = []
+            execute = cache._db.execute
+            cache._db = mock.Mock(wraps=cache._db)
+            cache._db.execute.side_effect = lambda *args: threads.append(threading.get_ident()) or execute(*args)
+            cache.put("a", "1")
+            cache.flush()
+            self.assertEqual(await cache.aget("a"), "1")
+            self.assertIsNone(await cache.aget("b"))
+            cache.close()
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(main_thread, threads)
+
+
+class TestAgentCaching(unittest.IsolatedAsyncioTestCase):
+
+    async def test_identical_prompts_hit_cache_unless_bypassed(self):
+        with FakeOllamaServer() as server:
+            backend = OllamaHTTPBackend(BackendConfig(base_url=server.base_url))
+            agent = ProblemSolvingAgent("Solver", backend, cache=ResponseCache())
+            first = await agent.process_message("Solve 1+1")
+            self.assertEqual(await agent.process_message("Solve 1+1 "), first)
+            self.assertEqual(len(server.requests), 1)
+            await agent.process_message("Solve 1+1", use_cache=False)
+            self.assertEqual(len(server.requests), 2)
+            await backend.aclose()
+
+
+if __name__ == '__main__':
+    unittest.main()
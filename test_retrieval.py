@@ -0,0 +1,114 @@
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from agents import Environment
+from folder_to_text_file import folder_to_text_file_big_exclude
+from retrieval import ChunkIndex, build_index, default_index_path, split_chunks, tokenize
+
+
+class TestTokenize(unittest.TestCase):
+
+    def test_splits_identifiers(self):
+        terms = tokenize("def parseHTTPResponse(max_retries=3):")
+        for term in ("def", "parsehttpresponse", "parse", "http", "response", "max_retries", "max", "retries", "3"):
+            self.assertIn(term, terms)
+
+    def test_split_chunks_covers_content(self):
+        content = b"".join(b"line %d\n" % i for i in range(95)) + b"tail"
+        chunks = list(split_chunks(content, chunk_lines=40))
+        self.assertEqual([(a, b) for a, b, _, _ in chunks], [(0, 40), (40, 80), (80, 95)])
+        self.assertEqual(b"".join(content[start:end] for _, _, start, end in chunks), content)
+
+
+class TestChunkIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.src = os.path.join(self.tmp.name, "src")
+        self.out = os.path.join(self.tmp.name, "out")
+        os.makedirs(self.src)
+        self.write("billing.py", "def compute_invoice_total(items):\n    return sum(item.price for item in items)\n")
+        self.write("auth.py", "class TokenValidator:\n    def validate(self, token):\n        return token.is_valid()\n")
+        filler = "".join(f"def helper_{i}(value):\n    return value + {i}\n" for i in range(60))
+        self.write("helpers.py", filler)
+
+    def write(self, name, content):
+        with open(os.path.join(self.src, name), "w") as f:
+            f.write(content)
+
+    def pack(self):
+        folder_to_text_file_big_exclude(self.src, self.out, max_file_size_mb=1)
+
+    def test_search_ranks_matching_chunk_first(self):
+        self.pack()
+        index = build_index(self.out)
+        self.addCleanup(index.close)
+        results = index.search("How is the invoice total computed?", k=3)
+        self.assertEqual(os.path.basename(results[0].path), "billing.py")
+        self.assertIn("compute_invoice_total", index.text(results[0]))
+        self.assertEqual(index.search("validate token")[0].path, os.path.join(self.src, "auth.py"))
+        self.assertEqual(index.search("nothing matches xyzzy"), [])
+        # 120 lines of helpers are split into several chunks
+        self.assertEqual(index.files[os.path.join(self.src, "helpers.py")]["chunks"], 3)
+
+    def test_index_is_saved_and_rebuilt_incrementally(self):
+        self.pack()
+        first = build_index(self.out)
+        loaded = ChunkIndex.load(default_index_path(self.out))
+        self.assertEqual(loaded.chunks, first.chunks)
+        np.testing.assert_array_equal(loaded.chunk_ids, first.chunk_ids)
+
+        self.write("auth.py", "def rotate_signing_keys():\n    pass\n")
+        self.pack()
+        second = build_index(self.out)
+        self.assertEqual(second.search("signing keys")[0].path, os.path.join(self.src, "auth.py"))
+        self.assertEqual(second.search("validator"), [])
+        # Unchanged files keep their term counts, so scores match a build from scratch
+        os.remove(default_index_path(self.out) + ".json")
+        fresh = build_index(self.out)
+        query = "compute invoice helper value"
+        self.assertEqual(
+            [(c.path, c.start_line, round(c.score, 4)) for c in second.search(query, k=10)],
+            [(c.path, c.start_line, round(c.score, 4)) for c in fresh.search(query, k=10)],
+        )
+
+    def test_environment_pins_relevant_chunks(self):
+        self.pack()
+        index = build_index(self.out)
+        self.addCleanup(index.close)
+        env = Environment(retriever=index, retrieval_k=1)
+        env.initiate_conversation("Fix compute_invoice_total")
+        window = env.conversation.window()
+        self.assertIn("Relevant code:", window)
+        self.assertIn("return sum(item.price", window)
+        self.assertNotIn("TokenValidator", window)
+
+    def test_search_is_fast_on_large_indexes(self):
+        rng = np.random.default_rng(0)
+        chunks, vocabulary = 100_000, 20_000
+        lengths = rng.integers(20, 60, size=chunks)
+        offsets = np.zeros(chunks + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        terms = rng.zipf(1.3, size=offsets[-1]).astype(np.int64) % vocabulary
+        index = ChunkIndex(
+            "unused",
+            {f"t{i}": i for i in range(vocabulary)},
+            {},
+            [("f", i, i + 1, 0, 0) for i in range(chunks)],
+            offsets,
+            terms.astype(np.int32),
+            np.ones(offsets[-1], dtype=np.int32),
+        )
+        start = time.perf_counter()
+        for query in ("t1 t50 t999", "t3 t7", "t12345 t2"):
+            self.assertEqual(len(index.search(query, k=10)), 10)
+        self.assertLess((time.perf_counter() - start) / 3, 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
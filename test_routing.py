@@ -0,0 +1,119 @@
+import asyncio
+import time
+import unittest
+
+from hierarchical_agent_teams import Environment
+from routing import AgentRegistry, Router, Strategy, StrategyClassifier, parse_strategy
+from usinglangchianflowsExample import LogicAgent, MathAgent, OrchestratorAgent
+
+
+class TestRouting(unittest.IsolatedAsyncioTestCase):
+
+    def test_classifier(self):
+        classifier = StrategyClassifier(strategies=[Strategy.SEQUENTIAL, Strategy.PARALLEL, Strategy.COLLABORATIVE])
+        strategy, confidence = classifier.predict("create a phone calculator app")
+        self.assertEqual(strategy, Strategy.COLLABORATIVE)
+        self.assertGreater(confidence, 0.9)
+        self.assertEqual(classifier.predict("compare the pros and cons of three databases")[0], Strategy.PARALLEL)
+        self.assertEqual(classifier.predict("solve it step by step")[0], Strategy.SEQUENTIAL)
+        # Nothing in common with any example: every strategy is equally likely
+        self.assertAlmostEqual(classifier.predict("xyzzy")[1], 1 / 3, places=5)
+
+    def test_parse_strategy(self):
+        strategies = [Strategy.SEQUENTIAL, Strategy.PARALLEL, Strategy.COLLABORATIVE]
+        answer = "I would pick 3. Collaborative Multi-Agent rather than a sequential chain."
+        self.assertEqual(parse_strategy(answer, strategies), Strategy.COLLABORATIVE)
+        self.assertEqual(parse_strategy("Run them in parallel.", strategies), Strategy.PARALLEL)
+        self.assertIsNone(parse_strategy("No idea.", strategies))
+
+    async def test_fallback_only_when_unsure_and_decisions_are_cached(self):
+        asked = []
+
+        async def fallback(prompt):
+            asked.append(prompt)
+            return "Parallel Chain, because the parts are independent."
+
+        router = Router([Strategy.SEQUENTIAL, Strategy.PARALLEL, Strategy.COLLABORATIVE], fallback=fallback)
+        decision = await router.aroute("create a phone calculator app")
+        self.assertEqual((decision.strategy, decision.source), (Strategy.COLLABORATIVE, "classifier"))
+        decision = await router.aroute("xyzzy plugh")
+        self.assertEqual((decision.strategy, decision.source), (Strategy.PARALLEL, "model"))
+        decision = await router.aroute("  XYZZY   plugh ")
+        self.assertEqual((decision.strategy, decision.source), (Strategy.PARALLEL, "cache"))
+        self.assertEqual(asked, ["xyzzy plugh"])
+
+    async def test_registry_and_flows(self):
+        registry = AgentRegistry()
+        math_agent = registry.register(MathAgent(), MathAgent.capabilities)
+        self.assertIs(registry.first("math"), math_agent)
+        self.assertIs(registry.get("MathAgent"), math_agent)
+        self.assertEqual(registry.with_capability("logic"), [])
+        with self.assertRaises(KeyError):
+            registry.first("logic")
+
+        orchestrator = OrchestratorAgent([MathAgent(), LogicAgent()])
+        self.assertEqual(await orchestrator.collaborative_flow("2 * 21"),
+                         "Collaborative Result: Math says: Math solution for 2 * 21 is 2 * 21 = 42. | "
+                         "Logic says: Logic solution: 2 * 21")
+
+
+class SlowAgent:
+
+    def __init__(self, name, delay, response=None):
+        self.name = name
+        self.delay = delay
+        self.response = response or f"{name} has an idea."
+        self.histories = []
+
+    async def process_message(self, message, use_cache=True):
+        self.histories.append(message)
+        await asyncio.sleep(self.delay)
+        return self.response
+
+    async def verdict(self, prompt):
+        return '{"verdict": "yes"}'
+
+
+class TestParallelChain(unittest.IsolatedAsyncioTestCase):
+
+    async def run_env(self, agents, **kwargs):
+        env = Environment(**kwargs)
+        for agent in agents:
+            env.add_agent(agent)
+        env.initiate_conversation("Compare some options")
+        start = time.perf_counter()
+        messages = []
+        async for message in env.workflow(Strategy.PARALLEL, max_iterations=1).run():
+            messages.append(message)
+        return env, messages, time.perf_counter() - start
+
+    async def test_agents_answer_concurrently_and_merge_in_order(self):
+        agents = [SlowAgent("Agent1", 0.2), SlowAgent("Agent2", 0.05), SlowAgent("Agent3", 0.1)]
+        env, messages, elapsed = await self.run_env(agents)
+        self.assertLess(elapsed, 0.3)
+        # Streamed as they finish, merged in agent order
+        self.assertEqual(messages, ["Agent2: Agent2 has an idea.", "Agent3: Agent3 has an idea.", "Agent1: Agent1 has an idea."])
+        self.assertEqual([entry.text for entry in env.conversation.entries],
+                         ["Agent1: Agent1 has an idea.", "Agent2: Agent2 has an idea.", "Agent3: Agent3 has an idea."])
+        # Every agent saw the same history
+        self.assertEqual(len({agent.histories[0] for agent in agents}), 1)
+
+    async def test_concurrency_limit(self):
+        agents = [SlowAgent(f"Agent{i}", 0.1) for i in range(4)]
+        _, messages, elapsed = await self.run_env(agents, concurrency_limits={Strategy.PARALLEL: 2})
+        self.assertEqual(len(messages), 4)
+        self.assertGreater(elapsed, 0.19)
+
+    async def test_solution_is_verified(self):
+        agents = [SlowAgent("Agent1", 0.01, 'Done.\n{"solved": true}'), SlowAgent("Agent2", 0.02, 'Agreed.\n{"solved": true}')]
+        _, messages, _ = await self.run_env(agents)
+        self.assertEqual(messages[-1], "Solution verified, stopping conversation.")
+
+    async def test_prose_claims_are_not_verified(self):
+        agents = [SlowAgent("Agent1", 0.01, "Yes problem is solved, I think."), SlowAgent("Agent2", 0.02, '{"solved": false}')]
+        _, messages, _ = await self.run_env(agents)
+        self.assertNotIn("Solution verified, stopping conversation.", messages)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import asyncio
+import unittest
+
+from scheduler import AdmissionScheduler, QueueFullError
+
+
+class TestAdmissionScheduler(unittest.IsolatedAsyncioTestCase):
+
+    async def test_global_cap_and_fifo_positions(self):
+        scheduler = AdmissionScheduler(max_active=1, max_per_client=5)
+        first = scheduler.enqueue("a")
+        second = scheduler.enqueue("b")
+        third = scheduler.enqueue("c")
+        self.assertTrue(first.admitted)
+        self.assertEqual((second.position, third.position), (1, 2))
+
+        positions = []
+
+        async def wait(ticket):
+            async for position in ticket.wait():
+                positions.append(position)
+
+        waiter = asyncio.create_task(wait(third))
+        await asyncio.sleep(0)
+        first.release()
+        await asyncio.sleep(0)
+        self.assertTrue(second.admitted)
+        second.release()
+        await asyncio.wait_for(waiter, 1)
+        self.assertEqual(positions, [2, 1, 0])
+
+    async def test_priority_and_per_client_cap(self):
+        scheduler = AdmissionScheduler(max_active=2, max_per_client=1, min_priority=-1)
+        busy = scheduler.enqueue("a")
+        blocked = scheduler.enqueue("a")
+        low = scheduler.enqueue("b", priority=5)
+        self.assertTrue(busy.admitted)
+        self.assertFalse(blocked.admitted)
+        # Client a is at its cap, so b is admitted past it
+        self.assertTrue(low.admitted)
+        urgent = scheduler.enqueue("c", priority=-1)
+        self.assertEqual(urgent.position, 1)
+        self.assertEqual(blocked.position, 2)
+
+    async def test_priorities_are_clamped(self):
+        scheduler = AdmissionScheduler(max_active=1)
+        scheduler.enqueue("a")
+        normal = scheduler.enqueue("b")
+        jumper = scheduler.enqueue("c", priority=-1000)
+        lowest = scheduler.enqueue("d", priority=1000)
+        # A negative priority is raised to the minimum, so it waits its turn
+        self.assertEqual((normal.priority, jumper.priority, lowest.priority), (0, 0, 9))
+        self.assertEqual((normal.position, jumper.position, lowest.position), (1, 2, 3))
+
+    async def test_queue_full(self):
+        scheduler = AdmissionScheduler(max_active=1, max_queue=1, max_queued_per_client=1)
+        scheduler.enqueue("a")
+        waiting = scheduler.enqueue("a")
+        with self.assertRaises(QueueFullError) as error:
+            scheduler.enqueue("b")
+        self.assertEqual(error.exception.status_code, 503)
+        self.assertGreaterEqual(error.exception.retry_after, 1)
+        waiting.release()
+        scheduler.max_queue = 10
+        scheduler.enqueue("a")
+        with self.assertRaises(QueueFullError) as error:
+            scheduler.enqueue("a")
+        self.assertEqual(error.exception.status_code, 429)
+
+
+if __name__ == '__main__':
+    unittest.main()
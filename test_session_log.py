@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+from session_log import SessionLog, format_event_id, parse_event_id
+
+
+class TestSessionLog(unittest.TestCase):
+
+    def setUp(self):
+        self.log = SessionLog()
+        self.addCleanup(self.log.close)
+
+    def test_events_are_replayed_in_order_after_an_id(self):
+        self.log.create("s1", "Solve 1+1")
+        self.log.append("s1", 0, {"type": "delta", "delta": "The"})
+        self.log.append("s1", 1, "Solver: The answer is 2.")
+        self.log.append("s1", 2, "Solution verified, stopping conversation.")
+        self.log.finish("s1")
+
+        self.assertEqual([index for index, _ in self.log.events("s1")], [0, 1, 2])
+        self.assertEqual(self.log.events("s1", after=0), [
+            (1, "Solver: The answer is 2."),
+            (2, "Solution verified, stopping conversation."),
+        ])
+        self.assertEqual(self.log.events("s1", after=0)[0][1], "Solver: The answer is 2.")
+        self.assertEqual(self.log.events("s1")[0][1], {"type": "delta", "delta": "The"})
+        self.assertEqual(self.log.session("s1")["status"], "finished")
+
+    def test_unknown_session(self):
+        self.assertIsNone(self.log.session("missing"))
+        self.assertEqual(self.log.events("missing"), [])
+
+    def test_only_the_newest_sessions_are_kept(self):
+        log = SessionLog(max_sessions=2)
+        self.addCleanup(log.close)
+        for i in range(4):
+            log.create(f"s{i}", "prompt")
+            log.append(f"s{i}", 0, "message")
+            if i != 0:
+                log.finish(f"s{i}")
+        log.create("s4", "prompt")
+        # s0 is still running, so it is kept with the two newest sessions
+        self.assertEqual([session_id for session_id in ("s0", "s1", "s2", "s3", "s4") if log.session(session_id)],
+                         ["s0", "s3", "s4"])
+        self.assertEqual(log.events("s1"), [])
+        self.assertEqual(log.events("s0"), [(0, "message")])
+
+    def test_writes_survive_close(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "sessions.db")
+            log = SessionLog(path)
+            log.create("s1", "prompt")
+            log.append("s1", 0, "message")
+            log.close()
+            log = SessionLog(path)
+            self.assertEqual(log.events("s1"), [(0, "message")])
+            log.close()
+
+    def test_event_ids(self):
+        self.assertEqual(parse_event_id(format_event_id("abc", 7)), ("abc", 7))
+        self.assertEqual(parse_event_id("abc:-1"), ("abc", -1))
+        self.assertEqual(parse_event_id("garbage"), (None, None))
+        self.assertEqual(parse_event_id(None), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+import telemetry
+from agents import Environment, ProblemSolvingAgent
+from fake_ollama import FakeBackend
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_render_prometheus_text(self):
+        registry = telemetry.MetricsRegistry()
+        requests = registry.counter("requests_total", "Requests.", ["outcome"])
+        latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+        requests.inc(outcome="ok")
+        requests.inc(2, outcome="ok")
+        latency.observe(0.05)
+        latency.observe(0.5)
+
+        text = registry.render()
+        self.assertIn("# TYPE requests_total counter", text)
+        self.assertIn('requests_total{outcome="ok"} 3', text)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{le="1"} 2', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn("latency_seconds_count 2", text)
+
+    def test_span_uses_current_labels(self):
+        histogram = telemetry.PHASE_SECONDS
+        before = histogram.count(phase="test_phase", role="Tester", iteration="7")
+        with telemetry.labels(role="Tester", iteration=7):
+            with telemetry.span("test_phase"):
+                pass
+        self.assertEqual(telemetry.current_labels(), {})
+        self.assertEqual(histogram.count(phase="test_phase", role="Tester", iteration="7"), before + 1)
+
+
+class TestConversationSpans(unittest.IsolatedAsyncioTestCase):
+
+    async def test_turn_phases_are_tagged_by_role_and_iteration(self):
+        histogram = telemetry.PHASE_SECONDS
+        phases = ("prompt_build", "time_to_first_token", "generation")
+        before = {phase: histogram.count(phase=phase, role="Solver", iteration="1") for phase in phases}
+        verification_before = histogram.count(phase="verification", role="verifiers", iteration="1")
+
+        backend = FakeBackend()
+        env = Environment(stream=True)
+        env.add_agent(ProblemSolvingAgent("Solver", backend, cache=False))
+        env.add_agent(ProblemSolvingAgent("Reviewer", backend, cache=False))
+        env.initiate_conversation("Solve 1+1")
+        async for _ in env.run_conversation():
+            pass
+
+        for phase in phases:
+            self.assertGreater(histogram.count(phase=phase, role="Solver", iteration="1"), before[phase], phase)
+        self.assertEqual(histogram.count(phase="verification", role="verifiers", iteration="1"), verification_before + 1)
+        self.assertGreater(telemetry.GENERATED_TOKENS.value(role="Solver"), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
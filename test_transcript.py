@@ -0,0 +1,42 @@
+import unittest
+
+from tokens import estimate_tokens
+from transcript import Transcript
+
+
+class TestTranscript(unittest.TestCase):
+
+    def test_short_conversation_is_verbatim(self):
+        transcript = Transcript()
+        transcript.append("Initial Prompt: Solve 1+1", pinned=True)
+        transcript.append("Solver: 2")
+        self.assertEqual(transcript.window(), "Initial Prompt: Solve 1+1\nSolver: 2")
+        self.assertEqual(list(transcript), ["Initial Prompt: Solve 1+1", "Solver: 2"])
+
+    def test_window_stays_within_budget(self):
+        transcript = Transcript(context_budget=200, summary_budget=50)
+        transcript.append("Initial Prompt: write a long essay", pinned=True)
+        for i in range(100):
+            transcript.append(f"Agent{i % 2}: " + "word " * 40)
+            window = transcript.window()
+            self.assertLessEqual(estimate_tokens(window), 200 + 10)
+        self.assertTrue(window.startswith("Initial Prompt: write a long essay\nSummary of earlier conversation:"))
+        self.assertTrue(window.endswith("Agent1: " + "word " * 40))
+
+    def test_turns_are_summarized_once(self):
+        summarized = []
+
+        def summarizer(lines):
+            summarized.extend(lines)
+            return [f"({len(lines)} turns)"]
+
+        transcript = Transcript(context_budget=60, summary_budget=20, summarizer=summarizer)
+        for i in range(20):
+            transcript.append(f"Turn {i}: " + "x" * 80)
+            transcript.window()
+        self.assertEqual(len(summarized), len(set(summarized)))
+        self.assertIn("Turn 0: " + "x" * 80, summarized)
+
+
+if __name__ == '__main__':
+    unittest.main()
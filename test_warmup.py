@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+
+from fake_ollama import FakeBackend, FakeOllamaServer
+from llm_backend import BackendConfig, OllamaHTTPBackend
+from warmup import ModelWarmer
+
+
+class TestModelWarmer(unittest.IsolatedAsyncioTestCase):
+
+    async def wait_until(self, condition, timeout=2.0):
+        for _ in range(int(timeout / 0.01)):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        self.fail("condition not reached")
+
+    async def test_preload_warm_up_and_pings(self):
+        with FakeOllamaServer() as server:
+            backend = OllamaHTTPBackend(BackendConfig(base_url=server.base_url, keep_alive="10m"))
+            warmer = ModelWarmer([backend], ping_interval=0.05)
+            self.assertFalse(warmer.ready)
+            warmer.start()
+            await self.wait_until(lambda: warmer.ready)
+            await self.wait_until(lambda: len(server.requests) >= 4)
+            await warmer.stop()
+            await backend.aclose()
+
+        load, warm_up, *pings = server.requests
+        self.assertEqual(load, {"model": "llama3", "keep_alive": "10m"})
+        self.assertEqual(warm_up["options"], {"num_predict": 1})
+        self.assertTrue(pings and all("prompt" not in ping for ping in pings))
+        self.assertEqual(warmer.status(), {"ready": True, "models": {"llama3": "ready"}})
+
+    async def test_retries_until_the_backend_is_up_and_pings_track_it(self):
+        with FakeOllamaServer() as server:
+            server.status = 500
+            backend = OllamaHTTPBackend(BackendConfig(base_url=server.base_url))
+            warmer = ModelWarmer([backend], ping_interval=0.05, retry_interval=0.02)
+            warmer.start()
+            await self.wait_until(lambda: warmer.states["llama3"] == "failed")
+            self.assertIn("llama3", warmer.status()["errors"])
+            server.status = 200
+            await self.wait_until(lambda: warmer.ready)
+            server.status = 500
+            await self.wait_until(lambda: not warmer.ready)
+            await warmer.stop()
+            await backend.aclose()
+
+    async def test_unexpected_errors_are_reported_and_retried(self):
+        class MissingBinary(FakeBackend):
+            failures = 2
+
+            async def aload(self):
+                if self.failures:
+                    self.failures -= 1
+                    raise FileNotFoundError("llama-cli")
+
+        backend = MissingBinary()
+        warmer = ModelWarmer([backend], retry_interval=0.01)
+        warmer.start()
+        await self.wait_until(lambda: warmer.states["fake"] == "failed")
+        self.assertEqual(warmer.status()["errors"], {"fake": "FileNotFoundError: llama-cli"})
+        await self.wait_until(lambda: warmer.ready)
+        self.assertNotIn("errors", warmer.status())
+        await warmer.stop()
+
+    async def test_disabled(self):
+        warmer = ModelWarmer([OllamaHTTPBackend()], enabled=False)
+        warmer.start()
+        self.assertTrue(warmer.ready)
+        self.assertEqual(warmer.status()["models"], {"llama3": "skipped"})
+
+
+if __name__ == "__main__":
+    unittest.main()
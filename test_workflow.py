@@ -0,0 +1,103 @@
+import asyncio
+import time
+import unittest
+
+from agents import ProblemSolvingAgent, orchestrate_problem_solving
+from fake_ollama import FakeBackend
+from workflow import Halt, Node, Workflow
+
+
+def delayed(value, delay):
+    async def step(ctx, inputs):
+        await asyncio.sleep(delay)
+        ctx.emit(value)
+        return value
+    return step
+
+
+class TestWorkflow(unittest.IsolatedAsyncioTestCase):
+
+    async def test_ready_nodes_run_concurrently(self):
+        workflow = Workflow([
+            Node("a", delayed("a", 0.2)),
+            Node("b", delayed("b", 0.05)),
+            Node("c", delayed("c", 0.1), after=["b"]),
+            Node("d", delayed("d", 0.01), after=["a", "c"]),
+        ])
+        start = time.perf_counter()
+        events = [event async for event in workflow.run()]
+        self.assertLess(time.perf_counter() - start, 0.3)
+        self.assertEqual(events, ["b", "c", "a", "d"])
+
+    async def test_concurrency_limit(self):
+        workflow = Workflow([Node(str(i), delayed(str(i), 0.1)) for i in range(4)], max_concurrency=2)
+        start = time.perf_counter()
+        results = await workflow.execute()
+        self.assertGreater(time.perf_counter() - start, 0.19)
+        self.assertEqual(results, {str(i): str(i) for i in range(4)})
+
+    async def test_skipped_nodes_and_halt(self):
+        ran = []
+
+        def record(name, output=None):
+            async def step(ctx, inputs):
+                ran.append(name)
+                return output
+            return step
+
+        workflow = Workflow([
+            Node("solve", record("solve", "draft")),
+            Node("verify", record("verify"), after=["solve"], when=lambda inputs: inputs["solve"] == "done"),
+            Node("refine", record("refine", Halt("final")), after=["solve", "verify"]),
+            Node("never", record("never"), after=["refine"]),
+        ])
+        events = [event async for event in workflow.run(node_events=True)]
+        self.assertEqual(ran, ["solve", "refine"])
+        self.assertEqual([(event["node"], event["status"]) for event in events],
+                         [("solve", "done"), ("verify", "skipped"), ("refine", "halted")])
+
+    async def test_errors_propagate_and_cancel_running_nodes(self):
+        cancelled = []
+
+        async def slow(ctx, inputs):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def fail(ctx, inputs):
+            raise RuntimeError("boom")
+
+        workflow = Workflow([Node("slow", slow), Node("fail", fail)])
+        with self.assertRaises(RuntimeError):
+            await workflow.execute()
+        self.assertEqual(cancelled, [True])
+
+    def test_invalid_graphs(self):
+        async def step(ctx, inputs):
+            pass
+
+        with self.assertRaises(ValueError):
+            Workflow([Node("a", step), Node("a", step)])
+        with self.assertRaises(ValueError):
+            Workflow([Node("a", step, after=["missing"])]).order()
+        with self.assertRaises(ValueError):
+            Workflow([Node("a", step, after=["b"]), Node("b", step, after=["a"])]).order()
+
+
+class TestAgentWorkflow(unittest.IsolatedAsyncioTestCase):
+
+    async def test_node_completions_are_streamed(self):
+        backend = FakeBackend()
+        agents = [ProblemSolvingAgent("Solver", backend, cache=False), ProblemSolvingAgent("Reviewer", backend, cache=False)]
+        events = [event async for event in orchestrate_problem_solving(agents, "Write a poem", node_events=True)]
+        messages = [event for event in events if isinstance(event, str)]
+        nodes = [(event["node"], event["status"]) for event in events if isinstance(event, dict)]
+        self.assertEqual(messages, ['Solver: The answer is 2. Yes, the problem is solved.\n{"solved": true}',
+                                    "Solution verified, stopping conversation."])
+        self.assertEqual(nodes, [("1.solve", "done"), ("1.solve.verify", "halted")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import threading
+from collections import OrderedDict
+
+
+def estimate_tokens(text):
+    """Cheap token count estimate: roughly 4 characters per token for llama-style BPE on English and code."""
+    if not text:
+        return 0
+    return (len(text) + 3) // 4
+
+
+def load_encoding(name="cl100k_base"):
+    """The tiktoken encoding `name`, or None if tiktoken is not installed."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    return tiktoken.get_encoding(name)
+
+
+class TokenCounter:
+    """Counts tokens with `estimate_tokens`, or exactly with a tiktoken encoding when `exact` is set.
+
+    tiktoken has no llama3 encoding; cl100k_base is a close stand-in. Without
+    tiktoken installed the counter falls back to the estimate. Counts of whole
+    files are cached by content hash, so unchanged or duplicated content is
+    only tokenized once.
+    """
+
+    def __init__(self, exact=False, encoding="cl100k_base", cache_size=100_000):
+        self._encoding = load_encoding(encoding) if exact else None
+        self.name = f"tiktoken:{encoding}" if self._encoding is not None else "estimate"
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # content hash -> tokens
+        self._lock = threading.Lock()
+
+    def count(self, text):
+        if self._encoding is None:
+            return estimate_tokens(text)
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def count_content(self, digest, content):
+        """Tokens in `content` (UTF-8 bytes) whose hash is `digest`, from the cache when possible."""
+        with self._lock:
+            tokens = self._cache.get(digest)
+            if tokens is not None:
+                self._cache.move_to_end(digest)
+                return tokens
+        tokens = self.count(content.decode("utf-8", errors="ignore"))
+        self.remember(digest, tokens)
+        return tokens
+
+    def remember(self, digest, tokens):
+        with self._lock:
+            self._cache[digest] = tokens
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
@@ -0,0 +1,102 @@
+from collections import deque
+
+from tokens import estimate_tokens
+
+
+class TranscriptEntry:
+    __slots__ = ("text", "tokens")
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = estimate_tokens(text) + 1  # +1 for the joining newline
+
+
+def extractive_summary(lines, max_chars=160):
+    """Default summarizer: keep the first line of each folded turn, truncated."""
+    summary = []
+    for line in lines:
+        first = line.strip().split("\n", 1)[0]
+        if len(first) > max_chars:
+            first = first[:max_chars].rstrip() + "..."
+        summary.append(first)
+    return summary
+
+
+class Transcript:
+    """Conversation history that builds prompts within a fixed token budget.
+
+    Entries are appended incrementally with their token count cached. `window()`
+    returns the pinned entries (the initial prompt), a rolling summary of older
+    turns and as many recent turns as fit in `context_budget`. Turns that fall
+    out of the window are folded into the summary once and never re-processed,
+    so building a prompt costs the same on the tenth iteration as on the first.
+    """
+
+    def __init__(self, context_budget=1536, summary_budget=256, summarizer=extractive_summary):
+        # The default budget leaves room for the instruction and the reply in
+        # Ollama's default 2048-token context window.
+        self.context_budget = context_budget
+        self.summary_budget = summary_budget
+        self.summarizer = summarizer
+        self.pinned = []
+        self.entries = []
+        self.total_tokens = 0
+        self._pinned_tokens = 0
+        self._summary = deque()  # (line, tokens), oldest first
+        self._summary_tokens = 0
+        self._folded = 0  # entries[:_folded] have been folded into the summary
+        self._window = None
+
+    def append(self, text, pinned=False):
+        entry = TranscriptEntry(text)
+        if pinned:
+            self.pinned.append(entry)
+            self._pinned_tokens += entry.tokens
+        else:
+            self.entries.append(entry)
+        self.total_tokens += entry.tokens
+        self._window = None
+
+    def __len__(self):
+        return len(self.pinned) + len(self.entries)
+
+    def __iter__(self):
+        for entry in self.pinned + self.entries:
+            yield entry.text
+
+    def _fold(self, start):
+        lines = [entry.text for entry in self.entries[self._folded:start]]
+        for line in self.summarizer(lines):
+            tokens = estimate_tokens(line) + 1
+            self._summary.append((line, tokens))
+            self._summary_tokens += tokens
+        self._folded = start
+        # Keep the summary itself within budget by dropping its oldest lines
+        while self._summary_tokens > self.summary_budget and len(self._summary) > 1:
+            _, tokens = self._summary.popleft()
+            self._summary_tokens -= tokens
+
+    def window(self):
+        """Return the prompt text for the current state of the conversation."""
+        if self._window is not None:
+            return self._window
+
+        budget = self.context_budget - self._pinned_tokens - self.summary_budget
+        start = len(self.entries)
+        used = 0
+        while start > self._folded:
+            tokens = self.entries[start - 1].tokens
+            if used + tokens > budget and start < len(self.entries):
+                break
+            used += tokens
+            start -= 1
+        if start > self._folded:
+            self._fold(start)
+
+        parts = [entry.text for entry in self.pinned]
+        if self._summary:
+            parts.append("Summary of earlier conversation:")
+            parts.extend(line for line, _ in self._summary)
+        parts.extend(entry.text for entry in self.entries[start:])
+        self._window = "\n".join(parts)
+        return self._window
@@ -1,33 +1,9 @@
 import asyncio
-import subprocess
-import sys
-from langchain import LLMChain, PromptTemplate
 
-
-# ------------------------------------------------------------------
-# Custom Local LLM (Ollama)
-# ------------------------------------------------------------------
-class LocalModelLLM:
-    """Local model integration."""
-
-    def _call(self, prompt: str) -> str:
-        if sys.platform == "win32":
-            result = subprocess.run(
-                ["ollama", "run", "llama3"],
-                input=prompt.encode('utf-8'),
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            return result.stdout.decode('utf-8')
-        else:
-            process = asyncio.run(asyncio.create_subprocess_exec(
-                "ollama", "run", "llama3",
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            ))
-            stdout, _ = asyncio.run(process.communicate(input=prompt.encode('utf-8')))
-            return stdout.decode('utf-8')
+from fast_solver import solve_prompt
+from langchain_llm import LocalModelLLM
+from routing import CONCURRENCY_LIMITS, AgentRegistry, Router, Strategy
+from workflow import Node, Workflow
 
 
 # ------------------------------------------------------------------
@@ -35,6 +11,7 @@ class LocalModelLLM:
 # ------------------------------------------------------------------
 class CriticAgent:
     """Critic Agent to review and provide feedback."""
+    capabilities = ("review",)
 
     def __init__(self):
         self.name = "CriticAgent"
@@ -46,6 +23,7 @@ class CriticAgent:
 
 class ActorAgent:
     """Actor Agent to propose solutions."""
+    capabilities = ("act",)
 
     def __init__(self):
         self.name = "ActorAgent"
@@ -57,13 +35,20 @@ class ActorAgent:
 
 class MathAgent:
     """Agent specialized in math problems."""
+    name = "MathAgent"
+    capabilities = ("math",)
 
     def solve(self, problem: str) -> str:
-        return f"Math solution for {problem} is {eval(problem)}."
+        answer = solve_prompt(problem)
+        if answer is None:
+            return f"Math solution for {problem}: it could not be computed."
+        return f"Math solution for {problem} is {answer}."
 
 
 class LogicAgent:
     """Agent that handles logic problems."""
+    name = "LogicAgent"
+    capabilities = ("logic",)
 
     def solve(self, problem: str) -> str:
         return f"Logic solution: {problem}"
@@ -71,72 +56,86 @@ class LogicAgent:
 
 class GeneralKnowledgeAgent:
     """Agent that handles general knowledge queries using local LLM."""
+    name = "GeneralKnowledgeAgent"
+    capabilities = ("general",)
 
     def __init__(self, llm):
         self.llm = llm
 
     def solve(self, problem: str) -> str:
-        return self.llm._call(problem)
+        return self.llm.invoke(problem)
 
 
 # ------------------------------------------------------------------
 # Orchestrator Agent: Decides which flow to use
 # ------------------------------------------------------------------
 class OrchestratorAgent:
-    def __init__(self, agents):
+    def __init__(self, agents, router=None):
         self.agents = agents
-
-    def decide_method(self, problem: str) -> str:
-        """Decide on the best method based on the problem's context."""
-        if "math" in problem.lower():
-            return "Sequential"
-        elif "logic" in problem.lower():
-            return "Collaborative"
-        elif "complex" in problem.lower():
-            return "CriticActor"
+        self.registry = AgentRegistry()
+        for agent in agents:
+            self.registry.register(agent, agent.capabilities)
+        self.router = router or Router(
+            [Strategy.SEQUENTIAL, Strategy.COLLABORATIVE, Strategy.CRITIC_ACTOR, Strategy.GENERAL]
+        )
+
+    def decide_method(self, problem: str) -> Strategy:
+        """Decide on the best method with the local classifier (cached per problem)."""
+        return self.router.route(problem).strategy
+
+    def flow(self, method: Strategy, problem: str) -> Workflow:
+        """The built-in graph for `method`; its "result" node holds the answer.
+
+        The agents are synchronous, so every step runs its agent in a thread.
+        """
+        def call(agent_method, source=None):
+            async def step(ctx, inputs):
+                return await asyncio.to_thread(agent_method, inputs[source] if source else problem)
+            return step
+
+        def result(template):
+            async def step(ctx, inputs):
+                return template.format(**inputs)
+            return step
+
+        workflow = Workflow(max_concurrency=CONCURRENCY_LIMITS[method])
+        if method == Strategy.SEQUENTIAL:
+            # Sequentially pass the problem through agents
+            workflow.add(Node("math", call(self.registry.first("math").solve)))
+            workflow.add(Node("logic", call(self.registry.first("logic").solve, "math"), after=["math"]))
+            workflow.add(Node("result", result("Sequential Result: {logic}"), after=["logic"]))
+        elif method == Strategy.COLLABORATIVE:
+            # Both agents work on the problem at the same time
+            workflow.add(Node("math", call(self.registry.first("math").solve)))
+            workflow.add(Node("logic", call(self.registry.first("logic").solve)))
+            workflow.add(Node("result", result("Collaborative Result: Math says: {math} | Logic says: {logic}"),
+                              after=["math", "logic"]))
+        elif method == Strategy.CRITIC_ACTOR:
+            # Critic and Actor working together
+            workflow.add(Node("actor", call(self.registry.first("act").solve)))
+            workflow.add(Node("critic", call(self.registry.first("review").review, "actor"), after=["actor"]))
+            workflow.add(Node("result", result("Critic-Actor Result: Actor: {actor} | Critic: {critic}"),
+                              after=["actor", "critic"]))
         else:
-            return "General"
+            workflow.add(Node("result", call(self.registry.first("general").solve)))
+        return workflow
 
-    def solve(self, problem: str) -> str:
+    async def solve(self, problem: str) -> str:
         """Orchestrates the solution process by selecting the best method."""
-        method = self.decide_method(problem)
-        if method == "Sequential":
-            return self.sequential_chain(problem)
-        elif method == "Collaborative":
-            return self.collaborative_flow(problem)
-        elif method == "CriticActor":
-            return self.critic_actor_flow(problem)
-        else:
-            general_agent = next(agent for agent in self.agents if agent.name == "GeneralKnowledgeAgent")
-            return general_agent.solve(problem)
-
-    def sequential_chain(self, problem: str) -> str:
-        """Sequentially pass the problem through agents."""
-        math_agent = next(agent for agent in self.agents if agent.name == "MathAgent")
-        logic_agent = next(agent for agent in self.agents if agent.name == "LogicAgent")
-
-        math_solution = math_agent.solve(problem)
-        logic_solution = logic_agent.solve(math_solution)
-        return f"Sequential Result: {logic_solution}"
-
-    def collaborative_flow(self, problem: str) -> str:
-        """Collaborative solving between agents."""
-        math_agent = next(agent for agent in self.agents if agent.name == "MathAgent")
-        logic_agent = next(agent for agent in self.agents if agent.name == "LogicAgent")
+        return await self.run_flow(self.decide_method(problem), problem)
 
-        math_solution = math_agent.solve(problem)
-        logic_solution = logic_agent.solve(problem)
+    async def run_flow(self, method: Strategy, problem: str) -> str:
+        results = await self.flow(method, problem).execute()
+        return results["result"]
 
-        return f"Collaborative Result: Math says: {math_solution} | Logic says: {logic_solution}"
+    async def sequential_chain(self, problem: str) -> str:
+        return await self.run_flow(Strategy.SEQUENTIAL, problem)
 
-    def critic_actor_flow(self, problem: str) -> str:
-        """Critic and Actor working together."""
-        actor_agent = next(agent for agent in self.agents if agent.name == "ActorAgent")
-        critic_agent = next(agent for agent in self.agents if agent.name == "CriticAgent")
+    async def collaborative_flow(self, problem: str) -> str:
+        return await self.run_flow(Strategy.COLLABORATIVE, problem)
 
-        actor_solution = actor_agent.solve(problem)
-        critic_feedback = critic_agent.review(actor_solution)
-        return f"Critic-Actor Result: Actor: {actor_solution} | Critic: {critic_feedback}"
+    async def critic_actor_flow(self, problem: str) -> str:
+        return await self.run_flow(Strategy.CRITIC_ACTOR, problem)
 
 
 # ------------------------------------------------------------------
@@ -162,7 +161,7 @@ async def main():
     problem = "Solve 5 + 3"
 
     # The orchestrator dynamically selects the best method based on the problem
-    result = orchestrator.solve(problem)
+    result = await orchestrator.solve(problem)
     print(result)
 
 
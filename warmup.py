@@ -0,0 +1,138 @@
+"""Model preloading, warm-up and keep-alive for the API server.
+
+At startup `ModelWarmer` loads every configured model and runs a one-token
+warm-up generation, retrying until the backend answers, so the first /solve
+does not pay for loading the model. It then pings the models well within the
+server's keep_alive so they stay resident through idle periods. `status()`
+backs the /readyz endpoint: an instance is ready once all its models are warm.
+"""
+import asyncio
+import os
+import time
+from dataclasses import replace
+
+import telemetry
+from llm_backend import BackendConfig, LLMBackendError, get_backend, parse_duration
+
+MODEL_READY = telemetry.REGISTRY.gauge("model_ready", "1 when the model is loaded and warmed up, else 0.", ["model"])
+WARMUP_SECONDS = telemetry.REGISTRY.gauge("model_warmup_seconds", "Duration of the last preload and warm-up generation.", ["model"])
+
+
+def _describe(error):
+    # Backend errors carry their own description; name anything else, e.g. a missing ollama binary
+    return str(error) if isinstance(error, LLMBackendError) else f"{type(error).__name__}: {error}"
+
+
+class ModelWarmer:
+    """Warms up `backends` (one per model) and keeps their models loaded.
+
+    `ping_interval` is in seconds; None disables the keep-alive pings. A failed
+    warm-up is retried after `retry_interval` seconds, doubling on each failure
+    up to `max_retry_interval`.
+    """
+
+    def __init__(self, backends, ping_interval=None, warmup_prompt="Hello", retry_interval=5.0,
+                 max_retry_interval=60.0, enabled=True):
+        self.backends = list(backends)
+        self.ping_interval = ping_interval
+        self.warmup_prompt = warmup_prompt
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.enabled = enabled
+        self.states = {backend.config.model: "starting" for backend in self.backends}
+        self.errors = {}
+        self._task = None
+
+    @classmethod
+    def from_env(cls):
+        """Warm OLLAMA_MODEL plus any models in OLLAMA_PRELOAD_MODELS (comma separated).
+
+        Pings go out every OLLAMA_PING_INTERVAL seconds, by default half the
+        keep_alive. WARMUP=0 skips the warm-up and reports ready at once.
+        """
+        env = os.environ
+        config = BackendConfig.from_env()
+        models = [config.model]
+        for model in env.get("OLLAMA_PRELOAD_MODELS", "").split(","):
+            if model.strip() and model.strip() not in models:
+                models.append(model.strip())
+        interval = env.get("OLLAMA_PING_INTERVAL")
+        if interval:
+            interval = float(interval)
+        else:
+            keep_alive = parse_duration(config.keep_alive)
+            interval = keep_alive / 2 if keep_alive else None  # Forever (None) or 0 need no pings
+        return cls(
+            [get_backend(replace(config, model=model)) for model in models],
+            ping_interval=interval,
+            enabled=env.get("WARMUP", "1") != "0",
+        )
+
+    def _set(self, model, state, error=None):
+        self.states[model] = state
+        if error is None:
+            self.errors.pop(model, None)
+        else:
+            self.errors[model] = error
+        MODEL_READY.set(1 if state in ("ready", "skipped") else 0, model=model)
+
+    @property
+    def ready(self):
+        return all(state in ("ready", "skipped") for state in self.states.values())
+
+    def status(self):
+        status = {"ready": self.ready, "models": dict(self.states)}
+        if self.errors:
+            status["errors"] = dict(self.errors)
+        return status
+
+    async def warm(self, backend):
+        model = backend.config.model
+        self._set(model, "loading")
+        start = time.perf_counter()
+        await backend.aload()
+        await backend.agenerate(self.warmup_prompt, {"num_predict": 1})
+        WARMUP_SECONDS.set(time.perf_counter() - start, model=model)
+        print(f"Model {model} is warm ({time.perf_counter() - start:.2f}s)")
+        self._set(model, "ready")
+
+    async def _warm_until_ready(self, backend):
+        delay = self.retry_interval
+        while True:
+            try:
+                await self.warm(backend)
+                return
+            except Exception as e:  # Anything but cancellation: a broken backend must not stop the retries
+                print(f"Warm-up of {backend.config.model} failed, retrying in {delay:g}s: {_describe(e)}")
+                self._set(backend.config.model, "failed", _describe(e))
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_interval)
+
+    async def ping(self, backend):
+        # A failed ping takes the instance out of rotation until a later one succeeds
+        try:
+            await backend.aload()
+        except Exception as e:
+            print(f"Keep-alive ping for {backend.config.model} failed: {_describe(e)}")
+            self._set(backend.config.model, "failed", _describe(e))
+        else:
+            self._set(backend.config.model, "ready")
+
+    async def run(self):
+        await asyncio.gather(*(self._warm_until_ready(backend) for backend in self.backends))
+        while self.ping_interval:
+            await asyncio.sleep(self.ping_interval)
+            await asyncio.gather(*(self.ping(backend) for backend in self.backends))
+
+    def start(self):
+        if not self.enabled:
+            for model in self.states:
+                self._set(model, "skipped")
+            return
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,150 @@
+"""A small DAG workflow engine for agent teams.
+
+A Workflow is a graph of Nodes. Each node is an async step that receives the
+outputs of the nodes it runs `after` and returns its own output. Nodes whose
+dependencies are all done run concurrently (up to `max_concurrency`). A node
+whose `when` predicate is false is skipped: its output is None and its
+dependents still run. Returning `Halt(value)` ends the run, for example once
+a solution is verified.
+
+Steps stream messages through `ctx.emit`, in the order they are emitted.
+With `node_events` a {"type": "node", ...} event also follows each node as it
+completes.
+"""
+import asyncio
+from collections import deque
+
+
+class Halt:
+    """Returned by a step to end the run after it."""
+
+    def __init__(self, value=None):
+        self.value = value
+
+
+class Node:
+    """A step of a workflow."""
+
+    def __init__(self, name, run, after=(), when=None):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+        self.when = when
+
+
+class RunContext:
+    def __init__(self, queue, results):
+        self._queue = queue
+        self.results = results  # Outputs of the nodes completed so far
+
+    def emit(self, event):
+        # Queued ahead of the step's completion, so a step's events always come before it is done
+        self._queue.put_nowait(("event", event, None, None))
+
+
+class Workflow:
+    def __init__(self, nodes=(), max_concurrency=None):
+        self.nodes = {}
+        self.max_concurrency = max_concurrency
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        if node.name in self.nodes:
+            raise ValueError(f"Duplicate node {node.name!r}")
+        self.nodes[node.name] = node
+        return node
+
+    def step(self, name, after=(), when=None):
+        """Decorator form of add()."""
+        def register(run):
+            self.add(Node(name, run, after, when))
+            return run
+        return register
+
+    def order(self):
+        """The nodes in a topological order (stable in insertion order); raises ValueError on cycles."""
+        waiting = {}
+        dependents = {name: [] for name in self.nodes}
+        for node in self.nodes.values():
+            for dependency in node.after:
+                if dependency not in self.nodes:
+                    raise ValueError(f"Node {node.name!r} depends on unknown node {dependency!r}")
+                dependents[dependency].append(node.name)
+            waiting[node.name] = len(node.after)
+        ready = deque(name for name, count in waiting.items() if count == 0)
+        order = []
+        while ready:
+            name = ready.popleft()
+            order.append(self.nodes[name])
+            for dependent in dependents[name]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+        if len(order) != len(self.nodes):
+            raise ValueError("Workflow has a cycle")
+        return order
+
+    async def _execute(self, node, ctx, queue):
+        try:
+            inputs = {name: ctx.results[name] for name in node.after}
+            if node.when is not None and not node.when(inputs):
+                queue.put_nowait(("done", node, None, "skipped"))
+                return
+            output = await node.run(ctx, inputs)
+            queue.put_nowait(("done", node, output, "done"))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            queue.put_nowait(("error", node, e, None))
+
+    async def run(self, node_events=False, results=None):
+        """Run the graph, yielding the events emitted by the steps as they happen.
+
+        Node outputs are collected in `results` (a dict) when one is given.
+        """
+        order = self.order()
+        waiting = {node.name: len(node.after) for node in order}
+        dependents = {node.name: [] for node in order}
+        for node in order:
+            for dependency in node.after:
+                dependents[dependency].append(node)
+        queue = asyncio.Queue()
+        ctx = RunContext(queue, {} if results is None else results)
+        ready = deque(node for node in order if not node.after)
+        running = {}  # Node name -> task
+        try:
+            while ready or running:
+                while ready and (self.max_concurrency is None or len(running) < self.max_concurrency):
+                    node = ready.popleft()
+                    running[node.name] = asyncio.create_task(self._execute(node, ctx, queue))
+                kind, subject, value, status = await queue.get()
+                if kind == "event":
+                    yield subject
+                    continue
+                if kind == "error":
+                    raise value
+                node = subject
+                del running[node.name]
+                halted = isinstance(value, Halt)
+                ctx.results[node.name] = value.value if halted else value
+                if node_events:
+                    yield {"type": "node", "node": node.name, "status": "halted" if halted else status}
+                if halted:
+                    break
+                for dependent in dependents[node.name]:
+                    waiting[dependent.name] -= 1
+                    if waiting[dependent.name] == 0:
+                        ready.append(dependent)
+        finally:
+            for task in running.values():
+                task.cancel()
+            if running:
+                await asyncio.gather(*running.values(), return_exceptions=True)
+
+    async def execute(self):
+        """Run the graph to the end and return the outputs of its nodes."""
+        results = {}
+        async for _ in self.run(results=results):
+            pass
+        return results